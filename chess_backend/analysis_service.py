@@ -1,23 +1,31 @@
-import time
+import dataclasses
+import hashlib
+import itertools
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Callable, Iterator, List, Optional, Tuple
 
 # Use local imports since we're running from within the chess_backend directory
 import lichess_api
-import pgn_utils
-from chess_utils import get_player_color
+import parallel_analysis
+import streaming
+import study_cache
+import trie_cache
+import watermarks
 from deviation_result import DeviationResult
-from lichess_api import get_game_data_by_id, get_last_game_ids  # Use the new functions
+from lichess_api import stream_user_games
 from logging_config import setup_logging
-from repertoire_trie import RepertoireTrie
-from supabase_client import insert_deviation_to_db
+from repertoire_trie import CompactRepertoireTrie
+from singleflight import SingleFlight
+from supabase_client import DeviationWriter
 
 # Configure logging
 logger = setup_logging(__name__)
 
-# Feature flags (mirrored from frontend featureFlags.ts)
-ENABLE_LICHESS_STUDY_THROTTLE = True
-LICHESS_THROTTLE_DELAY_SECONDS = 1
+# Games downloaded ahead of the one being analyzed; bounds memory on large exports.
+GAME_PREFETCH_SIZE = 16
+
+# Study fetches and trie builds in progress, keyed by study ID
+_study_loads: SingleFlight[str, CompactRepertoireTrie] = SingleFlight()
 
 """
 Chess Game Analysis Service
@@ -27,15 +35,83 @@ It coordinates fetching games from Lichess, comparing them against studies,
 and finding deviations.
 
 🏗️ Analysis Process:
-1. Fetch recent game IDs from Lichess API
-2. For each game ID, fetch its full data (PGN, opening name, etc.)
-3. Fetch opening studies (white/black) and build Tries
-4. Compare each game against the appropriate Trie
-5. Find deviations and store results
-6. Return analysis results to API
+1. Open one bulk export stream of recent games (PGN, opening name, etc.)
+2. Fetch opening studies (white/black) and build Tries
+3. Compare each game against the appropriate Trie as its line arrives
+4. Find deviations and store results
+5. Return analysis results to API
 """
 
 
+@dataclasses.dataclass
+class AnalysisProgress:
+    """Running totals reported to ``on_progress`` after each game."""
+
+    games_fetched: int = 0
+    games_analyzed: int = 0
+    deviations_found: int = 0
+
+
+def build_repertoire_trie(study_url: str) -> CompactRepertoireTrie:
+    """
+    Returns the trie for a study. Studies fetched recently are served from the
+    in-process study cache without touching the network. Once an entry
+    expires it is revalidated with a conditional request: an unchanged study
+    keeps its trie, an updated one is loaded from (or compiled into) the
+    on-disk cache, and a failed refresh falls back to the stale trie.
+
+    Concurrent analyses that miss the cache for the same study share one
+    fetch and build instead of each doing their own.
+    """
+    study_id = lichess_api.extract_study_id_from_url(study_url)
+    cached = study_cache.studies.get(study_id)
+    if cached is not None:
+        logger.info(f"[StudyCache] Hit for study {study_id} ({study_cache.studies.stats.as_dict()})")
+        return cached.trie
+    return _study_loads.do(study_id, lambda: _load_repertoire_trie(study_id, study_url))
+
+
+def _load_repertoire_trie(study_id: str, study_url: str) -> CompactRepertoireTrie:
+    cached = study_cache.studies.get(study_id)
+    if cached is not None:  # Loaded by a call that finished just before this one started
+        return cached.trie
+
+    stale = study_cache.studies.peek(study_id)
+    logger.info(f"Fetching study from {study_url}...")
+    refresh = lichess_api.refresh_study_pgn(study_id, stale.validators if stale else None)
+    logger.info(f"[StudyCache] Refresh of study {study_id}: {refresh.status.value}")
+
+    if refresh.status is lichess_api.RefreshStatus.UNCHANGED and stale is not None:
+        stale.validators = refresh.validators
+        study_cache.studies.set(study_id, stale)
+        return stale.trie
+    if refresh.status is lichess_api.RefreshStatus.FAILED or refresh.pgn is None:
+        if stale is not None:
+            logger.warning(f"[StudyCache] Using stale trie for study {study_id}: {refresh.error}")
+            return stale.trie
+        raise Exception(f"Failed to fetch study {study_id}. {refresh.error}")
+
+    trie = trie_cache.load_or_build(study_id, refresh.pgn)
+    study_cache.studies.set(
+        study_id, study_cache.CachedStudy(study_id=study_id, validators=refresh.validators, trie=trie)
+    )
+    return trie
+
+
+def study_version(*study_urls: str) -> Optional[str]:
+    """
+    A hash of the content of the given studies as last loaded into the study
+    cache, or None if any of them has no known content hash.
+    """
+    hashes = []
+    for study_url in study_urls:
+        cached = study_cache.studies.peek(lichess_api.extract_study_id_from_url(study_url))
+        if cached is None or cached.validators.content_hash is None:
+            return None
+        hashes.append(cached.validators.content_hash)
+    return hashlib.sha256("\n".join(hashes).encode("utf-8")).hexdigest()[:16]
+
+
 def perform_game_analysis(
     username: str,
     user_id: str,
@@ -43,105 +119,156 @@ def perform_game_analysis(
     study_url_black: str,
     max_games: int = 10,
     since: Optional[datetime] = None,
+    on_progress: Optional[Callable[[AnalysisProgress], None]] = None,
 ) -> List[Tuple[Optional[DeviationResult], str]]:
     """
     Handles the core logic of fetching games, studies, and finding deviations
-    using the new, more reliable game export strategy.
+    using the new, more reliable game export strategy. ``on_progress``, if
+    given, is called with the running totals after every game.
+
+    Syncs are incremental: unless ``since`` is given, only games played since
+    the user's watermark are fetched, and games the watermark shows were
+    already analyzed against the same study versions are skipped.
+
+    Failures to export the games or to load a study are raised, so callers
+    can report the sync as failed rather than as one that found no games.
+    Errors in individual games are logged and do not fail the sync.
     """
     try:
         logger.info(f"Starting analysis for user: {username} (UUID: {user_id}) with Game Export strategy.")
 
-        # --- Part 1: Fetch Game IDs ---
-        game_ids = get_last_game_ids(username, max_games, since)
-        if not game_ids:
-            logger.warning(f"No game IDs found for user {username} in the given timeframe.")
+        # --- Part 1: Open the game export stream ---
+        # Without an explicit since, only games played after the last analyzed one are fetched.
+        watermark = watermarks.load(user_id)
+        fetch_since = since
+        if fetch_since is None and watermark is not None and watermark.last_game_at is not None:
+            fetch_since = watermark.last_game_at
+            logger.info(f"[Watermark] Fetching games for {username} since {fetch_since.isoformat()}")
+
+        # Wait for the first game before building tries, so users with no new games cost one request.
+        # Later games keep downloading (up to GAME_PREFETCH_SIZE ahead) while earlier ones are analyzed.
+        games = streaming.bounded_prefetch(stream_user_games(username, max_games, fetch_since), GAME_PREFETCH_SIZE)
+        first_game = next(games, None)
+        if first_game is None:
+            logger.warning(f"No games found for user {username} in the given timeframe.")
             return []
-        logger.info(f"Found {len(game_ids)} game IDs to analyze.")
 
         # --- Part 2: Build the Repertoire Tries ---
         logger.info("Building White and Black repertoire tries...")
         try:
-            # Build White Trie
-            if ENABLE_LICHESS_STUDY_THROTTLE:
-                logger.info(
-                    f"[THROTTLE] Sleeping {LICHESS_THROTTLE_DELAY_SECONDS}s before fetching white study due to feature flag."
-                )
-                time.sleep(LICHESS_THROTTLE_DELAY_SECONDS)
-            white_study = lichess_api.Study.fetch_url(str(study_url_white))
-            white_trie = RepertoireTrie()
-            for chapter in white_study.chapters:
-                white_trie.add_study_chapter(chapter)
-            logger.info(f"White trie built. Root has {len(white_trie.root.children)} starting moves.")
+            white_trie = build_repertoire_trie(str(study_url_white))
+            logger.info(f"White trie built. Root has {len(white_trie.root_moves())} starting moves.")
             # Debug: print root moves (UCI and SAN)
-            root_moves = [(uci, node.san) for uci, node in white_trie.root.children.items()]
-            logger.info(f"[DEBUG] White trie root moves (UCI, SAN): {root_moves}")
-
-            # Build Black Trie
-            if ENABLE_LICHESS_STUDY_THROTTLE:
-                logger.info(
-                    f"[THROTTLE] Sleeping {LICHESS_THROTTLE_DELAY_SECONDS}s before fetching black study due to feature flag."
-                )
-                time.sleep(LICHESS_THROTTLE_DELAY_SECONDS)
-            black_study = lichess_api.Study.fetch_url(str(study_url_black))
-            black_trie = RepertoireTrie()
-            for chapter in black_study.chapters:
-                black_trie.add_study_chapter(chapter)
-            logger.info(f"Black trie built. Root has {len(black_trie.root.children)} starting moves.")
+            logger.info(f"[DEBUG] White trie root moves (UCI, SAN): {white_trie.root_moves()}")
+
+            black_trie = build_repertoire_trie(str(study_url_black))
+            logger.info(f"Black trie built. Root has {len(black_trie.root_moves())} starting moves.")
         except Exception as e:
             logger.error(f"Error fetching studies or building tries: {e}")
-            return []
+            games.close()
+            raise
 
-        # --- Part 3: Analyze Each Game by ID ---
+        # The watermark only holds for the study versions it was set with. If the studies changed,
+        # forget it, and re-fetch the recent games if they were limited by it.
+        version = study_version(study_url_white, study_url_black)
+        if watermark is not None and (version is None or watermark.study_version != version):
+            logger.info(f"[Watermark] Studies changed for {username}; re-analyzing recent games")
+            watermark = None
+            if fetch_since != since:
+                games.close()
+                games = streaming.bounded_prefetch(stream_user_games(username, max_games, since), GAME_PREFETCH_SIZE)
+                first_game = next(games, None)
+                if first_game is None:
+                    return []
+
+        # --- Part 3: Analyze each game as it arrives ---
         results: List[Tuple[Optional[DeviationResult], str]] = []
-        for game_id in game_ids:
-            game_data = get_game_data_by_id(game_id)
-            if not game_data or "pgn" not in game_data:
-                logger.warning(f"Could not fetch PGN data for game ID {game_id}. Skipping.")
-                continue
+        progress = AnalysisProgress()
+        newest: Optional[watermarks.Watermark] = None
+        skipped = 0
+        writer = DeviationWriter(user_id)
 
-            pgn_string = game_data["pgn"]
-            opening_name = game_data.get("opening", {}).get("name")
+        def games_to_analyze() -> Iterator[Tuple[Optional[str], Optional[str], str]]:
+            """Yields (game ID, opening name, PGN) for each fetched game that still needs analyzing."""
+            nonlocal newest, skipped
+            for game_data in itertools.chain([first_game], games):
+                game_id = game_data.get("id")
+                played_at = watermarks.game_played_at(game_data)
+                progress.games_fetched += 1
+                if watermark is not None and watermark.covers(game_id, played_at, version):
+                    skipped += 1
+                    continue
+                if newest is None or (
+                    played_at is not None and (newest.last_game_at is None or played_at > newest.last_game_at)
+                ):
+                    newest = watermarks.Watermark(last_game_id=game_id, last_game_at=played_at, study_version=version)
+                if "pgn" not in game_data:
+                    logger.warning(f"Could not fetch PGN data for game ID {game_id}. Skipping.")
+                    if on_progress:
+                        on_progress(dataclasses.replace(progress))
+                    continue
+                yield game_id, game_data.get("opening", {}).get("name"), game_data["pgn"]
 
-            try:
-                game_obj = pgn_utils.pgn_string_to_game(pgn_string)
-                deviation_info = None
+        # Large syncs fan out to the process pool; for a few games a pool round trip costs more than it saves
+        pending, pgns = itertools.tee(games_to_analyze())
+        if parallel_analysis.enabled() and max_games >= 2 * parallel_analysis.ANALYSIS_CHUNK_SIZE:
+            analyses = parallel_analysis.analyze_games((pgn for _, _, pgn in pgns), username, white_trie, black_trie)
+        else:
+            analyses = (parallel_analysis.analyze_game(pgn, username, white_trie, black_trie) for _, _, pgn in pgns)
 
-                player_color = get_player_color(game_obj, username)
+        for (game_id, opening_name, pgn_string), analysis in zip(pending, analyses):
+            if analysis.skipped is not None:
+                logger.info(f"Skipping game {game_id} for {username}: {analysis.skipped}")
+                if on_progress:
+                    on_progress(dataclasses.replace(progress))
+                continue
+
+            player_color = analysis.player_color
+            deviation_info = analysis.deviation
+            if analysis.error is not None:
+                logger.error(f"Error analyzing game {game_id} for {username}: {analysis.error}")
 
-                if player_color == "White":
-                    deviation_info = white_trie.find_deviation(game_obj, username)
-                elif player_color == "Black":
-                    deviation_info = black_trie.find_deviation(game_obj, username)
+            if deviation_info:
+                # Additional validation: Skip "End of book" scenarios that shouldn't have been flagged as deviations
+                if deviation_info.reference_san == "End of book":
+                    logger.warning(
+                        f"Skipping invalid 'End of book' deviation for game {game_id}. "
+                        f"This should not occur with the fixed trie logic."
+                    )
+                    deviation_info = None  # Set to None instead of skipping the game
                 else:
-                    logger.warning(f"Could not determine color for {username} in game {game_id}. Skipping.")
-
-                if deviation_info:
-                    # Additional validation: Skip "End of book" scenarios that shouldn't have been flagged as deviations
-                    if deviation_info.reference_san == "End of book":
-                        logger.warning(
-                            f"Skipping invalid 'End of book' deviation for game {game_id}. "
-                            f"This should not occur with the fixed trie logic."
-                        )
-                        deviation_info = None  # Set to None instead of skipping the game
-                    else:
-                        deviation_dict = deviation_info.model_dump()
-                        deviation_dict["opening_name"] = opening_name
-
-                        # Determine which study URL to use based on player color
-                        study_url = None
-                        if player_color == "White":
-                            study_url = study_url_white
-                        elif player_color == "Black":
-                            study_url = study_url_black
-
-                        # Call the DB function with the dictionary, PGN string, user_id, and study URL
-                        insert_deviation_to_db(deviation_dict, pgn_string, user_id, study_url)
-
-                results.append((deviation_info, pgn_string))
-
-            except Exception as e:
-                logger.error(f"Error analyzing game {game_id} for {username}: {e}")
-                results.append((None, pgn_string))
+                    deviation_dict = deviation_info.model_dump()
+                    deviation_dict["opening_name"] = opening_name
+
+                    # Determine which study URL to use based on player color
+                    study_url = None
+                    if player_color == "White":
+                        study_url = study_url_white
+                    elif player_color == "Black":
+                        study_url = study_url_black
+
+                    # Queue the row; the writer saves deviations in batched upserts
+                    writer.add(deviation_dict, pgn_string, study_url)
+
+            results.append((deviation_info, pgn_string))
+            if deviation_info:
+                progress.deviations_found += 1
+
+            progress.games_analyzed += 1
+            if on_progress:
+                on_progress(dataclasses.replace(progress))
+
+        # add() flushes full chunks as it goes, so failures accumulate on the writer, not just this flush
+        writer.flush()
+        failures = writer.failures
+        for failure in failures:
+            logger.error(f"Failed to save deviation for game {failure.game_id} ({username}): {failure.error}")
+
+        # Only move the watermark past games whose deviations were all saved, so failed ones are retried
+        if newest is not None and not failures:
+            watermarks.save(user_id, newest)
+        if skipped:
+            logger.info(f"[Watermark] Skipped {skipped} games already analyzed for {username}")
 
         found_count = len([d for d, _ in results if d is not None])
         logger.info(f"Analysis complete for {username}. Found {found_count} deviations in {len(results)} games.")
@@ -149,4 +276,4 @@ def perform_game_analysis(
 
     except Exception as e:
         logger.error(f"Top-level game analysis failed: {e}", exc_info=True)
-        return []
+        raise
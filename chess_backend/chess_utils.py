@@ -4,26 +4,39 @@ This module provides utility functions for chess analysis.
 
 import io
 import os
-from typing import Optional
+from typing import Collection, Mapping, Optional
 
 import chess
 import chess.pgn
 
 from logging_config import setup_logging
+from pgn_utils import GameLike
 
 logger = setup_logging(__name__)
 
 
-def get_player_color(recent_game: chess.pgn.Game, player_name: str) -> str:
+def get_player_color(recent_game: GameLike, player_name: str) -> str:
     """
     Determines the color the player was playing as in a given game.
 
-    :param recent_game: chess.pgn.Game, the game to check
+    :param recent_game: chess.pgn.Game or pgn_utils.MainlineGame, the game to check
     :param player_name: str, the name or identifier of the player
     :return: 'White' if the player was White, 'Black' if the player was Black, or None if no match
     """
-    white_player = recent_game.headers["White"]
-    black_player = recent_game.headers["Black"]
+    return get_player_color_from_headers(recent_game.headers, player_name)
+
+
+def get_player_color_from_headers(headers: Mapping[str, str], player_name: str) -> str:
+    """
+    Determines the color the player was playing as from a game's headers alone,
+    e.g. as read by pgn_utils.read_headers.
+
+    :param headers: Mapping[str, str], the game's PGN headers
+    :param player_name: str, the name or identifier of the player
+    :return: 'White' if the player was White, 'Black' if the player was Black
+    """
+    white_player = headers["White"]
+    black_player = headers["Black"]
 
     logger.debug(f"[get_player_color] player_name: '{player_name}' | White: '{white_player}' | Black: '{black_player}'")
     if player_name.strip().lower() == white_player.strip().lower():
@@ -37,6 +50,55 @@ def get_player_color(recent_game: chess.pgn.Game, player_name: str) -> str:
     raise Exception(f"Could not find match {player_name} to the game!")
 
 
+def game_speed(time_control: str) -> str:
+    """
+    Classifies a PGN TimeControl tag ("300+3") into Lichess's speed categories,
+    which go by the estimated duration base + 40 * increment.
+
+    :param time_control: str, the TimeControl header; "-" for correspondence games
+    :return: str, one of ultraBullet, bullet, blitz, rapid, classical, correspondence or unknown
+    """
+    if time_control == "-":
+        return "correspondence"
+    base, _, increment = time_control.partition("+")
+    try:
+        estimated_seconds = int(base) + 40 * int(increment or "0")
+    except ValueError:
+        return "unknown"
+    if estimated_seconds < 30:
+        return "ultraBullet"
+    if estimated_seconds < 180:
+        return "bullet"
+    if estimated_seconds < 480:
+        return "blitz"
+    if estimated_seconds < 1500:
+        return "rapid"
+    return "classical"
+
+
+def analysis_skip_reason(headers: Mapping[str, str], speeds: Collection[str] = ()) -> Optional[str]:
+    """
+    Decides from a game's headers alone whether it can be checked against an
+    opening repertoire. Repertoires start from the standard position, so
+    variants and games set up from a FEN are skipped; if ``speeds`` is given,
+    so are games at any other speed (see game_speed).
+
+    :param headers: Mapping[str, str], the game's PGN headers
+    :param speeds: Collection[str], Lichess speeds to keep; empty keeps all
+    :return: Optional[str], why the game is skipped, or None to analyze it
+    """
+    variant = headers.get("Variant", "Standard")
+    if variant.lower() not in ("standard", "chess"):
+        return f"variant {variant}"
+    if headers.get("FEN", chess.STARTING_FEN) != chess.STARTING_FEN:
+        return "custom starting position"
+    if speeds:
+        speed = game_speed(headers.get("TimeControl", "?"))
+        if speed not in speeds:
+            return f"{speed} game"
+    return None
+
+
 def write_pgn(pgn_data: str, filename: str) -> None:
     """
     Writes the PGN data to a file.
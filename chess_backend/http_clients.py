@@ -0,0 +1,103 @@
+"""
+Application-lifetime HTTP clients.
+
+Every Lichess request used to open its own httpx client, paying a fresh TCP
+and TLS handshake per call. The clients here are created once and shared, so
+consecutive requests to the same host reuse kept-alive connections.
+
+The sync client is used by the analysis code (which runs in worker threads)
+and the async client by request handlers. Both are opened lazily on first use
+and closed by the FastAPI lifespan in main.py; scripts and tests that never
+start the app can call ``close_clients`` themselves.
+"""
+
+import logging
+import os
+import threading
+from typing import Optional
+
+import httpx
+
+LOG = logging.getLogger(__name__)
+
+# Pool sizing. Lichess is the only upstream, so these bound concurrent
+# connections to it across the whole process (per client).
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+
+# HTTP/2 multiplexes requests over one connection; it needs the optional h2
+# package (pip install "httpx[http2]") and falls back to HTTP/1.1 without it.
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+_lock = threading.Lock()
+_sync_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def http2_available() -> bool:
+    """Whether HTTP/2 is requested and the h2 package is installed."""
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        LOG.warning("HTTP2_ENABLED is set but the h2 package is not installed; using HTTP/1.1.")
+        return False
+    return True
+
+
+def sync_client() -> httpx.Client:
+    """Returns the shared sync client, creating it on first use. Safe to call from any thread."""
+    global _sync_client
+    with _lock:
+        if _sync_client is None or _sync_client.is_closed:
+            _sync_client = httpx.Client(limits=pool_limits(), timeout=HTTP_TIMEOUT_SECONDS, http2=http2_available())
+            LOG.info("Opened shared sync HTTP client")
+        return _sync_client
+
+
+def async_client() -> httpx.AsyncClient:
+    """
+    Returns the shared async client, creating it on first use. The client is
+    bound to the event loop it first runs on, which is the server's loop when
+    the app is started normally.
+    """
+    global _async_client
+    with _lock:
+        if _async_client is None or _async_client.is_closed:
+            _async_client = httpx.AsyncClient(
+                limits=pool_limits(), timeout=HTTP_TIMEOUT_SECONDS, http2=http2_available()
+            )
+            LOG.info("Opened shared async HTTP client")
+        return _async_client
+
+
+def close_clients() -> None:
+    """Closes the shared sync client. The next ``sync_client`` call opens a new one."""
+    global _sync_client
+    with _lock:
+        client, _sync_client = _sync_client, None
+    if client is not None:
+        client.close()
+        LOG.info("Closed shared sync HTTP client")
+
+
+async def aclose_clients() -> None:
+    """Closes both shared clients; called on application shutdown."""
+    global _async_client
+    with _lock:
+        client, _async_client = _async_client, None
+    if client is not None:
+        await client.aclose()
+        LOG.info("Closed shared async HTTP client")
+    close_clients()
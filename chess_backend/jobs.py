@@ -0,0 +1,203 @@
+"""
+Background analysis jobs.
+
+POST /api/analysis_jobs queues a perform_game_analysis run and returns a job
+ID straight away; the run happens on the bounded analysis pool (see
+workers.py), so the number of concurrent analyses stays capped however many
+jobs are submitted. Clients follow a job by polling
+GET /api/analysis_jobs/{id} or by subscribing to its Server-Sent Events
+stream at /api/analysis_jobs/{id}/events.
+
+Jobs live in process memory: they are lost on restart and dropped
+JOB_RETENTION_SECONDS after their last update.
+"""
+
+import asyncio
+import dataclasses
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from enum import Enum
+from typing import AsyncIterator, Callable, List, Optional
+
+from pydantic import BaseModel, Field
+
+import workers
+from analysis_service import AnalysisProgress, perform_game_analysis
+from deviation_result import DeviationResult
+from logging_config import setup_logging
+from ttl_cache import TTLCache
+
+logger = setup_logging(__name__)
+
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+JOB_MAX_ENTRIES = int(os.getenv("JOB_MAX_ENTRIES", "1000"))
+JOB_EVENTS_POLL_SECONDS = 0.5
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    @property
+    def finished(self) -> bool:
+        return self in (JobStatus.SUCCEEDED, JobStatus.FAILED)
+
+
+class JobProgress(BaseModel):
+    games_fetched: int = 0
+    games_analyzed: int = 0
+    deviations_found: int = 0
+
+
+class AnalysisJob(BaseModel):
+    """State of one queued analysis, as returned by the job endpoints."""
+
+    id: str
+    username: str
+    status: JobStatus = JobStatus.QUEUED
+    progress: JobProgress = Field(default_factory=JobProgress)
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    message: Optional[str] = None
+    deviations: List[DeviationResult] = Field(default_factory=list)
+    error: Optional[str] = None
+    # Bumped on every change so event streams only send updates
+    version: int = 0
+
+
+class JobStore:
+    """Thread-safe in-memory job table. Callers always get copies, never the stored object."""
+
+    def __init__(self, retention_seconds: float = JOB_RETENTION_SECONDS, max_entries: int = JOB_MAX_ENTRIES) -> None:
+        self._jobs: TTLCache[str, AnalysisJob] = TTLCache(ttl_seconds=retention_seconds, max_entries=max_entries)
+        self._update_lock = threading.Lock()
+
+    def create(self, username: str) -> AnalysisJob:
+        job = AnalysisJob(id=uuid.uuid4().hex, username=username, created_at=_now())
+        self._jobs.set(job.id, job)
+        return job.model_copy(deep=True)
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        job = self._jobs.get(job_id)
+        return job.model_copy(deep=True) if job is not None else None
+
+    def update(self, job_id: str, change: Callable[[AnalysisJob], None]) -> None:
+        with self._update_lock:
+            job = self._jobs.peek(job_id)
+            if job is None:
+                return
+            updated = job.model_copy(deep=True)
+            change(updated)
+            updated.version = job.version + 1
+            self._jobs.set(job_id, updated)  # also restarts the retention clock
+
+
+# Shared by the job endpoints in main.py.
+store = JobStore()
+
+
+def submit_analysis(
+    username: str,
+    user_id: str,
+    study_url_white: str,
+    study_url_black: str,
+    max_games: int,
+    since: Optional[datetime],
+    job_store: Optional[JobStore] = None,
+) -> AnalysisJob:
+    """Queues an analysis on the analysis pool and returns its job without waiting for it."""
+    job_store = job_store or store
+    job = job_store.create(username)
+    workers.analysis_executor().submit(
+        _run_job, job_store, job.id, username, user_id, study_url_white, study_url_black, max_games, since
+    )
+    logger.info(f"Queued analysis job {job.id} for {username}")
+    return job
+
+
+def _run_job(
+    job_store: JobStore,
+    job_id: str,
+    username: str,
+    user_id: str,
+    study_url_white: str,
+    study_url_black: str,
+    max_games: int,
+    since: Optional[datetime],
+) -> None:
+    def started(job: AnalysisJob) -> None:
+        job.status = JobStatus.RUNNING
+        job.started_at = _now()
+
+    def report(progress: AnalysisProgress) -> None:
+        def apply(job: AnalysisJob) -> None:
+            job.progress = JobProgress(**dataclasses.asdict(progress))
+
+        job_store.update(job_id, apply)
+
+    job_store.update(job_id, started)
+    try:
+        results = perform_game_analysis(
+            username=username,
+            user_id=user_id,
+            study_url_white=study_url_white,
+            study_url_black=study_url_black,
+            max_games=max_games,
+            since=since,
+            on_progress=report,
+        )
+    except Exception as e:
+        logger.error(f"Analysis job {job_id} failed: {e}", exc_info=True)
+        error = str(e)
+
+        def failed(job: AnalysisJob) -> None:
+            job.status = JobStatus.FAILED
+            job.finished_at = _now()
+            job.error = error
+
+        job_store.update(job_id, failed)
+        return
+
+    deviations = [d for d, _ in results if d is not None]
+
+    def succeeded(job: AnalysisJob) -> None:
+        job.status = JobStatus.SUCCEEDED
+        job.finished_at = _now()
+        job.deviations = deviations
+        job.message = f"Found {len(deviations)} deviations in {len(results)} games"
+
+    job_store.update(job_id, succeeded)
+    logger.info(f"Analysis job {job_id} finished: {len(deviations)} deviations in {len(results)} games")
+
+
+async def job_events(job_id: str, job_store: Optional[JobStore] = None) -> AsyncIterator[str]:
+    """
+    Yields Server-Sent Events for a job: a ``progress`` event whenever it
+    changes and a final ``done`` event once it has finished.
+    """
+    job_store = job_store or store
+    last_version = -1
+    while True:
+        job = job_store.get(job_id)
+        if job is None:
+            yield _sse("error", '{"detail": "Job not found"}')
+            return
+        if job.version != last_version:
+            last_version = job.version
+            yield _sse("done" if job.status.finished else "progress", job.model_dump_json())
+        if job.status.finished:
+            return
+        await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
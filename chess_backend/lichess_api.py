@@ -4,124 +4,234 @@ and get study data from a Lichess study.
 """
 
 import dataclasses
-import json
 import logging
+import os
 import re
-import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional
 
 import chess.pgn
 import httpx
 
+import http_clients
 import pgn_utils
+import rate_limit
+import streaming
 
 LOG = logging.getLogger(__name__)
 
-# Feature flags (mirrored from frontend featureFlags.ts)
-ENABLE_LICHESS_STUDY_THROTTLE = True
-LICHESS_THROTTLE_DELAY_SECONDS = 1
+# Overridable so tests and benchmarks can point at a local stand-in server.
+LICHESS_BASE_URL = os.getenv("LICHESS_BASE_URL", "https://lichess.org")
+
+
+class RefreshStatus(str, Enum):
+    """Outcome of a conditional study download."""
+
+    UNCHANGED = "unchanged"
+    UPDATED = "updated"
+    FAILED = "failed"
+
+
+@dataclasses.dataclass
+class StudyValidators:
+    """
+    HTTP validators remembered from the last successful study download. The
+    content hash is the fallback for when Lichess sends neither an ETag nor a
+    Last-Modified header: the body is still downloaded, but an identical body
+    is reported as unchanged so nothing downstream is re-parsed or rebuilt.
+    """
+
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+
+
+@dataclasses.dataclass
+class StudyRefresh:
+    status: RefreshStatus
+    validators: StudyValidators
+    pgn: Optional[str] = None  # Only set when the study was UPDATED
+    error: Optional[str] = None  # Only set when the refresh FAILED
 
 
 @dataclasses.dataclass
 class Study:
     chapters: list[chess.pgn.Game]
+    study_id: str = ""
+    validators: StudyValidators = dataclasses.field(default_factory=StudyValidators)
 
     @staticmethod
     def fetch_id(study_id: str) -> "Study":
-        if ENABLE_LICHESS_STUDY_THROTTLE:
-            LOG.info(
-                f"[THROTTLE] Sleeping {LICHESS_THROTTLE_DELAY_SECONDS}s before fetching study due to feature flag."
-            )
-            time.sleep(LICHESS_THROTTLE_DELAY_SECONDS)
-        url = f"https://lichess.org/api/study/{study_id}.pgn"
-        with httpx.Client() as client:
-            response = client.get(
-                url,
-                headers={
-                    "User-Agent": "OutOfBook/1.0 (https://github.com/aadjones/opening-check-js; aaron.demby.jones@gmail.com)",
-                    "Accept": "text/plain",
-                },
-            )
-            if response.status_code != 200:
-                raise Exception(f"Failed to fetch study. Status code: {response.status_code}")
-            return Study(chapters=pgn_utils.pgn_to_pgn_list(response.text))
+        result = refresh_study_pgn(study_id)
+        if result.status is not RefreshStatus.UPDATED or result.pgn is None:
+            raise Exception(f"Failed to fetch study. {result.error}")
+        return Study(chapters=pgn_utils.pgn_to_pgn_list(result.pgn), study_id=study_id, validators=result.validators)
 
     @staticmethod
     def fetch_url(url: str) -> "Study":
         LOG.info(f"Fetching study from {url}...")
-        study = Study.fetch_id(_extract_study_id_from_url(url))
+        study = Study.fetch_id(extract_study_id_from_url(url))
         LOG.info("done")
         return study
 
+    def refresh(self) -> RefreshStatus:
+        """Re-downloads the study only if it changed since it was fetched, updating it in place."""
+        result = refresh_study_pgn(self.study_id, self.validators)
+        if result.status is RefreshStatus.UPDATED and result.pgn is not None:
+            self.chapters = pgn_utils.pgn_to_pgn_list(result.pgn)
+            self.validators = result.validators
+        return result.status
+
+
+def refresh_study_pgn(study_id: str, validators: Optional[StudyValidators] = None) -> StudyRefresh:
+    """
+    Downloads the raw PGN of every chapter in a study, conditionally on the
+    validators from a previous download. An unchanged study costs a 304 round
+    trip (or, without server validators, a download whose hash matches).
+    Network and HTTP errors are reported as FAILED rather than raised.
+    """
+    previous = validators or StudyValidators()
+    headers = {
+        "User-Agent": "OutOfBook/1.0 (https://github.com/aadjones/opening-check-js; aaron.demby.jones@gmail.com)",
+        "Accept": "text/plain",
+    }
+    if previous.etag:
+        headers["If-None-Match"] = previous.etag
+    if previous.last_modified:
+        headers["If-Modified-Since"] = previous.last_modified
+
+    url = f"{LICHESS_BASE_URL}/api/study/{study_id}.pgn"
+    try:
+        rate_limit.lichess.acquire(f"study:{study_id}")
+        response = http_clients.sync_client().get(url, headers=headers)
+        rate_limit.lichess.observe(response)
+    except httpx.RequestError as e:
+        LOG.error(f"Failed to fetch study {study_id}: {e}")
+        return StudyRefresh(status=RefreshStatus.FAILED, validators=previous, error=str(e))
+
+    if response.status_code == 304:
+        LOG.info(f"Study {study_id} not modified since last fetch.")
+        return StudyRefresh(status=RefreshStatus.UNCHANGED, validators=previous)
+    if response.status_code != 200:
+        return StudyRefresh(
+            status=RefreshStatus.FAILED, validators=previous, error=f"Status code: {response.status_code}"
+        )
+
+    current = StudyValidators(
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        content_hash=pgn_utils.pgn_content_hash(response.text),
+    )
+    if previous.content_hash is not None and current.content_hash == previous.content_hash:
+        LOG.info(f"Study {study_id} downloaded but its content is unchanged.")
+        return StudyRefresh(status=RefreshStatus.UNCHANGED, validators=current)
+    return StudyRefresh(status=RefreshStatus.UPDATED, validators=current, pgn=response.text)
+
+
+def fetch_study_pgn(study_id: str) -> str:
+    """Downloads the raw PGN of every chapter in a study."""
+    result = refresh_study_pgn(study_id)
+    if result.status is not RefreshStatus.UPDATED or result.pgn is None:
+        raise Exception(f"Failed to fetch study. {result.error}")
+    return result.pgn
+
 
 def get_last_game_ids(username: str, max_games: int, since: Optional[datetime] = None) -> List[str]:
     """Fetches a list of the most recent game IDs for a user."""
     LOG.info("Fetching last %s game IDs for %s", max_games, username)
     try:
-        if ENABLE_LICHESS_STUDY_THROTTLE:
-            LOG.info(
-                f"[THROTTLE] Sleeping {LICHESS_THROTTLE_DELAY_SECONDS}s before fetching game IDs due to feature flag."
-            )
-            time.sleep(LICHESS_THROTTLE_DELAY_SECONDS)
         params: Dict[str, Any] = {"max": max_games}
         if since:
             params["since"] = int(since.timestamp() * 1000)
 
-        with httpx.Client() as client:
-            response = client.get(
-                f"https://lichess.org/api/games/user/{username}",
-                params=params,
-                headers={
-                    "Accept": "application/x-ndjson",
-                    "User-Agent": "OutOfBook/1.0 (https://github.com/aadjones/opening-check-js; aaron.demby.jones@gmail.com)",
-                },
-            )
-            response.raise_for_status()
-
-            # Parse the NDJSON response to extract just the game IDs
-            games = response.text.strip().split("\n")
-            game_ids = [json.loads(game).get("id") for game in games]
-            return [gid for gid in game_ids if gid]  # Filter out any potential nulls
+        # Stream the NDJSON response and keep just the game IDs, not every decoded record
+        game_ids = (
+            game.get("id") for game in _stream_ndjson(f"{LICHESS_BASE_URL}/api/games/user/{username}", params, username)
+        )
+        return [gid for gid in game_ids if gid]  # Filter out any potential nulls
 
     except httpx.RequestError as e:
         LOG.error(f"Failed to fetch game IDs for {username}: {e}")
         return []
 
 
+def stream_user_games(username: str, max_games: int, since: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Streams a user's most recent games from the bulk export endpoint in a
+    single request. Each yielded record already carries the PGN, tags and
+    opening name (the same shape as ``get_game_data_by_id``), and is yielded
+    as soon as its NDJSON line arrives, so callers can analyze one game while
+    the next is still downloading. Network and HTTP errors are logged and
+    raised.
+    """
+    LOG.info("Streaming last %s games for %s", max_games, username)
+    params: Dict[str, Any] = {
+        "max": max_games,
+        "pgnInJson": "true",
+        "tags": "true",
+        "opening": "true",
+    }
+    if since:
+        params["since"] = int(since.timestamp() * 1000)
+
+    try:
+        yield from _stream_ndjson(f"{LICHESS_BASE_URL}/api/games/user/{username}", params, username)
+    except httpx.RequestError as e:
+        LOG.error(f"Failed to export games for {username}: {e}")
+        raise
+
+
+def _stream_ndjson(url: str, params: Dict[str, Any], rate_key: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the records of an NDJSON endpoint one line at a time. The response
+    body is never held in memory as a whole, and since nothing is read until
+    the caller asks for the next record, a slow consumer slows the download.
+    """
+    rate_limit.lichess.acquire(rate_key)
+    with http_clients.sync_client().stream(
+        "GET",
+        url,
+        params=params,
+        headers={
+            "Accept": "application/x-ndjson",
+            "User-Agent": "OutOfBook/1.0 (https://github.com/aadjones/opening-check-js; aaron.demby.jones@gmail.com)",
+        },
+    ) as response:
+        rate_limit.lichess.observe(response)
+        response.raise_for_status()
+        yield from streaming.iter_ndjson(response.iter_lines())
+
+
 def get_game_data_by_id(game_id: str) -> Optional[Dict[str, Any]]:
     """
     Fetches the full PGN and metadata for a single game, ensuring the opening name is included.
     """
     LOG.info("Fetching game data for ID: %s", game_id)
     try:
-        if ENABLE_LICHESS_STUDY_THROTTLE:
-            LOG.info(
-                f"[THROTTLE] Sleeping {LICHESS_THROTTLE_DELAY_SECONDS}s before fetching game data due to feature flag."
-            )
-            time.sleep(LICHESS_THROTTLE_DELAY_SECONDS)
         params: Dict[str, Any] = {
             "pgnInJson": "true",  # Get PGN inside a JSON object
             "tags": "true",
             "opening": "true",  # <-- THE KEY PARAMETER
         }
-        with httpx.Client() as client:
-            response = client.get(
-                f"https://lichess.org/game/export/{game_id}",
-                params=params,
-                headers={
-                    "Accept": "application/json",
-                    "User-Agent": "OutOfBook/1.0 (https://github.com/aadjones/opening-check-js; aaron.demby.jones@gmail.com)",
-                },
-            )
-            response.raise_for_status()
-            return response.json()  # type: ignore[no-any-return] # Lichess API returns Dict[str, Any]
+        rate_limit.lichess.acquire("game-export")
+        response = http_clients.sync_client().get(
+            f"{LICHESS_BASE_URL}/game/export/{game_id}",
+            params=params,
+            headers={
+                "Accept": "application/json",
+                "User-Agent": "OutOfBook/1.0 (https://github.com/aadjones/opening-check-js; aaron.demby.jones@gmail.com)",
+            },
+        )
+        rate_limit.lichess.observe(response)
+        response.raise_for_status()
+        return response.json()  # type: ignore[no-any-return] # Lichess API returns Dict[str, Any]
     except httpx.RequestError as e:
         LOG.error(f"Failed to fetch game data for {game_id}: {e}")
         return None
 
 
-def _extract_study_id_from_url(url: str) -> str:
+def extract_study_id_from_url(url: str) -> str:
     """
     Extracts the study ID from a Lichess study URL.
 
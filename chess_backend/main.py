@@ -13,10 +13,13 @@ It handles game analysis, deviation tracking, and Lichess API proxying.
 
 2. API Endpoints:
    /api/analyze_games    - Analyzes games for deviations
+   /api/analyze_batch    - Analyzes many users at once (scheduled sync)
+   /api/analysis_jobs    - Queues an analysis as a background job (poll or SSE for progress)
    /api/deviations       - Lists user's deviations
    /api/deviations/{id}  - Gets a specific deviation
    /proxy/*             - Proxies requests to Lichess API
    /health              - Health check endpoint
+   /health/caches       - Cache hit/miss counters
 
 3. Data Flow:
    Frontend -> FastAPI -> Lichess API
@@ -29,23 +32,42 @@ It handles game analysis, deviation tracking, and Lichess API proxying.
 - Rate limiting on Lichess API calls
 """
 
+import asyncio
 import os
 import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Literal, Optional, Tuple, Union
 
 import httpx
 from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, HttpUrl
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, HttpUrl
+from starlette.concurrency import run_in_threadpool
+
+import http_clients
+import jobs
+import parallel_analysis
+import rate_limit
+import study_cache
+import token_cache
+import workers
 
 # Import your new service and the DeviationResult class
 from analysis_service import perform_game_analysis
 from deviation_result import DeviationResult
 from error_handling import LichessApiError, handle_lichess_response, handle_network_error, handle_unexpected_error
+from jobs import AnalysisJob
 from logging_config import setup_logging
-from supabase_client import get_deviation_by_id, get_deviations_for_user, get_user_id_from_username
+from supabase_client import (
+    decode_deviation_cursor,
+    get_deviation_by_id,
+    get_deviations_for_user,
+    get_user_id_from_username,
+    lookup_cache_stats,
+)
 from supabase_models import OpeningDeviation, User
 
 # Constants
@@ -53,8 +75,30 @@ LICHESS_API_BASE_URL = "https://lichess.org/api"
 
 
 # Auth
+async def _lichess_username_for_token(token: str) -> str:
+    """Validates a Lichess OAuth token against /api/account and returns its username."""
+    resp = await http_clients.async_client().get(
+        f"{LICHESS_API_BASE_URL}/account",
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=10.0,
+    )
+    if resp.status_code != 200:
+        logger.error(f"Lichess token validation failed: {resp.status_code} {resp.text}")
+        raise HTTPException(status_code=401, detail="Invalid Lichess token")
+    account = resp.json()
+    lichess_username = account.get("username")
+    if not lichess_username:
+        logger.error("Lichess account response missing username")
+        raise HTTPException(status_code=401, detail="Invalid Lichess account response")
+    logger.info(f"Authenticated Lichess user: {lichess_username}")
+    return str(lichess_username)
+
+
 async def get_current_user(request: Request) -> User:
-    """Get the current user from the Lichess OAuth token in the Authorization header, and look up their UUID."""
+    """
+    Get the current user from the Lichess OAuth token in the Authorization header, and look up their UUID.
+    Validated tokens are cached briefly (see token_cache.py), so most requests skip the Lichess round trip.
+    """
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
         logger.error("Missing or invalid authorization header")
@@ -63,28 +107,14 @@ async def get_current_user(request: Request) -> User:
     token = auth_header.split(" ")[1]
     logger.debug(f"Received Lichess OAuth token: {token[:10]}...{token[-10:]}")
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                "https://lichess.org/api/account",
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=10.0,
-            )
-            if resp.status_code != 200:
-                logger.error(f"Lichess token validation failed: {resp.status_code} {resp.text}")
-                raise HTTPException(status_code=401, detail="Invalid Lichess token")
-            account = resp.json()
-            lichess_username = account.get("username")
-            if not lichess_username:
-                logger.error("Lichess account response missing username")
-                raise HTTPException(status_code=401, detail="Invalid Lichess account response")
-            logger.info(f"Authenticated Lichess user: {lichess_username}")
-            # Look up user in DB by Lichess username to get UUID
-            try:
-                user_id = get_user_id_from_username(lichess_username)
-            except Exception as e:
-                logger.error(f"User not found in DB for Lichess username {lichess_username}: {e}")
-                raise HTTPException(status_code=404, detail="User not found in database")
-            return User(id=user_id, lichess_username=lichess_username, access_token=token)
+        lichess_username = await token_cache.tokens.username(token, _lichess_username_for_token)
+        # Look up user in DB by Lichess username to get UUID
+        try:
+            user_id = await run_in_threadpool(get_user_id_from_username, lichess_username)
+        except Exception as e:
+            logger.error(f"User not found in DB for Lichess username {lichess_username}: {e}")
+            raise HTTPException(status_code=404, detail="User not found in database")
+        return User(id=user_id, lichess_username=lichess_username, access_token=token)
     except Exception as e:
         logger.error(f"Lichess OAuth validation failed: {e}")
         raise HTTPException(status_code=401, detail=f"Lichess OAuth validation failed: {str(e)}")
@@ -105,9 +135,73 @@ class AnalysisResponse(BaseModel):
     deviations: List[DeviationResult]
 
 
+# Most users one /api/analyze_batch request may carry; scheduled-sync splits larger runs to match
+BATCH_MAX_USERS = 500
+
+
+class BatchAnalysisRequest(BaseModel):
+    users: List[AnalysisRequest] = Field(..., min_length=1, max_length=BATCH_MAX_USERS)
+
+
+class UserSyncResult(BaseModel):
+    username: str
+    ok: bool
+    message: str = ""
+    games_analyzed: int = 0
+    deviations_found: int = 0
+    error: Optional[str] = None
+
+
+class BatchAnalysisResponse(BaseModel):
+    message: str
+    results: List[UserSyncResult]
+
+
+class DeviationSummary(BaseModel):
+    """A deviation as listed by /api/deviations?view=summary: no PGN, just its header block."""
+
+    id: Optional[str] = None
+    user_id: Optional[str] = None
+    study_id: Optional[str] = None
+    game_id: Optional[str] = None
+    game_date: Optional[str] = None
+    detected_at: Optional[str] = None
+    opening_name: Optional[str] = None
+    position_fen: Optional[str] = None
+    previous_position_fen: Optional[str] = None
+    expected_move: Optional[str] = None
+    actual_move: Optional[str] = None
+    move_number: Optional[int] = None
+    color: Optional[str] = None
+    first_deviator: Optional[str] = None
+    review_status: Optional[Any] = None
+    pgn_headers: Optional[str] = None
+
+
 # --- End Pydantic Models ---
 
-app = FastAPI(title="Chess Analysis Backend")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Opens the shared Lichess HTTP clients and the analysis pool on startup;
+    on shutdown, lets running analyses finish, stops the analysis processes
+    and closes the pooled connections.
+    """
+    http_clients.sync_client()
+    http_clients.async_client()
+    workers.analysis_executor()
+    yield
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, workers.shutdown)
+    await loop.run_in_executor(None, parallel_analysis.shutdown)
+    await http_clients.aclose_clients()
+
+
+app = FastAPI(title="Chess Analysis Backend", lifespan=lifespan)
+
+# Responses smaller than this many bytes are sent uncompressed
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1000"))
 
 # Get allowed origins from environment variable, default to local development
 allowed_origins = os.getenv(
@@ -115,8 +209,15 @@ allowed_origins = os.getenv(
 ).split(",")
 
 app.add_middleware(
-    CORSMiddleware, allow_origins=allowed_origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"]
+    CORSMiddleware,
+    allow_origins=allowed_origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+# Compresses JSON responses (deviation lists, job results); event streams are left uncompressed
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
 
 # Configure logging
 logger = setup_logging(__name__)
@@ -134,26 +235,43 @@ async def health_check() -> dict[str, str]:
     return {"status": "healthy"}
 
 
+@app.get("/health/caches")
+async def cache_stats() -> dict[str, Any]:
+    """Hit, miss, eviction and expiry counters of the in-process caches."""
+    return {
+        "lookups": lookup_cache_stats(),
+        "tokens": token_cache.tokens.stats(),
+        "studies": study_cache.studies.stats.as_dict(),
+    }
+
+
 @app.get("/api/dummy_games")
 async def get_dummy_games() -> dict[str, List[str]]:
     return {"games": ["Game 1: My Awesome Win", "Game 2: That Close Draw", "Game 3: Learning Opportunity"]}
 
 
+def resolve_since(request: AnalysisRequest) -> Optional[datetime]:
+    """If scope is 'today', analyze games since the start of today; otherwise use the requested since."""
+    if request.scope == "today":
+        since = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        logger.info(f"Analyzing today's games since {since}")
+        return since
+    return request.since
+
+
 @app.post("/api/analyze_games", response_model=AnalysisResponse)
 async def analyze_games_endpoint(request: AnalysisRequest) -> AnalysisResponse:
     try:
         logger.info(f"Received analysis request for user: {request.username}, scope: {request.scope}")
 
-        # If scope is 'today', set since to start of today
-        since = request.since
-        if request.scope == "today":
-            since = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            logger.info(f"Analyzing today's games since {since}")
+        since = resolve_since(request)
 
         # Look up user_id (UUID) from username
-        user_id = get_user_id_from_username(request.username)
+        user_id = await run_in_threadpool(get_user_id_from_username, request.username)
 
-        python_results: List[Tuple[Optional[DeviationResult], str]] = perform_game_analysis(
+        # The analysis blocks on network and database calls; run it on the bounded pool, not the event loop
+        python_results: List[Tuple[Optional[DeviationResult], str]] = await workers.run_analysis(
+            perform_game_analysis,
             username=request.username,
             user_id=user_id,
             study_url_white=str(request.study_url_white),
@@ -181,6 +299,87 @@ async def analyze_games_endpoint(request: AnalysisRequest) -> AnalysisResponse:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def sync_user(request: AnalysisRequest) -> UserSyncResult:
+    """Analyzes one user of a batch, turning any failure into that user's result instead of raising."""
+    try:
+        user_id = await run_in_threadpool(get_user_id_from_username, request.username)
+        results = await workers.run_analysis(
+            perform_game_analysis,
+            username=request.username,
+            user_id=user_id,
+            study_url_white=str(request.study_url_white),
+            study_url_black=str(request.study_url_black),
+            max_games=request.max_games,
+            since=resolve_since(request),
+        )
+    except Exception as e:
+        logger.error(f"Batch sync failed for {request.username}: {e}")
+        return UserSyncResult(username=request.username, ok=False, error=str(e))
+    found = len([d for d, _ in results if d is not None])
+    return UserSyncResult(
+        username=request.username,
+        ok=True,
+        message=f"Found {found} deviations in {len(results)} games",
+        games_analyzed=len(results),
+        deviations_found=found,
+    )
+
+
+@app.post("/api/analyze_batch", response_model=BatchAnalysisResponse)
+async def analyze_batch_endpoint(request: BatchAnalysisRequest) -> BatchAnalysisResponse:
+    """
+    Analyzes many users in one request, as the scheduled sync does. Users run
+    concurrently on the analysis pool; their game exports share the Lichess
+    rate limiter (queued fairly per user), and users with the same study share
+    one fetch and trie build. One user's failure does not affect the others.
+    """
+    logger.info(f"Received batch analysis request for {len(request.users)} users")
+    results = await asyncio.gather(*(sync_user(user) for user in request.users))
+    succeeded = len([r for r in results if r.ok])
+    return BatchAnalysisResponse(message=f"Synced {succeeded} of {len(results)} users", results=list(results))
+
+
+@app.post("/api/analysis_jobs", response_model=AnalysisJob, status_code=202)
+async def create_analysis_job(request: AnalysisRequest) -> AnalysisJob:
+    """
+    Queues an analysis and returns its job immediately. Follow it with
+    GET /api/analysis_jobs/{job_id} or the /events stream.
+    """
+    logger.info(f"Received analysis job for user: {request.username}, scope: {request.scope}")
+    try:
+        user_id = await run_in_threadpool(get_user_id_from_username, request.username)
+    except Exception as e:
+        logger.error(f"Error queuing analysis job: {e}")
+        raise HTTPException(status_code=404, detail=str(e))
+    return jobs.submit_analysis(
+        username=request.username,
+        user_id=user_id,
+        study_url_white=str(request.study_url_white),
+        study_url_black=str(request.study_url_black),
+        max_games=request.max_games,
+        since=resolve_since(request),
+    )
+
+
+@app.get("/api/analysis_jobs/{job_id}", response_model=AnalysisJob)
+async def get_analysis_job(job_id: str) -> AnalysisJob:
+    """Returns a job's status and progress, and its deviations once it has succeeded."""
+    job = jobs.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/api/analysis_jobs/{job_id}/events")
+async def stream_analysis_job(job_id: str) -> StreamingResponse:
+    """Server-Sent Events: a ``progress`` event per update, then one ``done`` event."""
+    if jobs.store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        jobs.job_events(job_id), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
 @app.get("/api/proxy/lichess/{path:path}")
 async def proxy_lichess(path: str, request: Request, current_user: User = Depends(get_current_user)) -> Any:
     """
@@ -197,24 +396,28 @@ async def proxy_lichess(path: str, request: Request, current_user: User = Depend
         url = f"{LICHESS_API_BASE_URL}/{path}"
         params = dict(request.query_params)
 
-        # Forward the request to Lichess
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url, params=params, headers={"Authorization": f"Bearer {current_user.access_token}"}, timeout=30.0
-            )
-
-            # Handle any Lichess API errors
-            handle_lichess_response(response)
-
-            # Log successful requests
-            logger.info(f"Successful Lichess API request: {path}")
-
-            # Return the response with proper content type
-            return Response(
-                content=response.content,
-                media_type=response.headers.get("content-type", "application/json"),
-                status_code=response.status_code,
-            )
+        # Forward the request to Lichess over the shared connection pool, queued fairly with other users
+        await rate_limit.lichess.acquire_async(current_user.lichess_username or "")
+        response = await http_clients.async_client().get(
+            url, params=params, headers={"Authorization": f"Bearer {current_user.access_token}"}, timeout=30.0
+        )
+        rate_limit.lichess.observe(response)
+        if response.status_code == 401 and current_user.access_token:
+            # Revoked or expired since it was cached: make the next request revalidate it
+            token_cache.tokens.evict(current_user.access_token)
+
+        # Handle any Lichess API errors
+        handle_lichess_response(response)
+
+        # Log successful requests
+        logger.info(f"Successful Lichess API request: {path}")
+
+        # Return the response with proper content type
+        return Response(
+            content=response.content,
+            media_type=response.headers.get("content-type", "application/json"),
+            status_code=response.status_code,
+        )
 
     except httpx.RequestError as e:
         handle_network_error(e)
@@ -225,42 +428,64 @@ async def proxy_lichess(path: str, request: Request, current_user: User = Depend
         handle_unexpected_error(e)
 
 
-@app.get("/api/deviations", response_model=List[OpeningDeviation])
+@app.get("/api/deviations", response_model=Union[List[OpeningDeviation], List[DeviationSummary]])
 async def get_deviations(
+    response: Response,
     limit: int = Query(10, ge=1, le=100, description="Number of deviations to fetch."),
-    offset: int = Query(0, ge=0, description="Offset for pagination."),
+    offset: int = Query(0, ge=0, description="Offset for pagination (deprecated, use cursor)."),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page."),
+    view: Literal["full", "summary"] = Query("full", description="'summary' omits the PGN; fetch it via /{id}."),
     review_status: Optional[str] = Query(None, description="Filter by review status (needs_review, reviewed, etc.)"),
     active_studies_only: bool = Query(True, description="Only show deviations from active studies."),
     current_user: User = Depends(get_current_user),
-) -> List[OpeningDeviation]:
+) -> Union[List[OpeningDeviation], List[DeviationSummary]]:
     """
-    Fetch deviations for the authenticated user with pagination and optional review_status filter.
-    By default, only shows deviations from active studies.
+    Fetch deviations for the authenticated user, most recently played first, with pagination and
+    optional review_status filter. By default, only shows deviations from active studies.
+    view=summary returns DeviationSummary items, which carry the PGN header block instead of the full PGN.
+    When there are more, the X-Next-Cursor response header holds the cursor for the next page.
     Requires a valid Lichess OAuth token in the Authorization header.
     """
+    if cursor is not None:
+        try:
+            decode_deviation_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
         assert current_user.id is not None
-        rows = get_deviations_for_user(
+        page = await run_in_threadpool(
+            get_deviations_for_user,
             user_id=current_user.id,
             limit=limit,
             offset=offset,
             review_status=review_status,
             active_studies_only=active_studies_only,
+            cursor=cursor,
+            summary=view == "summary",
         )
-        return [OpeningDeviation(**row) for row in rows]
+        if page.next_cursor is not None:
+            response.headers["X-Next-Cursor"] = page.next_cursor
+        if view == "summary":
+            return [DeviationSummary(**row) for row in page.rows]
+        return [OpeningDeviation(**row) for row in page.rows]
     except Exception as e:
         logger.error(f"Error fetching deviations: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch deviations")
 
 
 @app.get("/api/deviations/{deviation_id}", response_model=OpeningDeviation)
-async def get_deviation(deviation_id: str) -> OpeningDeviation:
+async def get_deviation(deviation_id: str, current_user: User = Depends(get_current_user)) -> OpeningDeviation:
     """
-    Fetch a single deviation by its ID.
+    Fetch a single deviation, with its full PGN, by its ID.
+    Only the user the deviation belongs to may read it.
+    Requires a valid Lichess OAuth token in the Authorization header.
     """
-    row = get_deviation_by_id(deviation_id)
+    row = await run_in_threadpool(get_deviation_by_id, deviation_id)
     if not row:
         raise HTTPException(status_code=404, detail="Deviation not found")
+    if row.get("user_id") != current_user.id:
+        logger.warning(f"User {current_user.lichess_username} requested another user's deviation {deviation_id}")
+        raise HTTPException(status_code=403, detail="Not allowed to access this deviation")
     return OpeningDeviation(**row)
 
 
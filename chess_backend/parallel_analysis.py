@@ -0,0 +1,213 @@
+"""
+Deviation detection for a game, inline or on a pool of worker processes.
+
+Parsing a PGN and walking it through a repertoire trie is pure Python and
+CPU-bound, so analysis threads (see workers.py) all compete for one core.
+With ANALYSIS_PROCESSES > 0, perform_game_analysis fans large syncs out to a
+process pool instead:
+
+- Each compiled trie is copied once into a shared memory segment
+  (``share_trie``). Tasks only carry the segment's name; a worker attaches to
+  it on first use and keeps it, reading the trie in place through
+  ``CompactRepertoireTrie.from_buffer``. The segment is unlinked when the
+  trie it was made from is garbage collected.
+- PGNs are sent in chunks of ANALYSIS_CHUNK_SIZE, with a bounded number of
+  chunks in flight, and results come back in input order (``analyze_games``).
+
+The pool is created on first use and shut down by the FastAPI lifespan in
+main.py. Workers are started with "spawn", which is safe in a threaded server
+and cheap here because nothing large is pickled.
+"""
+
+import dataclasses
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+
+import pgn_utils
+from chess_utils import analysis_skip_reason, get_player_color_from_headers
+from deviation_result import DeviationResult
+from repertoire_trie import CompactRepertoireTrie
+
+LOG = logging.getLogger(__name__)
+
+# 0 analyzes games inline on the calling thread
+ANALYSIS_PROCESSES = int(os.getenv("ANALYSIS_PROCESSES", "0"))
+ANALYSIS_CHUNK_SIZE = int(os.getenv("ANALYSIS_CHUNK_SIZE", "64"))
+# Lichess speeds to analyze, comma separated (e.g. "blitz,rapid"); empty analyzes every speed
+ANALYSIS_SPEEDS = frozenset(speed.strip() for speed in os.getenv("ANALYSIS_SPEEDS", "").split(",") if speed.strip())
+# Chunks submitted ahead of the one being consumed, per worker process
+CHUNKS_IN_FLIGHT_PER_PROCESS = 2
+# Tries a worker keeps attached; older ones are detached when more are needed
+WORKER_ATTACHED_TRIES = 16
+
+
+@dataclasses.dataclass
+class GameAnalysis:
+    """
+    Outcome of checking one game: the user's color and deviation, why the
+    game was skipped, or why it could not be checked.
+    """
+
+    player_color: Optional[str] = None
+    deviation: Optional[DeviationResult] = None
+    error: Optional[str] = None
+    skipped: Optional[str] = None
+
+
+def analyze_game(
+    pgn: str, username: str, white_trie: CompactRepertoireTrie, black_trie: CompactRepertoireTrie
+) -> GameAnalysis:
+    """
+    Looks for a deviation in the trie for the color ``username`` played.
+    The color, the variant and the time control come from a header-only
+    scan, so skipped games never have their moves read, and only as many
+    plies are read as that trie could match.
+    """
+    try:
+        headers = pgn_utils.read_headers(pgn)
+        skipped = analysis_skip_reason(headers, ANALYSIS_SPEEDS)
+        if skipped is not None:
+            return GameAnalysis(skipped=skipped)
+        player_color = get_player_color_from_headers(headers, username)
+        trie = white_trie if player_color == "White" else black_trie
+        game = pgn_utils.read_mainline(pgn, max_plies=trie.max_depth)
+        return GameAnalysis(player_color=player_color, deviation=trie.find_deviation(game, username))
+    except Exception as e:
+        return GameAnalysis(error=str(e))
+
+
+# --- Parent side ---
+
+
+@dataclasses.dataclass(frozen=True)
+class SharedTrie:
+    """A compiled trie published in shared memory; cheap to pickle."""
+
+    name: str
+    size: int
+
+
+_lock = threading.Lock()
+_executor: Optional[ProcessPoolExecutor] = None
+_shared: "weakref.WeakKeyDictionary[CompactRepertoireTrie, SharedTrie]" = weakref.WeakKeyDictionary()
+
+
+def enabled() -> bool:
+    return ANALYSIS_PROCESSES > 0
+
+
+def process_pool() -> ProcessPoolExecutor:
+    """Returns the shared analysis process pool, creating it on first use."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max(ANALYSIS_PROCESSES, 1), mp_context=multiprocessing.get_context("spawn")
+            )
+            LOG.info(f"Started analysis process pool with {ANALYSIS_PROCESSES} processes")
+        return _executor
+
+
+def shutdown(wait: bool = True) -> None:
+    """Stops the process pool, letting running chunks finish when ``wait`` is true."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+        LOG.info("Stopped analysis process pool")
+
+
+def share_trie(trie: CompactRepertoireTrie) -> SharedTrie:
+    """Copies ``trie`` into shared memory, once per trie object, and returns its handle."""
+    with _lock:
+        shared = _shared.get(trie)
+        if shared is not None:
+            return shared
+        data = trie.to_bytes()
+        segment = SharedMemory(create=True, size=max(len(data), 1))
+        _buffer(segment)[: len(data)] = data
+        shared = _shared[trie] = SharedTrie(name=segment.name, size=len(data))
+        weakref.finalize(trie, _release, segment)
+        return shared
+
+
+def _buffer(segment: SharedMemory) -> memoryview:
+    buffer = segment.buf
+    assert buffer is not None, "shared memory segment is closed"
+    return buffer
+
+
+def _release(segment: SharedMemory) -> None:
+    segment.close()
+    segment.unlink()
+
+
+def analyze_games(
+    pgns: Iterable[str],
+    username: str,
+    white_trie: CompactRepertoireTrie,
+    black_trie: CompactRepertoireTrie,
+    chunk_size: Optional[int] = None,
+) -> Iterator[GameAnalysis]:
+    """
+    Analyzes ``pgns`` on the process pool, yielding one GameAnalysis per PGN
+    in input order. ``pgns`` is consumed lazily, a bounded number of chunks
+    ahead of the results being read.
+    """
+    chunk_size = chunk_size or ANALYSIS_CHUNK_SIZE
+    executor = process_pool()
+    white, black = share_trie(white_trie), share_trie(black_trie)
+    max_pending = max(ANALYSIS_PROCESSES, 1) * CHUNKS_IN_FLIGHT_PER_PROCESS
+    remaining = iter(pgns)
+    pending: Deque["Future[List[GameAnalysis]]"] = deque()
+
+    def submit_next() -> bool:
+        chunk = list(itertools.islice(remaining, chunk_size))
+        if chunk:
+            pending.append(executor.submit(_analyze_chunk, chunk, username, white, black))
+        return bool(chunk)
+
+    try:
+        while len(pending) < max_pending and submit_next():
+            pass
+        while pending:
+            results = pending.popleft().result()
+            submit_next()
+            yield from results
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+# --- Worker side ---
+
+_attached: "OrderedDict[str, Tuple[SharedMemory, CompactRepertoireTrie]]" = OrderedDict()
+
+
+def _attached_trie(shared: SharedTrie) -> CompactRepertoireTrie:
+    entry = _attached.get(shared.name)
+    if entry is None:
+        segment = SharedMemory(name=shared.name)
+        entry = _attached[shared.name] = (segment, CompactRepertoireTrie.from_buffer(_buffer(segment)[: shared.size]))
+        while len(_attached) > WORKER_ATTACHED_TRIES:
+            _, (old_segment, old_trie) = _attached.popitem(last=False)
+            # The trie's columns are views into the segment, which cannot be unmapped while they exist
+            old_trie.release()
+            old_segment.close()
+    else:
+        _attached.move_to_end(shared.name)
+    return entry[1]
+
+
+def _analyze_chunk(pgns: List[str], username: str, white: SharedTrie, black: SharedTrie) -> List[GameAnalysis]:
+    white_trie, black_trie = _attached_trie(white), _attached_trie(black)
+    return [analyze_game(pgn, username, white_trie, black_trie) for pgn in pgns]
@@ -2,8 +2,12 @@
 This module provides utility functions for pgn files.
 """
 
+import dataclasses
+import hashlib
 import io
-from typing import Iterator, List
+import mmap
+import re
+from typing import IO, Iterator, List, Optional, Tuple, Union
 
 import chess
 import chess.pgn
@@ -12,6 +16,25 @@ import logging_config
 
 logger = logging_config.setup_logging(__name__)
 
+# One tag pair per line: [Name "value"]. Values are kept verbatim, as chess.pgn.read_game does.
+_HEADER_LINE = re.compile(r'[ \t\r\n]*\[([A-Za-z0-9][A-Za-z0-9_+#=:-]*)[ \t]+"([^\r\n]*)"\][ \t\r]*(?=\n|$)')
+
+# Movetext tokens. Comments are matched whole so clock annotations such as
+# {[%clk 0:03:00]} cost one token; a "[" outside a comment starts the next game.
+_MOVETEXT_TOKEN = re.compile(
+    r"""
+    (?P<comment>\{[^}]*\}?|;[^\n]*|^%[^\n]*)
+    |(?P<open>\()
+    |(?P<close>\))
+    |(?P<result>1-0|0-1|1/2-1/2|\*)
+    |(?P<number>\d+(?:\.+|(?=\s)))
+    |(?P<nag>\$\d+|[!?]+)
+    |(?P<header>\[)
+    |(?P<san>[^\s{}();\[\]$!?]+)
+    """,
+    re.VERBOSE | re.MULTILINE,
+)
+
 
 def pgn_string_to_game(pgn_str: str) -> chess.pgn.Game:
     """
@@ -27,15 +50,242 @@ def pgn_string_to_game(pgn_str: str) -> chess.pgn.Game:
     return game
 
 
+class MainlineGame:
+    """
+    The headers and mainline SAN moves of one game, as read by ``read_mainline``.
+
+    Provides the parts of chess.pgn.Game that deviation detection uses
+    (``headers``, ``board()`` and ``mainline_moves()``) without building a
+    GameNode per move. SAN is resolved to moves lazily, so a caller that
+    stops early never parses the rest of the game.
+    """
+
+    __slots__ = ("headers", "sans")
+
+    def __init__(self, headers: chess.pgn.Headers, sans: List[str]) -> None:
+        self.headers = headers
+        self.sans = sans
+
+    def board(self) -> chess.Board:
+        """The starting position, honouring the FEN and Variant headers like chess.pgn.Game.board()."""
+        return self.headers.board()
+
+    def mainline_moves(self) -> Iterator[chess.Move]:
+        """
+        Yields the mainline moves in order. Like chess.pgn.read_game, the
+        mainline ends at the first illegal or ambiguous SAN.
+        """
+        board = self.board()
+        for san in self.sans:
+            try:
+                move = board.push_san(san)
+            except ValueError as e:
+                logger.warning(f"[Parser] Mainline stops at {san!r} after {len(board.move_stack)} plies: {e}")
+                return
+            yield move
+
+
+# Anything with headers, board() and mainline_moves(); see MainlineGame.
+GameLike = Union[chess.pgn.Game, MainlineGame]
+
+
+def read_headers(pgn_str: str) -> chess.pgn.Headers:
+    """
+    Reads the tag pairs of the first game in a PGN string without looking at
+    its moves, like chess.pgn.read_headers.
+
+    :param pgn_str: str, the PGN format string of the game
+    :return: chess.pgn.Headers, the game's headers
+    """
+    return _read_tag_pairs(pgn_str)[0]
+
+
+def _read_tag_pairs(pgn_str: str) -> Tuple[chess.pgn.Headers, int]:
+    """Returns the headers of the first game and the offset where its movetext starts."""
+    if not pgn_str.strip():
+        raise Exception(f"Could not read game from PGN: {pgn_str}")
+
+    headers = chess.pgn.Headers()
+    pos = 0
+    header_line = _HEADER_LINE.match(pgn_str)
+    while header_line is not None:
+        name, value = header_line.groups()
+        headers[name] = value
+        pos = header_line.end()
+        header_line = _HEADER_LINE.match(pgn_str, pos)
+    return headers, pos
+
+
+def read_mainline(pgn_str: str, max_plies: Optional[int] = None) -> MainlineGame:
+    """
+    Reads the headers and mainline SAN tokens of the first game in a PGN
+    string, skipping comments (including clock annotations), NAGs and
+    variations.
+
+    :param pgn_str: str, the PGN format string of the game
+    :param max_plies: Optional[int], stop tokenizing after this many mainline moves
+    :return: MainlineGame, the game's headers and mainline (possibly truncated)
+    """
+    headers, pos = _read_tag_pairs(pgn_str)
+    sans: List[str] = []
+    depth = 0
+    for token in _MOVETEXT_TOKEN.finditer(pgn_str, pos):
+        kind = token.lastgroup
+        if kind == "san":
+            if not depth:
+                if len(sans) == max_plies:
+                    break
+                sans.append(token.group())
+        elif kind == "open":
+            depth += 1
+        elif kind == "close":
+            depth = max(depth - 1, 0)
+        elif kind == "header" or (kind == "result" and not depth):
+            break
+    return MainlineGame(headers, sans)
+
+
+def pgn_content_hash(pgn_str: str) -> str:
+    """
+    Returns a short, stable hash of a PGN text, used to tell study versions apart.
+
+    :param pgn_str: str, the PGN text
+    :return: str, the first 16 hex digits of its SHA-256
+    """
+    return hashlib.sha256(pgn_str.encode("utf-8")).hexdigest()[:16]
+
+
 def pgn_to_pgn_list(pgn_data: str) -> list[chess.pgn.Game]:
     """
     Splits a pgn with multiple games into a list of pgns with one game each
 
-    :param pgn_data: str, a PGN string, possibly containing many games, separated by 3 new lines each
+    :param pgn_data: str, a PGN string, possibly containing many games
     :return: List[chess.pgn.Game], a list of chess game objects read in from the PGN string
     """
-    pgn_list_str = pgn_data.strip().split("\n\n\n")
-    return [pgn_string_to_game(game) for game in pgn_list_str]
+    return list(read_games(pgn_data))
+
+
+# A multi-game PGN: text, raw bytes (including an mmap of a file), or a file object opened in either mode
+PgnSource = Union[str, bytes, mmap.mmap, IO[bytes], IO[str]]
+
+# A result token closing the movetext of a game, at the end of a (stripped) line
+_RESULTS = (b"1-0", b"0-1", b"1/2-1/2", b"*")
+_GAME_TERMINATION = re.compile(rb"(?:^|[\s}])(?:1-0|0-1|1/2-1/2|\*)$")
+
+
+@dataclasses.dataclass(frozen=True)
+class PgnText:
+    """The text of one game in a multi-game PGN and the byte offset it starts at."""
+
+    offset: int
+    pgn: str
+
+
+def iter_pgn_games(source: PgnSource, start: int = 0) -> Iterator[PgnText]:
+    """
+    Splits a multi-game PGN into games lazily, holding one game in memory at
+    a time. A new game starts at a tag pair line that follows movetext, or at
+    the first line after a game's result, so chapters need not be separated
+    by any particular number of blank lines. Tag-like lines inside multi-line
+    comments are not mistaken for headers.
+
+    Offsets count bytes of the UTF-8 encoding from the start of ``source``;
+    passing one back as ``start`` resumes reading at that game, which makes
+    a list of offsets an index into a large file.
+
+    :param source: PgnSource, the PGN text, bytes, mmap or file object
+    :param start: int, byte offset to start reading from
+    :return: Iterator[PgnText], each game's starting offset and text
+    """
+    lines: List[bytes] = []
+    offset = start
+    game_offset = start
+    in_movetext = in_comment = game_over = False
+
+    for line in _pgn_lines(source, start):
+        stripped = line.strip()
+        if stripped and not in_comment and lines and (game_over or (in_movetext and stripped.startswith(b"["))):
+            yield _pgn_text(game_offset, lines)
+            lines = []
+            in_movetext = game_over = False
+        if not lines:
+            if not stripped:
+                offset += len(line)
+                continue
+            game_offset = offset
+        lines.append(line)
+        offset += len(line)
+
+        if stripped and not stripped.startswith((b"[", b"%")) or in_comment:
+            in_movetext = True
+            if in_comment or b"{" in line:
+                in_comment = _ends_in_comment(line, in_comment)
+            game_over = (
+                not in_comment
+                and stripped.endswith(_RESULTS)
+                and _GAME_TERMINATION.search(stripped, len(stripped) - 9) is not None
+            )
+
+    if lines:
+        yield _pgn_text(game_offset, lines)
+
+
+def read_games(source: PgnSource) -> Iterator[chess.pgn.Game]:
+    """
+    Parses each game of a multi-game PGN as it is reached (see iter_pgn_games).
+
+    :param source: PgnSource, the PGN text, bytes, mmap or file object
+    :return: Iterator[chess.pgn.Game], the games in order
+    """
+    for game in iter_pgn_games(source):
+        yield pgn_string_to_game(game.pgn)
+
+
+def _pgn_lines(source: PgnSource, start: int) -> Iterator[bytes]:
+    """Yields the lines of ``source`` from byte offset ``start`` as bytes, line endings included."""
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    if isinstance(source, (bytes, mmap.mmap)):
+        pos, size = start, len(source)
+        while pos < size:
+            end = source.find(b"\n", pos)
+            end = size if end < 0 else end + 1
+            yield source[pos:end]
+            pos = end
+        return
+
+    if start:
+        if isinstance(source, io.TextIOBase):
+            raise ValueError("Byte offsets need a file opened in binary mode")
+        source.seek(start)
+    for line in source:
+        yield line.encode("utf-8") if isinstance(line, str) else line
+
+
+def _ends_in_comment(line: bytes, in_comment: bool) -> bool:
+    """Whether a {brace comment} is still open at the end of ``line``."""
+    if b";" not in line:
+        # Comments do not nest, so without ; comments the last brace on the line decides
+        opening, closing = line.rfind(b"{"), line.rfind(b"}")
+        return in_comment if opening == closing else opening > closing
+
+    pos = 0
+    while True:
+        if in_comment:
+            end = line.find(b"}", pos)
+            if end < 0:
+                return True
+            in_comment, pos = False, end + 1
+        else:
+            opening = line.find(b"{", pos)
+            semicolon = line.find(b";", pos)
+            if opening < 0 or 0 <= semicolon < opening:
+                return False
+            in_comment, pos = True, opening + 1
+
+
+def _pgn_text(offset: int, lines: List[bytes]) -> PgnText:
+    return PgnText(offset=offset, pgn=b"".join(lines).decode("utf-8", errors="replace").strip())
 
 
 def walk_pgn_variations(game: chess.pgn.Game) -> Iterator[List[chess.Move]]:
@@ -0,0 +1,190 @@
+"""
+Token-bucket rate limiting for Lichess API calls.
+
+Every call to Lichess takes a token from one process-wide bucket. Tokens
+refill at a steady rate up to a burst capacity, so a handful of requests can
+go out back to back while the long-run rate stays within the upstream budget.
+When the bucket is empty, callers queue instead of sleeping a fixed delay.
+
+Queued callers are grouped by key (the username an analysis runs for, or the
+study being fetched) and served round-robin across keys, so one user's large
+export cannot starve everyone else. Both threads (``acquire``) and coroutines
+(``acquire_async``) wait in the same queue; coroutines never block the loop.
+
+Responses are fed back through ``observe``: a 429 with ``Retry-After`` (or
+an exhausted ``X-RateLimit-Remaining`` with ``X-RateLimit-Reset``) pauses the
+whole bucket until Lichess is ready again.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from typing import Callable, Deque, Optional
+
+import httpx
+
+LOG = logging.getLogger(__name__)
+
+# Lichess asks API clients for roughly one request per second and a full
+# minute of silence after a 429.
+LICHESS_RATE_PER_SECOND = float(os.getenv("LICHESS_RATE_PER_SECOND", "1"))
+LICHESS_BURST = int(os.getenv("LICHESS_BURST", "4"))
+DEFAULT_RETRY_AFTER_SECONDS = 60.0
+
+
+class _Waiter:
+    """A queued request, woken either through a threading.Event or an asyncio future."""
+
+    __slots__ = ("key", "granted", "event", "future", "loop")
+
+    def __init__(
+        self,
+        key: str,
+        event: Optional[threading.Event] = None,
+        future: "Optional[asyncio.Future[None]]" = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> None:
+        self.key = key
+        self.granted = False
+        self.event = event
+        self.future = future
+        self.loop = loop
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        if self.future is not None and self.loop is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """A token bucket with per-key fair queueing, shared by threads and coroutines."""
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._paused_until = 0.0
+        # Waiting requests per key; the first key is served next, then moves to the back.
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+
+    def acquire(self, key: str = "") -> None:
+        """Blocks the calling thread until a token is available for ``key``."""
+        waiter = _Waiter(key, event=threading.Event())
+        delay = self._enqueue(waiter)
+        while not waiter.granted:
+            assert waiter.event is not None
+            waiter.event.wait(delay)
+            with self._lock:
+                delay = self._dispatch()
+
+    async def acquire_async(self, key: str = "") -> None:
+        """Waits, without blocking the event loop, until a token is available for ``key``."""
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[None]" = loop.create_future()
+        waiter = _Waiter(key, future=future, loop=loop)
+        delay = self._enqueue(waiter)
+        try:
+            while not waiter.granted:
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), delay)
+                except asyncio.TimeoutError:
+                    pass
+                with self._lock:
+                    delay = self._dispatch()
+        except asyncio.CancelledError:
+            self._discard(waiter)
+            raise
+
+    def observe(self, response: httpx.Response) -> None:
+        """Pauses the bucket when a Lichess response says the budget is used up."""
+        pause = None
+        if response.status_code == 429:
+            pause = _seconds_from_header(response.headers.get("Retry-After"), time.time())
+            pause = DEFAULT_RETRY_AFTER_SECONDS if pause is None else pause
+        elif response.headers.get("X-RateLimit-Remaining") == "0":
+            pause = _seconds_from_header(response.headers.get("X-RateLimit-Reset"), time.time())
+        if pause is None:
+            return
+        LOG.warning(f"[RateLimit] Lichess budget exhausted (status {response.status_code}); pausing {pause:.0f}s")
+        with self._lock:
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, self._clock() + pause)
+
+    @property
+    def queued(self) -> int:
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def _enqueue(self, waiter: _Waiter) -> float:
+        with self._lock:
+            self._queues.setdefault(waiter.key, deque()).append(waiter)
+            return self._dispatch()
+
+    def _discard(self, waiter: _Waiter) -> None:
+        with self._lock:
+            queue = self._queues.get(waiter.key)
+            if queue is not None and waiter in queue:
+                queue.remove(waiter)
+                if not queue:
+                    del self._queues[waiter.key]
+
+    def _dispatch(self) -> float:
+        """
+        Hands available tokens to queued requests, one per key in turn. Must be
+        called with the lock held. Returns how long to wait before the next
+        token could be handed out.
+        """
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        while self._queues and self._tokens >= 1:
+            key, queue = next(iter(self._queues.items()))
+            queue.popleft().grant()
+            self._tokens -= 1
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+        return (1 - self._tokens) / self.rate if self._queues else 0.0
+
+
+def _seconds_from_header(value: Optional[str], now: float) -> Optional[float]:
+    """
+    Parses a delay header: a number of seconds, a Unix timestamp (as some
+    X-RateLimit-Reset headers use), or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+        except (TypeError, ValueError):
+            return None
+    if number > 1_000_000_000:  # Unix timestamp rather than a delay
+        return max(0.0, number - now)
+    return max(0.0, number)
+
+
+# Shared by every Lichess call the backend makes.
+lichess = RateLimiter(rate=LICHESS_RATE_PER_SECOND, burst=LICHESS_BURST)
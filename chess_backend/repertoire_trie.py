@@ -2,15 +2,22 @@
 
 from __future__ import annotations
 
-from typing import Dict, List, Optional
+import logging
+import struct
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Deque, Dict, Generic, List, Literal, Optional, Sequence, Tuple, TypeVar, Union
 
 import chess
 import chess.pgn
+import chess.polyglot
 
-from chess_utils import calculate_previous_position_fen
 from deviation_result import DeviationResult
 from logging_config import setup_logging
-from pgn_utils import walk_pgn_variations
+from pgn_utils import GameLike, walk_pgn_variations
 
 
 class TrieNode:
@@ -27,15 +34,169 @@ class TrieNode:
 
 logger = setup_logging(__name__)
 
+NodeT = TypeVar("NodeT")
 
-class RepertoireTrie:
+
+class _TrieWalker(ABC, Generic[NodeT]):
+    """
+    Shared deviation search for the trie implementations in this module.
+
+    Subclasses only describe how to navigate their own node representation;
+    the rules for what counts as a deviation live here so every engine
+    reports identical results.
+    """
+
+    @abstractmethod
+    def _root_node(self, board: chess.Board) -> NodeT:
+        """Returns the node for the starting position ``board``."""
+
+    @abstractmethod
+    def _child_node(self, node: NodeT, move: chess.Move) -> Optional[NodeT]:
+        """Returns the node reached by playing ``move`` from ``node``, if it was prepared."""
+
+    @abstractmethod
+    def _expected_moves(self, node: NodeT) -> List[Tuple[str, Optional[str]]]:
+        """Returns the (UCI, SAN) pairs prepared at ``node``."""
+
+    @property
+    def max_depth(self) -> Optional[int]:
+        """
+        Plies from the root to the deepest prepared position, or None if the
+        engine cannot bound it. A game can only deviate within its first
+        ``max_depth`` plies, so readers may stop there.
+        """
+        return None
+
+    def _transposed_node(self, board: chess.Board, move: chess.Move) -> Optional[NodeT]:
+        """
+        Returns the node reached by playing an unprepared ``move`` on ``board``
+        if the resulting position is in the repertoire anyway. Move-keyed
+        tries cannot detect transpositions, so the default is None.
+        """
+        return None
+
+    def find_deviation(self, recent_game: GameLike, username: str) -> Optional[DeviationResult]:
+        """
+        Compares a recent game against the repertoire stored in the trie.
+        Returns a DeviationResult if a deviation is found, otherwise None.
+        ``recent_game`` may be a chess.pgn.Game or a pgn_utils.MainlineGame.
+
+        While the game follows the repertoire each ply is a node lookup plus
+        ``board.push``; FENs, SANs and the other strings in the result are
+        only produced for the deviating move. The walk ends as soon as the
+        game leaves the book, so the rest of the game is never read.
+        """
+        board = recent_game.board()
+        current_trie_node = self._root_node(board)
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        for move in recent_game.mainline_moves():
+            child_node = self._child_node(current_trie_node, move)
+            if child_node is not None:
+                # Move is in the repertoire, traverse deeper
+                current_trie_node = child_node
+                board.push(move)
+                continue
+
+            # The move may reach a prepared position by a different move order. This is checked before
+            # the end of book, since the game can start or wander outside the prepared positions and
+            # transpose into them later (e.g. chapters that start from a FEN)
+            transposed_node = self._transposed_node(board, move)
+            if transposed_node is not None:
+                if debug:
+                    logger.debug(f"[Trie] Move {board.san(move)} transposes back into the repertoire.")
+                current_trie_node = transposed_node
+                board.push(move)
+                continue
+
+            expected_moves = self._expected_moves(current_trie_node)
+
+            # Check if we've reached the end of our preparation (no more moves in repertoire)
+            if not expected_moves:
+                # End of book - this is natural, not a deviation. Nothing is prepared past a leaf,
+                # so the rest of the game cannot deviate either.
+                if debug:
+                    logger.debug(
+                        f"[Trie] Reached end of repertoire at move {board.fullmove_number} "
+                        f"({_color_name(board.turn)}). Move {board.san(move)} continues beyond prepared lines."
+                    )
+                return None
+
+            return self._deviation_result(recent_game, username, board, move, expected_moves)
+
+        # No deviation found
+        return None
+
+    def _deviation_result(
+        self,
+        recent_game: GameLike,
+        username: str,
+        board: chess.Board,
+        move: chess.Move,
+        expected_moves: List[Tuple[str, Optional[str]]],
+    ) -> DeviationResult:
+        """Describes a true deviation: ``move`` is played on ``board`` where ``expected_moves`` were prepared."""
+        player_color = _color_name(board.turn)
+        move_number = board.fullmove_number
+        my_color = "White" if username.lower() == recent_game.headers.get("White", "").lower() else "Black"
+        first_deviator = "user" if player_color == my_color else "opponent"
+
+        expected_sans = [san for _, san in expected_moves if san is not None]
+        reference_san = " or ".join(sorted(expected_sans))
+
+        # We need all potential reference UCIs for a complete result
+        reference_ucis = [uci for uci, _ in expected_moves]
+        deviation_san = board.san(move)
+
+        logger.info(
+            f"[Trie] True deviation detected at move {move_number} ({player_color}). "
+            f"Played: {deviation_san}, Expected: {reference_san}"
+        )
+
+        return DeviationResult(
+            first_deviator=first_deviator,
+            move_number=move_number,
+            deviation_san=deviation_san,
+            deviation_uci=move.uci(),
+            reference_san=reference_san,
+            reference_uci=", ".join(sorted(reference_ucis)),
+            player_color=player_color,
+            board_fen=board.fen(),
+            # The position before the last move played, taken from the board's own move stack
+            # rather than by exporting the game and replaying it
+            previous_position_fen=_previous_position_fen(board),
+        )
+
+
+def _color_name(color: chess.Color) -> str:
+    return "White" if color == chess.WHITE else "Black"
+
+
+def _previous_position_fen(board: chess.Board) -> Optional[str]:
+    """FEN of the position before the last move on ``board``, or None if no move has been played."""
+    if not board.move_stack:
+        return None
+    last_move = board.pop()
+    try:
+        return board.fen()
+    finally:
+        board.push(last_move)
+
+
+class RepertoireTrie(_TrieWalker[TrieNode]):
     def __init__(self) -> None:
         self.root = TrieNode()
+        self._max_depth = 0
+
+    @property
+    def max_depth(self) -> Optional[int]:
+        return self._max_depth
 
     def add_move_sequence(self, board: chess.Board, moves: List[chess.Move]) -> None:
         """Adds a single, linear sequence of moves to the trie."""
         current_node = self.root
         temp_board = board.copy()
+        self._max_depth = max(self._max_depth, len(moves))
 
         for move in moves:
             uci = move.uci()
@@ -69,64 +230,367 @@ class RepertoireTrie:
             # print(f"[Trie] Adding sequence: {uci_path}")
             self.add_move_sequence(board, move_sequence)
 
-    def find_deviation(self, recent_game: chess.pgn.Game, username: str) -> Optional[DeviationResult]:
+    def _root_node(self, board: chess.Board) -> TrieNode:
+        return self.root
+
+    def _child_node(self, node: TrieNode, move: chess.Move) -> Optional[TrieNode]:
+        return node.children.get(move.uci())
+
+    def _expected_moves(self, node: TrieNode) -> List[Tuple[str, Optional[str]]]:
+        return [(uci, child.san) for uci, child in node.children.items()]
+
+
+# --- Compact (array-backed) trie ---
+
+# Sentinel SAN offset for the root node, which has no move leading into it.
+NO_SAN = 0xFFFFFFFF
+
+
+def encode_move(move: chess.Move) -> int:
+    """
+    Packs a move into 16 bits: from-square (6 bits), to-square (6 bits) and
+    promotion piece type (3 bits, 0 for none).
+    """
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def decode_move(code: int) -> chess.Move:
+    """Inverse of :func:`encode_move`."""
+    return chess.Move(code & 0x3F, (code >> 6) & 0x3F, (code >> 12) or None)
+
+
+# Staging node used while a chapter is being inserted: [san, ply, children keyed by packed move]
+_StagingNode = List[Any]
+
+# A node column: an ``array`` while building, or a memoryview over a loaded buffer.
+_Column = Sequence[int]
+
+# Serialized layout: header, then the columns in this order (4-byte columns
+# first so every column stays aligned), then the SAN string table.
+_COMPACT_MAGIC = b"OOBTRIE1"
+_COMPACT_HEADER = struct.Struct("<8sII")  # magic, node count, string table length
+_COMPACT_COLUMNS: Tuple[Tuple[str, Literal["i", "I", "H"]], ...] = (
+    ("_parent", "i"),
+    ("_san_offset", "I"),
+    ("_child_start", "I"),
+    ("_move", "H"),
+    ("_ply", "H"),
+    ("_child_count", "H"),
+)
+
+
+class CompactRepertoireTrie(_TrieWalker[int]):
+    """
+    Array-backed repertoire trie with the same public API as RepertoireTrie.
+
+    Nodes are numbered in breadth-first order and stored column-wise in flat
+    ``array`` buffers, so a node costs a handful of bytes instead of a Python
+    object plus a dict:
+
+    - ``parent``: index of the parent node (-1 for the root)
+    - ``move``: the 16-bit packed move leading into the node (see encode_move)
+    - ``ply``: ply of the position after the move
+    - ``san_offset``: offset of the move's SAN in a shared, de-duplicated
+      string table (length-prefixed UTF-8)
+    - ``child_start`` / ``child_count``: children are contiguous and sorted by
+      packed move, so a child lookup is a bisect over that range
+
+    New lines are inserted into a temporary dict tree and folded back into the
+    arrays at the end of each ``add_study_chapter`` call.
+
+    ``to_bytes`` / ``from_buffer`` serialize the columns as-is, so a trie can
+    be loaded straight from a memory-mapped file without any parsing.
+    """
+
+    def __init__(self) -> None:
+        self._parent: _Column = array("i", [-1])
+        self._move: _Column = array("H", [0])
+        self._ply: _Column = array("H", [0])
+        self._san_offset: _Column = array("I", [NO_SAN])
+        self._child_start: _Column = array("I", [1])
+        self._child_count: _Column = array("H", [0])
+        self._san_table: Union[bytearray, memoryview] = bytearray()
+        self._staging: Optional[_StagingNode] = None
+        # Keeps a loaded buffer (e.g. an mmap) alive while columns point into it.
+        self._buffer: Any = None
+
+    def __len__(self) -> int:
+        """Number of nodes in the trie, including the root."""
+        self._freeze()
+        return len(self._parent)
+
+    @property
+    def nbytes(self) -> int:
+        """Size in bytes of the node arrays and string table."""
+        self._freeze()
+        columns = [getattr(self, name) for name, _ in _COMPACT_COLUMNS]
+        return sum(memoryview(column).nbytes for column in columns) + len(self._san_table)
+
+    @property
+    def max_depth(self) -> Optional[int]:
+        # Nodes are in breadth-first order, so the last one is as deep as any
+        self._freeze()
+        depth, node = 0, len(self._parent) - 1
+        while node > 0:
+            node = self._parent[node]
+            depth += 1
+        return depth
+
+    def to_bytes(self) -> bytes:
+        """Serializes the trie into the layout read by :meth:`from_buffer`."""
+        self._freeze()
+        chunks = [_COMPACT_HEADER.pack(_COMPACT_MAGIC, len(self._parent), len(self._san_table))]
+        for name, typecode in _COMPACT_COLUMNS:
+            column = array(typecode, getattr(self, name))
+            if sys.byteorder == "big":
+                column.byteswap()
+            chunks.append(column.tobytes())
+        chunks.append(bytes(self._san_table))
+        return b"".join(chunks)
+
+    @classmethod
+    def from_buffer(cls, buffer: Any) -> CompactRepertoireTrie:
         """
-        Compares a recent game against the repertoire stored in the trie.
-        Returns a DeviationResult if a deviation is found, otherwise None.
+        Loads a trie written by :meth:`to_bytes`. On little-endian machines the
+        columns are zero-copy views into ``buffer``, which is kept alive for the
+        lifetime of the trie.
         """
-        board = recent_game.board()
-        my_color = "White" if username.lower() == recent_game.headers.get("White", "").lower() else "Black"
-        current_trie_node = self.root
+        view = memoryview(buffer)
+        if len(view) < _COMPACT_HEADER.size:
+            raise ValueError("Buffer is too small to hold a compiled trie")
+        magic, node_count, san_table_length = _COMPACT_HEADER.unpack_from(view)
+        if magic != _COMPACT_MAGIC:
+            raise ValueError(f"Not a compiled trie (magic {magic!r})")
 
-        for move in recent_game.mainline_moves():
-            player_color = "White" if board.turn == chess.WHITE else "Black"
-            move_number = board.fullmove_number
-            board_fen_before_move = board.fen()
+        trie = cls()
+        offset = _COMPACT_HEADER.size
+        for name, typecode in _COMPACT_COLUMNS:
+            size = array(typecode).itemsize * node_count
+            chunk = view[offset : offset + size]
+            if sys.byteorder == "big":
+                column = array(typecode, chunk.tobytes())
+                column.byteswap()
+                setattr(trie, name, column)
+            else:
+                setattr(trie, name, chunk.cast(typecode))
+            offset += size
 
-            if move.uci() in current_trie_node.children:
-                # Move is in the repertoire, traverse deeper
-                current_trie_node = current_trie_node.children[move.uci()]
-                board.push(move)
+        if offset + san_table_length != len(view):
+            raise ValueError("Compiled trie is truncated or has trailing data")
+        trie._san_table = view[offset:]
+        trie._buffer = buffer
+        return trie
+
+    def release(self) -> None:
+        """
+        Releases the views a trie loaded by :meth:`from_buffer` holds into its
+        buffer, so the buffer (e.g. a shared memory segment) can be closed.
+        The trie must not be used afterwards.
+        """
+        views = [getattr(self, name) for name, _ in _COMPACT_COLUMNS] + [self._san_table, self._buffer]
+        self._buffer = None
+        for view in views:
+            if isinstance(view, memoryview):
+                view.release()
+
+    def add_move_sequence(self, board: chess.Board, moves: List[chess.Move]) -> None:
+        """Adds a single, linear sequence of moves to the trie."""
+        current_node = self._thaw()
+        temp_board = board.copy()
+
+        for move in moves:
+            code = encode_move(move)
+            child_node = current_node[2].get(code)
+            if child_node is None:
+                move_san = temp_board.san(move)
+                logger.debug(f"[Trie] Adding new node: {move_san} (ply {temp_board.ply() + 1}) at UCI {move.uci()}")
+                child_node = [move_san, temp_board.ply() + 1, {}]
+                current_node[2][code] = child_node
+
+            temp_board.push(move)
+            current_node = child_node
+
+    def add_study_chapter(self, chapter: chess.pgn.Game) -> None:
+        logger.info(f"[Trie] Processing chapter starting from FEN: {chapter.headers.get('FEN', 'startpos')}")
+        board = chapter.board()
+
+        sequences = list(walk_pgn_variations(chapter))
+        logger.info(f"[Trie] Found {len(sequences)} move sequences in chapter.")
+
+        for move_sequence in sequences:
+            self.add_move_sequence(board, move_sequence)
+        self._freeze()
+
+    def root_moves(self) -> List[Tuple[str, Optional[str]]]:
+        """Returns the (UCI, SAN) pairs prepared from the starting position."""
+        self._freeze()
+        return self._expected_moves(0)
+
+    def _san(self, node: int) -> Optional[str]:
+        offset = self._san_offset[node]
+        if offset == NO_SAN:
+            return None
+        length = self._san_table[offset]
+        return bytes(self._san_table[offset + 1 : offset + 1 + length]).decode("utf-8")
+
+    def _thaw(self) -> _StagingNode:
+        """Returns the staging tree, rebuilding it from the arrays if needed."""
+        if self._staging is not None:
+            return self._staging
+
+        staging: List[_StagingNode] = [[None, 0, {}]]
+        for node in range(1, len(self._parent)):
+            staged: _StagingNode = [self._san(node), self._ply[node], {}]
+            staging[self._parent[node]][2][self._move[node]] = staged
+            staging.append(staged)
+        self._staging = staging[0]
+        return self._staging
+
+    def _freeze(self) -> None:
+        """Folds the staging tree back into the flat arrays."""
+        if self._staging is None:
+            return
+
+        parent = array("i")
+        move = array("H")
+        ply = array("H")
+        san_offset = array("I")
+        child_start = array("I")
+        child_count = array("H")
+        san_table = bytearray()
+        san_offsets: Dict[str, int] = {}
+
+        queue: Deque[Tuple[_StagingNode, int, int]] = deque([(self._staging, -1, 0)])
+        next_index = 1
+        while queue:
+            node, parent_index, code = queue.popleft()
+            san = node[0]
+            if san is None:
+                offset = NO_SAN
             else:
-                # Check if we've reached the end of our preparation (no more moves in repertoire)
-                if not current_trie_node.children:
-                    # End of book - this is natural, not a deviation. Continue analyzing the game.
-                    logger.debug(
-                        f"[Trie] Reached end of repertoire at move {move_number} ({player_color}). "
-                        f"Move {board.san(move)} continues beyond prepared lines."
-                    )
-                    board.push(move)
-                    continue
-
-                # True deviation found - we have expected moves but player chose differently
-                first_deviator = "user" if player_color == my_color else "opponent"
-
-                expected_sans = [node.san for node in current_trie_node.children.values() if node.san is not None]
-                reference_san = " or ".join(sorted(expected_sans))
-
-                # We need all potential reference UCIs for a complete result
-                reference_ucis = list(current_trie_node.children.keys())
-
-                logger.info(
-                    f"[Trie] True deviation detected at move {move_number} ({player_color}). "
-                    f"Played: {board.san(move)}, Expected: {reference_san}"
-                )
-
-                # Calculate the previous position FEN
-                pgn_string = str(recent_game)
-                previous_position_fen = calculate_previous_position_fen(pgn_string, move_number, player_color)
-
-                return DeviationResult(
-                    first_deviator=first_deviator,
-                    move_number=move_number,
-                    deviation_san=board.san(move),
-                    deviation_uci=move.uci(),
-                    reference_san=reference_san,
-                    reference_uci=", ".join(sorted(reference_ucis)),
-                    player_color=player_color,
-                    board_fen=board_fen_before_move,
-                    previous_position_fen=previous_position_fen,
-                )
+                offset = san_offsets.get(san, -1)
+                if offset < 0:
+                    encoded = san.encode("utf-8")
+                    offset = san_offsets[san] = len(san_table)
+                    san_table.append(len(encoded))
+                    san_table.extend(encoded)
 
-        # No deviation found
+            index = len(parent)
+            children = sorted(node[2].items())
+            parent.append(parent_index)
+            move.append(code)
+            ply.append(node[1])
+            san_offset.append(offset)
+            child_start.append(next_index)
+            child_count.append(len(children))
+            next_index += len(children)
+            for child_code, child in children:
+                queue.append((child, index, child_code))
+
+        self._parent, self._move, self._ply = parent, move, ply
+        self._san_offset, self._child_start, self._child_count = san_offset, child_start, child_count
+        self._san_table = san_table
+        self._staging = None
+        self._buffer = None
+
+    def _root_node(self, board: chess.Board) -> int:
+        self._freeze()
+        return 0
+
+    def _child_node(self, node: int, move: chess.Move) -> Optional[int]:
+        code = encode_move(move)
+        start = self._child_start[node]
+        end = start + self._child_count[node]
+        index = bisect_left(self._move, code, start, end)
+        if index < end and self._move[index] == code:
+            return index
         return None
+
+    def _expected_moves(self, node: int) -> List[Tuple[str, Optional[str]]]:
+        start = self._child_start[node]
+        return [
+            (decode_move(self._move[child]).uci(), self._san(child))
+            for child in range(start, start + self._child_count[node])
+        ]
+
+
+# --- Position-keyed (transposition-aware) repertoire ---
+
+# Prepared moves out of a position: UCI -> (SAN, Zobrist key of the resulting position)
+PositionMoves = Dict[str, Tuple[str, int]]
+
+
+class RepertoireGraph(_TrieWalker[int]):
+    """
+    Repertoire index keyed by position rather than by move path.
+
+    Every position reached in the study is stored once under its Zobrist hash
+    (``chess.polyglot.zobrist_hash``), together with the moves prepared from
+    it and the keys of the positions they lead to. Lines that transpose into
+    each other therefore share nodes, and a game that reaches a prepared
+    position by a different move order is still matched: walking the game is
+    a dict lookup per ply, and only an unprepared move pays for hashing the
+    resulting position to check for a transposition.
+    """
+
+    def __init__(self) -> None:
+        self.positions: Dict[int, PositionMoves] = {}
+
+    def __len__(self) -> int:
+        """Number of distinct positions in the repertoire."""
+        return len(self.positions)
+
+    def add_move_sequence(self, board: chess.Board, moves: List[chess.Move]) -> None:
+        """Adds a single, linear sequence of moves to the graph."""
+        temp_board = board.copy(stack=False)
+        key = chess.polyglot.zobrist_hash(temp_board)
+        self.positions.setdefault(key, {})
+
+        for move in moves:
+            uci = move.uci()
+            edge = self.positions[key].get(uci)
+            if edge is not None:
+                temp_board.push(move)
+                key = edge[1]
+                continue
+
+            move_san = temp_board.san(move)
+            temp_board.push(move)
+            child_key = chess.polyglot.zobrist_hash(temp_board)
+            logger.debug(f"[Graph] Adding new edge: {move_san} (ply {temp_board.ply()}) at UCI {uci}")
+            self.positions[key][uci] = (move_san, child_key)
+            self.positions.setdefault(child_key, {})
+            key = child_key
+
+    def add_study_chapter(self, chapter: chess.pgn.Game) -> None:
+        logger.info(f"[Graph] Processing chapter starting from FEN: {chapter.headers.get('FEN', 'startpos')}")
+        board = chapter.board()
+
+        sequences = list(walk_pgn_variations(chapter))
+        logger.info(f"[Graph] Found {len(sequences)} move sequences in chapter.")
+
+        for move_sequence in sequences:
+            self.add_move_sequence(board, move_sequence)
+
+    def root_moves(self) -> List[Tuple[str, Optional[str]]]:
+        """Returns the (UCI, SAN) pairs prepared from the standard starting position."""
+        return self._expected_moves(chess.polyglot.zobrist_hash(chess.Board()))
+
+    def _root_node(self, board: chess.Board) -> int:
+        return chess.polyglot.zobrist_hash(board)
+
+    def _child_node(self, node: int, move: chess.Move) -> Optional[int]:
+        edge = self.positions.get(node, {}).get(move.uci())
+        return edge[1] if edge is not None else None
+
+    def _expected_moves(self, node: int) -> List[Tuple[str, Optional[str]]]:
+        return [(uci, san) for uci, (san, _) in self.positions.get(node, {}).items()]
+
+    # max_depth stays None: a transposition can bring a game back into the
+    # repertoire at any ply, so there is no ply after which it cannot deviate.
+
+    def _transposed_node(self, board: chess.Board, move: chess.Move) -> Optional[int]:
+        board.push(move)
+        key = chess.polyglot.zobrist_hash(board)
+        board.pop()
+        return key if key in self.positions else None
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for find_deviation over a corpus of synthetic games.
+
+Builds a random opening repertoire, then generates games that follow it for
+a while before either deviating from it (an unprepared move where the
+repertoire has replies) or running past the end of the book, and continue
+with random moves up to --plies. Reports the mean time per game for each
+trie engine, split by games that deviate and games that do not, so the cost
+of the in-book walk and the cost of building a DeviationResult show up
+separately.
+
+For comparison it also times the old way of recovering the previous position
+FEN for each deviating game: exporting the game with str() and replaying it
+through chess_utils.calculate_previous_position_fen.
+
+Usage:
+    python scripts/bench_find_deviation.py [--games 10000] [--plies 80] [--seed 11]
+"""
+
+import argparse
+import logging
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import chess
+import chess.pgn
+
+# Make the flat backend modules importable when run from anywhere.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chess_utils import calculate_previous_position_fen  # noqa: E402
+from repertoire_trie import CompactRepertoireTrie, RepertoireGraph, RepertoireTrie  # noqa: E402
+
+USERNAME = "bench_user"
+
+# Opening tree: UCI path (space separated) -> prepared replies
+Tree = Dict[str, List[chess.Move]]
+
+
+def synthetic_repertoire(rng: random.Random, depth: int) -> Tree:
+    """A random opening tree: three candidate moves at the root, mostly single replies deeper down."""
+    tree: Tree = {}
+    frontier: List[Tuple[str, chess.Board]] = [("", chess.Board())]
+    while frontier:
+        path, board = frontier.pop()
+        if board.ply() >= depth:
+            continue
+        legal = sorted(board.legal_moves, key=lambda m: m.uci())
+        branching = 3 if board.ply() < 2 else rng.choice([1, 1, 1, 2])
+        replies = rng.sample(legal, min(branching, len(legal)))
+        tree[path] = replies
+        for move in replies:
+            child = board.copy(stack=False)
+            child.push(move)
+            frontier.append((f"{path} {move.uci()}".strip(), child))
+    return tree
+
+
+def synthetic_game(rng: random.Random, tree: Tree, plies: int, deviate: bool) -> chess.pgn.Game:
+    """Follows the repertoire for a random number of plies, then deviates or leaves book, then plays randomly."""
+    board = chess.Board()
+    path = ""
+    book_plies = rng.randint(2, 16)
+    in_book = True
+    while board.ply() < plies and not board.is_game_over():
+        replies = tree.get(path, []) if in_book else []
+        if replies and (board.ply() < book_plies or not deviate):
+            move = rng.choice(replies)
+        else:
+            legal = list(board.legal_moves)
+            move = rng.choice([m for m in legal if m not in replies] or legal)
+            in_book = False
+        path = f"{path} {move.uci()}".strip()
+        board.push(move)
+
+    game = chess.pgn.Game.from_board(board)
+    game.headers["White"] = USERNAME if rng.random() < 0.5 else "opponent"
+    game.headers["Black"] = "opponent" if game.headers["White"] == USERNAME else USERNAME
+    return game
+
+
+def build(engine: Any, tree: Tree) -> Any:
+    start = chess.Board()
+    for path in tree:
+        for reply in tree[path]:
+            moves = [chess.Move.from_uci(uci) for uci in path.split()] + [reply]
+            engine.add_move_sequence(start, moves)
+    if isinstance(engine, CompactRepertoireTrie):
+        len(engine)  # fold the staging tree into the arrays
+    return engine
+
+
+def time_per_game(engine: Any, games: List[chess.pgn.Game]) -> Tuple[float, float, int]:
+    """Mean microseconds per game for deviating and non-deviating games, and the number that deviate."""
+    deviating: List[float] = []
+    in_book: List[float] = []
+    for game in games:
+        started = time.perf_counter()
+        deviation = engine.find_deviation(game, USERNAME)
+        elapsed = (time.perf_counter() - started) * 1e6
+        (in_book if deviation is None else deviating).append(elapsed)
+    return (
+        statistics.mean(deviating) if deviating else 0.0,
+        statistics.mean(in_book) if in_book else 0.0,
+        len(deviating),
+    )
+
+
+def time_export_and_replay(engine: Any, games: List[chess.pgn.Game]) -> float:
+    """Mean microseconds per deviating game spent on str(game) + calculate_previous_position_fen."""
+    samples = []
+    for game in games:
+        deviation = engine.find_deviation(game, USERNAME)
+        if deviation is None:
+            continue
+        started = time.perf_counter()
+        calculate_previous_position_fen(str(game), deviation.move_number, deviation.player_color)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.mean(samples) if samples else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--plies", type=int, default=80, help="Length of each synthetic game")
+    parser.add_argument("--depth", type=int, default=16, help="Depth of the synthetic repertoire in plies")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    rng = random.Random(args.seed)
+    tree = synthetic_repertoire(rng, args.depth)
+    games = [synthetic_game(rng, tree, args.plies, deviate=rng.random() < 0.7) for _ in range(args.games)]
+    engines = [
+        ("RepertoireTrie", build(RepertoireTrie(), tree)),
+        ("CompactRepertoireTrie", build(CompactRepertoireTrie(), tree)),
+        ("RepertoireGraph", build(RepertoireGraph(), tree)),
+    ]
+
+    print(f"{len(games)} games of up to {args.plies} plies against a {len(tree)}-position repertoire")
+    print(f"{'µs per game':<24}{'deviating':>12}{'in book':>12}{'all':>12}")
+    for name, engine in engines:
+        deviating_us, in_book_us, deviating_count = time_per_game(engine, games)
+        overall = (deviating_us * deviating_count + in_book_us * (len(games) - deviating_count)) / len(games)
+        print(f"{name:<24}{deviating_us:>12.1f}{in_book_us:>12.1f}{overall:>12.1f}")
+    print(
+        f"str(game) + calculate_previous_position_fen: "
+        f"{time_export_and_replay(engines[1][1], games):.1f} µs per deviating game"
+    )
+
+
+if __name__ == "__main__":
+    main()
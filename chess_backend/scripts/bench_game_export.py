@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Times the per-game fetch path (get_last_game_ids + one get_game_data_by_id
+per game) against the single streamed bulk export (stream_user_games) using a
+local fake Lichess server with a fixed per-request latency.
+
+The Lichess rate limiter is disabled while timing; the queueing it adds in
+production (requests beyond the burst wait one token interval each) is
+reported separately from the request counts.
+
+Usage:
+    python scripts/bench_game_export.py [--games 100] [--latency-ms 30]
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import chess
+import chess.pgn
+
+# Make the flat backend modules importable when run from anywhere.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import lichess_api  # noqa: E402
+import pgn_utils  # noqa: E402
+import rate_limit  # noqa: E402
+
+
+def synthetic_games(count: int, seed: int = 11) -> Dict[str, Dict[str, object]]:
+    rng = random.Random(seed)
+    games: Dict[str, Dict[str, object]] = {}
+    for i in range(count):
+        board = chess.Board()
+        game = chess.pgn.Game()
+        game.headers["Site"] = f"https://lichess.org/g{i:07d}"
+        game.headers["White"] = "bench_user" if i % 2 == 0 else "opponent"
+        game.headers["Black"] = "opponent" if i % 2 == 0 else "bench_user"
+        node: chess.pgn.GameNode = game
+        for _ in range(60):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            node = node.add_variation(move)
+            board.push(move)
+        games[f"g{i:07d}"] = {"id": f"g{i:07d}", "pgn": str(game), "opening": {"name": "Random Opening"}}
+    return games
+
+
+def make_handler(games: Dict[str, Dict[str, object]], latency: float, counter: List[int]) -> type:
+    ordered = list(games.values())
+
+    class FakeLichess(BaseHTTPRequestHandler):
+        def log_message(self, format: str, *args: object) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            counter[0] += 1
+            time.sleep(latency)
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path.startswith("/api/games/user/"):
+                limit = int(query.get("max", ["10"])[0])
+                with_pgn = query.get("pgnInJson", ["false"])[0] == "true"
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for game in ordered[:limit]:
+                    record = game if with_pgn else {"id": game["id"]}
+                    self.wfile.write(json.dumps(record).encode() + b"\n")
+                    self.wfile.flush()
+            elif url.path.startswith("/game/export/"):
+                body = json.dumps(games[url.path.rsplit("/", 1)[1]]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_response(404)
+                self.end_headers()
+
+    return FakeLichess
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Simulated round-trip time per request")
+    args = parser.parse_args()
+
+    counter = [0]
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), make_handler(synthetic_games(args.games), args.latency_ms / 1000, counter)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    lichess_api.LICHESS_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    limiter = rate_limit.lichess
+    rate_limit.lichess = rate_limit.RateLimiter(rate=1e9, burst=1_000_000)
+
+    counter[0] = 0
+    started = time.perf_counter()
+    parsed = 0
+    for game_id in lichess_api.get_last_game_ids("bench_user", args.games):
+        data = lichess_api.get_game_data_by_id(game_id)
+        if data:
+            pgn_utils.pgn_string_to_game(str(data["pgn"]))
+            parsed += 1
+    per_game_time, per_game_requests = time.perf_counter() - started, counter[0]
+
+    counter[0] = 0
+    started = time.perf_counter()
+    first_game_at = None
+    streamed = 0
+    for data in lichess_api.stream_user_games("bench_user", args.games):
+        if first_game_at is None:
+            first_game_at = time.perf_counter() - started
+        pgn_utils.pgn_string_to_game(str(data["pgn"]))
+        streamed += 1
+    bulk_time, bulk_requests = time.perf_counter() - started, counter[0]
+    server.shutdown()
+
+    def limiter_wait(requests: int) -> float:
+        return max(0, requests - limiter.burst) / limiter.rate
+
+    print(f"{args.games} games, {args.latency_ms:.0f} ms simulated latency per request")
+    print(f"{'path':<12}{'games':>7}{'requests':>10}{'wall s':>9}{'+ limiter s':>13}")
+    print(
+        f"{'per-game':<12}{parsed:>7}{per_game_requests:>10}{per_game_time:>9.2f}{limiter_wait(per_game_requests):>13.1f}"
+    )
+    print(f"{'bulk':<12}{streamed:>7}{bulk_requests:>10}{bulk_time:>9.2f}{limiter_wait(bulk_requests):>13.1f}")
+    print(f"Bulk stream delivered its first game after {1000 * (first_game_at or 0):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Measures what the shared, pooled HTTP clients save over opening a new client
+per request, against a local HTTPS stand-in for Lichess.
+
+The stand-in server uses a throwaway self-signed certificate and counts the
+TLS connections it accepts, so the output shows handshakes as well as wall
+time. ``--handshake-delay-ms`` adds a fixed pause to every new connection to
+approximate the extra round trips a real TLS handshake to lichess.org costs;
+over loopback the handshake itself is only CPU.
+
+Usage:
+    python scripts/bench_http_pool.py [--requests 200] [--handshake-delay-ms 20]
+"""
+
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import socket
+import ssl
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, List, Tuple
+
+import httpx
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+# Make the flat backend modules importable when run from anywhere.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import http_clients  # noqa: E402
+
+BODY = b'{"id": "abcd1234", "username": "bench_user"}'
+
+
+def self_signed_cert(directory: Path) -> Tuple[Path, Path]:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(hours=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = directory / "cert.pem", directory / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(
+        key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    )
+    return cert_path, key_path
+
+
+class FakeLichess(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def do_GET(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class CountingTLSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, context: ssl.SSLContext, handshake_delay: float) -> None:
+        super().__init__(("127.0.0.1", 0), FakeLichess)
+        self.context = context
+        self.handshake_delay = handshake_delay
+        self.connections = 0
+
+    def get_request(self) -> Tuple[socket.socket, Any]:
+        sock, addr = super().get_request()
+        self.connections += 1
+        return self.context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False), addr
+
+    def finish_request(self, request: Any, client_address: Any) -> None:
+        time.sleep(self.handshake_delay)
+        request.do_handshake()
+        super().finish_request(request, client_address)
+
+
+def run_sync(url: str, count: int, verify: ssl.SSLContext, pooled: bool) -> float:
+    start = time.perf_counter()
+    if pooled:
+        client = httpx.Client(verify=verify, limits=http_clients.pool_limits())
+        for _ in range(count):
+            client.get(url).raise_for_status()
+        client.close()
+    else:
+        for _ in range(count):
+            with httpx.Client(verify=verify) as client:
+                client.get(url).raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run_async(url: str, count: int, concurrency: int, verify: ssl.SSLContext, pooled: bool) -> float:
+    shared = httpx.AsyncClient(verify=verify, limits=http_clients.pool_limits()) if pooled else None
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with semaphore:
+            if shared is not None:
+                (await shared.get(url)).raise_for_status()
+            else:
+                async with httpx.AsyncClient(verify=verify) as client:
+                    (await client.get(url)).raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(count)))
+    elapsed = time.perf_counter() - start
+    if shared is not None:
+        await shared.aclose()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10, help="In-flight requests for the async runs")
+    parser.add_argument("--handshake-delay-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert_path, key_path = self_signed_cert(Path(tmp))
+        server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        server_context.load_cert_chain(cert_path, key_path)
+        client_context = ssl.create_default_context(cafile=str(cert_path))
+
+    server = CountingTLSServer(server_context, args.handshake_delay_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"https://127.0.0.1:{server.server_address[1]}/api/account"
+
+    rows: List[Tuple[str, float, int]] = []
+    for label, pooled in (("new client per request", False), ("shared pooled client", True)):
+        before = server.connections
+        elapsed = run_sync(url, args.requests, client_context, pooled)
+        rows.append((f"sync  {label}", elapsed, server.connections - before))
+    for label, pooled in (("new client per request", False), ("shared pooled client", True)):
+        before = server.connections
+        elapsed = asyncio.run(run_async(url, args.requests, args.concurrency, client_context, pooled))
+        rows.append((f"async {label}", elapsed, server.connections - before))
+    server.shutdown()
+
+    print(f"{args.requests} GETs per run, {args.handshake_delay_ms:.0f} ms simulated handshake latency")
+    print(f"{'':32} {'total':>9} {'per req':>9} {'TLS handshakes':>15}")
+    for label, elapsed, handshakes in rows:
+        per_request_ms = elapsed / args.requests * 1000
+        print(f"{label:32} {elapsed:8.2f}s {per_request_ms:7.2f}ms {handshakes:>15}")
+
+
+if __name__ == "__main__":
+    main()
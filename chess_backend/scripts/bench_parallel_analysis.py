@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for the analysis process pool.
+
+Generates a corpus of clock-annotated games against a synthetic repertoire
+(see bench_find_deviation.py), then analyzes all of them inline and with
+parallel_analysis.analyze_games on 1, 2, 4 and 8 worker processes, reporting
+wall time, games per second and speedup over inline. Pool start-up is
+included in the timings, since a sync pays for it once per process lifetime.
+
+Usage:
+    python scripts/bench_parallel_analysis.py [--games 20000] [--workers 1 2 4 8] [--chunk-size 64]
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import chess.pgn
+
+# Make the flat backend modules importable when run from anywhere.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Keep per-deviation log lines out of the timings, in the worker processes too
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from bench_find_deviation import USERNAME, build, synthetic_game, synthetic_repertoire  # noqa: E402
+
+import parallel_analysis  # noqa: E402
+from repertoire_trie import CompactRepertoireTrie  # noqa: E402
+
+
+def lichess_pgn(game: chess.pgn.Game, rng: random.Random) -> str:
+    """Exports a game the way the Lichess API does, with a clock comment on every move."""
+    for node in game.mainline():
+        node.comment = f"[%clk 0:{rng.randint(0, 4):02d}:{rng.randint(0, 59):02d}]"
+    game.headers["Event"] = "Rated blitz game"
+    game.headers["TimeControl"] = "300+0"
+    return str(game)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=20_000)
+    parser.add_argument("--plies", type=int, default=80)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--chunk-size", type=int, default=parallel_analysis.ANALYSIS_CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    rng = random.Random(args.seed)
+    tree = synthetic_repertoire(rng, 16)
+    pgns: List[str] = [
+        lichess_pgn(synthetic_game(rng, tree, args.plies, deviate=rng.random() < 0.7), rng) for _ in range(args.games)
+    ]
+    white = build(CompactRepertoireTrie(), tree)
+    black = build(CompactRepertoireTrie(), tree)
+
+    started = time.perf_counter()
+    inline = [parallel_analysis.analyze_game(pgn, USERNAME, white, black) for pgn in pgns]
+    inline_seconds = time.perf_counter() - started
+
+    print(f"{len(pgns)} games, chunks of {args.chunk_size}, {os.cpu_count()} CPUs")
+    print(f"{'mode':<14}{'seconds':>10}{'games/s':>10}{'speedup':>10}")
+    print(f"{'inline':<14}{inline_seconds:>10.2f}{len(pgns) / inline_seconds:>10.0f}{1.0:>10.2f}")
+    for workers in args.workers:
+        parallel_analysis.ANALYSIS_PROCESSES = workers
+        started = time.perf_counter()
+        pooled = list(parallel_analysis.analyze_games(pgns, USERNAME, white, black, chunk_size=args.chunk_size))
+        seconds = time.perf_counter() - started
+        parallel_analysis.shutdown()
+        assert pooled == inline, "pooled results differ from inline analysis"
+        label = f"{workers} process" + ("es" if workers > 1 else "")
+        print(f"{label:<14}{seconds:>10.2f}{len(pgns) / seconds:>10.0f}{inline_seconds / seconds:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Parse throughput of pgn_utils.read_mainline against chess.pgn.read_game.
+
+Generates clock-annotated games in the format of Lichess exports (see
+bench_parallel_analysis.py) and reports games per second for:
+
+- parsing only: chess.pgn.read_game vs read_mainline plus resolving every
+  SAN to a move, which is what read_game does while building its tree;
+- parsing plus find_deviation against a synthetic repertoire, the work
+  analysis does per game, and parallel_analysis.analyze_game, which only
+  reads as many plies as the repertoire is deep.
+
+Usage:
+    python scripts/bench_pgn_parse.py [--games 5000] [--plies 80] [--seed 11]
+
+Use --plies 240 to see how analysis cost tracks repertoire depth rather than
+game length.
+"""
+
+import argparse
+import io
+import logging
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import chess.pgn
+
+# Make the flat backend modules importable when run from anywhere.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_find_deviation import USERNAME, build, synthetic_game, synthetic_repertoire  # noqa: E402
+from bench_parallel_analysis import lichess_pgn  # noqa: E402
+
+import parallel_analysis  # noqa: E402
+import pgn_utils  # noqa: E402
+from repertoire_trie import CompactRepertoireTrie  # noqa: E402
+
+
+def games_per_second(pgns: List[str], work: Callable[[str], object]) -> float:
+    started = time.perf_counter()
+    for pgn in pgns:
+        work(pgn)
+    return len(pgns) / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=5_000)
+    parser.add_argument("--plies", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    rng = random.Random(args.seed)
+    tree = synthetic_repertoire(rng, 16)
+    pgns = [
+        lichess_pgn(synthetic_game(rng, tree, args.plies, deviate=rng.random() < 0.7), rng) for _ in range(args.games)
+    ]
+    trie = build(CompactRepertoireTrie(), tree)
+
+    for pgn in pgns[:200]:
+        full = chess.pgn.read_game(io.StringIO(pgn))
+        assert full is not None
+        mainline = pgn_utils.read_mainline(pgn)
+        assert list(mainline.mainline_moves()) == list(full.mainline_moves())
+        assert trie.find_deviation(mainline, USERNAME) == trie.find_deviation(full, USERNAME)
+
+    rows = [
+        ("chess.pgn.read_game", lambda pgn: chess.pgn.read_game(io.StringIO(pgn))),
+        ("read_mainline (tokens only)", pgn_utils.read_mainline),
+        ("read_mainline + moves", lambda pgn: list(pgn_utils.read_mainline(pgn).mainline_moves())),
+        ("read_game + find_deviation", lambda pgn: trie.find_deviation(pgn_utils.pgn_string_to_game(pgn), USERNAME)),
+        ("read_mainline + find_deviation", lambda pgn: trie.find_deviation(pgn_utils.read_mainline(pgn), USERNAME)),
+        ("analyze_game (depth-bounded)", lambda pgn: parallel_analysis.analyze_game(pgn, USERNAME, trie, trie)),
+    ]
+    print(f"{len(pgns)} clock-annotated games of up to {args.plies} plies")
+    print(f"{'':<34}{'games/s':>10}")
+    for name, work in rows:
+        print(f"{name:<34}{games_per_second(pgns, work):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
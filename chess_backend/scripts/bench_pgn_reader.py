@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Memory and throughput of pgn_utils.iter_pgn_games on a large PGN file.
+
+Writes a multi-game file of clock-annotated games (see
+bench_parallel_analysis.py) to a temporary directory, then splits it into
+games in three ways, reporting games per second, MB per second and the peak
+Python heap size traced during a second pass:
+
+- the old pgn_to_pgn_list approach: read the whole file and split on
+  three newlines;
+- iter_pgn_games over the file object;
+- iter_pgn_games over an mmap of the file.
+
+Games are only split, not parsed, so the numbers show the reader itself.
+
+Usage:
+    python scripts/bench_pgn_reader.py [--megabytes 200] [--seed 11]
+"""
+
+import argparse
+import logging
+import mmap
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Iterable
+
+# Make the flat backend modules importable when run from anywhere.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_find_deviation import synthetic_game, synthetic_repertoire  # noqa: E402
+from bench_parallel_analysis import lichess_pgn  # noqa: E402
+
+import pgn_utils  # noqa: E402
+
+
+def write_corpus(path: Path, megabytes: int, rng: random.Random) -> None:
+    """Writes distinct games, repeated until the file reaches ``megabytes``."""
+    tree = synthetic_repertoire(rng, 16)
+    games = [lichess_pgn(synthetic_game(rng, tree, 80, deviate=True), rng) for _ in range(500)]
+    block = ("\n\n\n".join(games) + "\n\n\n").encode("utf-8")
+    with open(path, "wb") as f:
+        for _ in range(max(1, megabytes * 1024 * 1024 // len(block))):
+            f.write(block)
+
+
+def measure(name: str, size: int, split: Callable[[], Iterable[object]]) -> None:
+    """Times one pass, then traces a second one for the peak heap size (tracing slows allocations)."""
+    started = time.perf_counter()
+    count = sum(1 for _ in split())
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    sum(1 for _ in split())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<28}{count / seconds:>12.0f}{size / seconds / 1e6:>10.1f}{peak / 1e3:>12.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "games.pgn"
+        write_corpus(path, args.megabytes, random.Random(args.seed))
+        size = path.stat().st_size
+
+        print(f"{size / 1e6:.0f} MB of clock-annotated games")
+        print(f"{'':<28}{'games/s':>12}{'MB/s':>10}{'peak KB':>12}")
+        measure('split("\\n\\n\\n")', size, lambda: path.read_text(encoding="utf-8").strip().split("\n\n\n"))
+        with open(path, "rb") as f:
+            measure("iter_pgn_games(file)", size, lambda: pgn_utils.iter_pgn_games(f, start=f.seek(0)))
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            measure("iter_pgn_games(mmap)", size, lambda: pgn_utils.iter_pgn_games(mapped))
+
+
+if __name__ == "__main__":
+    main()
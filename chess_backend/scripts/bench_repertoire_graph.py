@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Compares RepertoireTrie (keyed by move path) with RepertoireGraph (keyed by
+Zobrist position hash) on a transposition-heavy repertoire: a Catalan/QGD
+setup where both sides reach the same structure by many move orders.
+
+Usage:
+    python scripts/bench_repertoire_graph.py [--study-fraction 0.25] [--seed 3]
+"""
+
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from itertools import permutations
+from pathlib import Path
+from typing import Any, Callable, List, Tuple
+
+import chess
+import chess.pgn
+
+# Make the flat backend modules importable when run from anywhere.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from repertoire_trie import RepertoireGraph, RepertoireTrie  # noqa: E402
+
+WHITE_SETUP = ["d4", "c4", "Nf3", "g3", "Nc3"]
+BLACK_SETUP = ["Nf6", "e6", "d5", "Be7", "c6"]
+
+
+def move_orders() -> List[List[chess.Move]]:
+    """Every legal interleaving of the two setups, one move list per order."""
+    lines = []
+    for white_order in permutations(WHITE_SETUP):
+        for black_order in permutations(BLACK_SETUP):
+            board = chess.Board()
+            line = []
+            try:
+                for white_san, black_san in zip(white_order, black_order):
+                    for san in (white_san, black_san):
+                        move = board.parse_san(san)
+                        board.push(move)
+                        line.append(move)
+            except ValueError:
+                continue
+            lines.append(line)
+    return lines
+
+
+def count_trie_nodes(trie: RepertoireTrie) -> int:
+    stack = [trie.root]
+    count = 0
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children.values())
+    return count
+
+
+def measure(build: Callable[[], Any]) -> Tuple[Any, int, float]:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, elapsed
+
+
+def to_game(line: List[chess.Move]) -> chess.pgn.Game:
+    game = chess.pgn.Game()
+    game.headers["White"] = "opponent"
+    game.headers["Black"] = "user_test"
+    game.add_line(line)
+    return game
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--study-fraction", type=float, default=0.25, help="Share of move orders written down in the study"
+    )
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    lines = move_orders()
+    study_lines = rng.sample(lines, max(1, int(len(lines) * args.study_fraction)))
+    start = chess.Board()
+
+    def build_trie() -> RepertoireTrie:
+        trie = RepertoireTrie()
+        for line in study_lines:
+            trie.add_move_sequence(start, line)
+        return trie
+
+    def build_graph() -> RepertoireGraph:
+        graph = RepertoireGraph()
+        for line in study_lines:
+            graph.add_move_sequence(start, line)
+        return graph
+
+    trie, trie_bytes, trie_build = measure(build_trie)
+    graph, graph_bytes, graph_build = measure(build_graph)
+
+    games = [to_game(line) for line in lines]
+    results = {}
+    for name, engine in (("RepertoireTrie", trie), ("RepertoireGraph", graph)):
+        started = time.perf_counter()
+        flagged = sum(engine.find_deviation(game, "user_test") is not None for game in games)
+        results[name] = (flagged, (time.perf_counter() - started) / len(games) * 1e6)
+
+    print(f"Study: {len(study_lines)} of {len(lines)} move orders; {len(games)} games, all in book by position")
+    print(f"{'engine':<18}{'nodes':>8}{'bytes':>12}{'build ms':>10}{'flagged':>9}{'us/game':>9}")
+    rows = (
+        ("RepertoireTrie", count_trie_nodes(trie), trie_bytes, trie_build),
+        ("RepertoireGraph", len(graph), graph_bytes, graph_build),
+    )
+    for name, nodes, nbytes, build in rows:
+        flagged, per_game = results[name]
+        print(f"{name:<18}{nodes:>8}{nbytes:>12,}{build * 1000:>10.1f}{flagged:>9}{per_game:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Memory comparison between RepertoireTrie (one Python object + dict per node)
+and CompactRepertoireTrie (flat arrays) on a synthetic repertoire.
+
+Usage:
+    python scripts/bench_trie_memory.py [--nodes 50000] [--seed 7]
+"""
+
+import argparse
+import gc
+import random
+import sys
+import tracemalloc
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, List
+
+import chess
+
+# Make the flat backend modules importable when run from anywhere.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from repertoire_trie import CompactRepertoireTrie, RepertoireTrie  # noqa: E402
+
+
+def synthetic_lines(node_target: int, seed: int) -> List[List[chess.Move]]:
+    """
+    Grows a random opening tree breadth-first until it holds ``node_target``
+    moves and returns one move list per leaf.
+    """
+    rng = random.Random(seed)
+    frontier: Deque[List[chess.Move]] = deque([[]])
+    leaves: List[List[chess.Move]] = []
+    nodes = 0
+
+    while frontier and nodes < node_target:
+        line = frontier.popleft()
+        board = chess.Board()
+        for move in line:
+            board.push(move)
+        legal = sorted(board.legal_moves, key=lambda m: m.uci())
+        # Wide near the root, mostly single replies deeper down, like a real study.
+        branching = 3 if len(line) < 4 else rng.choice([1, 1, 1, 2])
+        children = rng.sample(legal, min(branching, len(legal))) if legal else []
+        if not children:
+            leaves.append(line)
+            continue
+        for move in children:
+            if nodes >= node_target:
+                leaves.append(line)
+                break
+            nodes += 1
+            frontier.append(line + [move])
+
+    return leaves + list(frontier)
+
+
+def measure(build: Callable[[], Any]) -> tuple[Any, int]:
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=50_000, help="Number of moves in the synthetic repertoire")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    lines = synthetic_lines(args.nodes, args.seed)
+    start = chess.Board()
+
+    def build_node_trie() -> RepertoireTrie:
+        trie = RepertoireTrie()
+        for line in lines:
+            trie.add_move_sequence(start, line)
+        return trie
+
+    def build_compact_trie() -> CompactRepertoireTrie:
+        trie = CompactRepertoireTrie()
+        for line in lines:
+            trie.add_move_sequence(start, line)
+        len(trie)  # fold the staging tree into the arrays
+        return trie
+
+    _, node_bytes = measure(build_node_trie)
+    compact, compact_bytes = measure(build_compact_trie)
+    node_count = len(compact)
+
+    print(f"Synthetic repertoire: {node_count} nodes ({len(lines)} lines)")
+    print(f"{'engine':<24}{'total bytes':>14}{'bytes/node':>12}")
+    print(f"{'RepertoireTrie':<24}{node_bytes:>14,}{node_bytes / node_count:>12.1f}")
+    print(f"{'CompactRepertoireTrie':<24}{compact_bytes:>14,}{compact_bytes / node_count:>12.1f}")
+    print(f"Reduction: {node_bytes / compact_bytes:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Load test: /health latency while 20 analyses run concurrently.
+
+Starts the real app under uvicorn (one worker) with perform_game_analysis and
+the Supabase user lookup replaced by stand-ins that block the calling thread
+the way the real ones do: mostly waiting on the network, with some PGN
+parsing in between. While --analyses requests to /api/analyze_games are in
+flight, /health is probed every --probe-ms and its latency recorded.
+
+For comparison the same load is sent to a route that calls the analysis
+inline on the event loop, which is what /api/analyze_games did before it was
+moved onto the bounded analysis pool.
+
+Usage:
+    python scripts/load_test_analyze.py [--analyses 20] [--analysis-seconds 2]
+"""
+
+import argparse
+import asyncio
+import socket
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+import chess.pgn
+import httpx
+import uvicorn
+
+# Make the flat backend modules importable when run from anywhere.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main as backend  # noqa: E402
+import pgn_utils  # noqa: E402
+from deviation_result import DeviationResult  # noqa: E402
+
+SAMPLE_PGN = str(chess.pgn.Game.from_board(chess.Board()))
+ANALYSIS_SECONDS = 2.0
+
+
+def fake_analysis(**kwargs: Any) -> List[Tuple[Optional[DeviationResult], str]]:
+    """Blocks like the real pipeline: network waits interleaved with PGN parsing."""
+    deadline = time.perf_counter() + ANALYSIS_SECONDS
+    while time.perf_counter() < deadline:
+        time.sleep(0.05)  # waiting on Lichess / Supabase
+        pgn_utils.pgn_string_to_game(SAMPLE_PGN)
+    return []
+
+
+def add_inline_route() -> None:
+    @backend.app.post("/bench/analyze_inline")
+    async def analyze_inline(request: backend.AnalysisRequest) -> dict:
+        fake_analysis()
+        return {"message": "done"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+async def measure(base_url: str, path: str, analyses: int, probe_interval: float) -> List[float]:
+    payload = {
+        "username": "bench_user",
+        "study_url_white": "https://lichess.org/study/white123",
+        "study_url_black": "https://lichess.org/study/black123",
+    }
+    limits = httpx.Limits(max_connections=analyses + 5)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        load = [asyncio.create_task(client.post(path, json=payload)) for _ in range(analyses)]
+        latencies: List[float] = []
+        await asyncio.sleep(0.1)  # let the analyses start
+        while not all(task.done() for task in load):
+            start = time.perf_counter()
+            (await client.get("/health")).raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(probe_interval)
+        for response in await asyncio.gather(*load):
+            response.raise_for_status()
+    return latencies
+
+
+async def idle_baseline(base_url: str, probes: int) -> List[float]:
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        latencies = []
+        for _ in range(probes):
+            start = time.perf_counter()
+            (await client.get("/health")).raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+
+def summarize(label: str, latencies: List[float]) -> None:
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{label:<28}{len(latencies):>7}{statistics.median(latencies):>10.1f}{p99:>10.1f}{max(latencies):>10.1f}")
+
+
+def main() -> None:
+    global ANALYSIS_SECONDS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--analyses", type=int, default=20)
+    parser.add_argument("--analysis-seconds", type=float, default=2.0)
+    parser.add_argument("--probe-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    ANALYSIS_SECONDS = args.analysis_seconds
+
+    backend.perform_game_analysis = fake_analysis  # type: ignore[assignment]
+    backend.get_user_id_from_username = lambda username: "00000000-0000-0000-0000-000000000000"
+    add_inline_route()
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(backend.app, host="127.0.0.1", port=port, log_level="warning", workers=1))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    base_url = f"http://127.0.0.1:{port}"
+
+    probe = args.probe_ms / 1000
+    baseline = asyncio.run(idle_baseline(base_url, 50))
+    started = time.perf_counter()
+    pooled = asyncio.run(measure(base_url, "/api/analyze_games", args.analyses, probe))
+    pooled_wall = time.perf_counter() - started
+    started = time.perf_counter()
+    inline = asyncio.run(measure(base_url, "/bench/analyze_inline", args.analyses, probe))
+    inline_wall = time.perf_counter() - started
+    server.should_exit = True
+
+    print(
+        f"{args.analyses} concurrent analyses of {args.analysis_seconds:.1f}s each, "
+        f"{backend.workers.ANALYSIS_MAX_WORKERS} pool workers"
+    )
+    print(f"{'/health latency (ms)':<28}{'probes':>7}{'p50':>10}{'p99':>10}{'max':>10}")
+    summarize("idle", baseline)
+    summarize(f"analysis pool ({pooled_wall:.1f}s)", pooled)
+    summarize(f"inline on loop ({inline_wall:.1f}s)", inline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Duplicate-call suppression ("single flight").
+
+When several threads ask for the same expensive result at once, only the
+first actually computes it; the others wait and share its result (or its
+exception). Nothing is remembered once the call returns, so this sits in
+front of a cache rather than replacing one.
+
+SingleFlight coalesces blocking calls across threads; AsyncSingleFlight does
+the same for coroutines on one event loop.
+"""
+
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class _Call(Generic[V]):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[V] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(Generic[K, V]):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[K, _Call[V]] = {}
+
+    def do(self, key: K, fn: Callable[[], V]) -> V:
+        """Runs ``fn`` unless a call for ``key`` is already in flight, in which case waits for that one."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result  # type: ignore[return-value]
+
+
+class AsyncSingleFlight(Generic[K, V]):
+    def __init__(self) -> None:
+        self._calls: Dict[K, "asyncio.Future[V]"] = {}
+
+    async def do(self, key: K, fn: Callable[[], Awaitable[V]]) -> V:
+        """Awaits ``fn()`` unless a call for ``key`` is already in flight, in which case awaits that one."""
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = asyncio.ensure_future(fn())
+            call.add_done_callback(lambda _: self._calls.pop(key, None))
+        # Shielded so a caller that gives up (e.g. a closed connection) does not cancel the call for the others
+        return await asyncio.shield(call)
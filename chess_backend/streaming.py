@@ -0,0 +1,104 @@
+"""
+Helpers for consuming large line-delimited responses incrementally.
+
+``iter_ndjson`` decodes NDJSON one line at a time, so memory is bounded by
+the longest line rather than the whole response. ``bounded_prefetch`` lets a
+slow consumer overlap with the producer (e.g. analyze one game while the next
+ones download) without unbounded buffering: once ``maxsize`` items are
+waiting, the producer thread blocks, stops reading the socket, and TCP flow
+control pushes back on the server.
+"""
+
+import json
+import queue
+import threading
+from typing import Any, Dict, Generator, Iterable, Iterator, TypeVar
+
+from logging_config import setup_logging
+
+logger = setup_logging(__name__)
+
+T = TypeVar("T")
+
+# Lines longer than this are skipped rather than decoded; a Lichess game record is a few KB.
+MAX_NDJSON_LINE_CHARS = 1_000_000
+
+
+def iter_ndjson(lines: Iterable[str], max_line_chars: int = MAX_NDJSON_LINE_CHARS) -> Iterator[Dict[str, Any]]:
+    """
+    Decodes NDJSON records lazily. Blank lines (Lichess sends keep-alive
+    newlines on long exports), oversized lines and malformed lines are
+    skipped with a warning instead of aborting the whole stream.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        if len(line) > max_line_chars:
+            logger.warning(f"[NDJSON] Skipping line {line_number}: {len(line)} chars exceeds {max_line_chars}")
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.warning(f"[NDJSON] Skipping malformed line {line_number}: {e}")
+            continue
+        if isinstance(record, dict):
+            yield record
+
+
+class _Failure:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+_DONE = object()
+
+
+def bounded_prefetch(items: Iterable[T], maxsize: int) -> Generator[T, None, None]:
+    """
+    Iterates ``items`` in a background thread, keeping at most ``maxsize``
+    items buffered ahead of the consumer. Exceptions raised by the producer
+    are re-raised in the consumer. Closing the returned generator early stops
+    the producer.
+    """
+    buffer: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def offer(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    iterator = iter(items)
+
+    def produce() -> None:
+        try:
+            for item in iterator:
+                if not offer(item):
+                    return
+            offer(_DONE)
+        except BaseException as e:
+            # Hand the error to the consumer thread instead of losing it here.
+            offer(_Failure(e))
+        finally:
+            # Release whatever the source holds open (e.g. a streaming HTTP response).
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    producer = threading.Thread(target=produce, name="bounded-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        producer.join(timeout=1.0)
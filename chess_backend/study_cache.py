@@ -0,0 +1,41 @@
+"""
+In-process cache of fetched studies and their built repertoire tries.
+
+A user who re-syncs a few minutes later almost always has the same studies,
+so the trie built for a study is kept in memory keyed by study ID. Entries
+live for STUDY_CACHE_TTL_SECONDS and are evicted least-recently-used once
+their estimated size exceeds STUDY_CACHE_MAX_BYTES. Each entry keeps the HTTP
+validators of the download it was built from, so an expired entry can be
+revalidated with a conditional request instead of being rebuilt.
+"""
+
+import os
+from dataclasses import dataclass
+
+from lichess_api import StudyValidators
+from repertoire_trie import CompactRepertoireTrie
+from ttl_cache import TTLCache
+
+STUDY_CACHE_TTL_SECONDS = float(os.getenv("STUDY_CACHE_TTL_SECONDS", "900"))
+STUDY_CACHE_MAX_BYTES = int(os.getenv("STUDY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Rough per-entry cost of the Python objects around the trie's node arrays.
+ENTRY_OVERHEAD_BYTES = 1024
+
+
+@dataclass
+class CachedStudy:
+    study_id: str
+    validators: StudyValidators
+    trie: CompactRepertoireTrie
+
+    @property
+    def nbytes(self) -> int:
+        return self.trie.nbytes + ENTRY_OVERHEAD_BYTES
+
+
+studies: TTLCache[str, CachedStudy] = TTLCache(
+    ttl_seconds=STUDY_CACHE_TTL_SECONDS,
+    max_bytes=STUDY_CACHE_MAX_BYTES,
+    sizeof=lambda study: study.nbytes,
+)
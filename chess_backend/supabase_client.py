@@ -22,14 +22,21 @@ Server -> Supabase Client -> Database
 - Study tracking
 """
 
+import base64
+import json
+import logging
 import os
 import re
-from datetime import datetime
-from typing import Any, Dict, Optional
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple, cast
 
 from dotenv import load_dotenv
 from supabase import Client, create_client
 
+from ttl_cache import TTLCache
+
 # Load environment variables only if not in test mode
 if not os.getenv("PYTEST_CURRENT_TEST"):
     load_dotenv()
@@ -39,6 +46,32 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
+# Maximum rows per multi-row upsert in DeviationWriter
+DEVIATION_WRITE_CHUNK_SIZE = int(os.getenv("DEVIATION_WRITE_CHUNK_SIZE", "100"))
+
+# Profile and study ID lookups rarely change, so they are cached. Misses ("not
+# found") are cached too, for a shorter time, so new sign-ups show up quickly.
+# Profiles and studies are written by the frontend, not by this backend, so
+# entries are never invalidated early: the TTLs bound how stale they can be.
+LOOKUP_CACHE_TTL_SECONDS = float(os.getenv("LOOKUP_CACHE_TTL_SECONDS", "300"))
+LOOKUP_NEGATIVE_TTL_SECONDS = float(os.getenv("LOOKUP_NEGATIVE_TTL_SECONDS", "30"))
+LOOKUP_CACHE_MAX_ENTRIES = int(os.getenv("LOOKUP_CACHE_MAX_ENTRIES", "10000"))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class _Lookup:
+    """A cached lookup result; ``value`` is None for a cached "not found"."""
+
+    value: Optional[str]
+
+
+user_ids: TTLCache[str, _Lookup] = TTLCache(ttl_seconds=LOOKUP_CACHE_TTL_SECONDS, max_entries=LOOKUP_CACHE_MAX_ENTRIES)
+study_ids: TTLCache[Tuple[str, str], _Lookup] = TTLCache(
+    ttl_seconds=LOOKUP_CACHE_TTL_SECONDS, max_entries=LOOKUP_CACHE_MAX_ENTRIES
+)
+
 # Global client instances (created lazily)
 _supabase_client: Optional[Client] = None
 _supabase_admin: Optional[Client] = None
@@ -113,7 +146,10 @@ def extract_game_id_from_pgn(pgn: str) -> Optional[str]:
 
 
 def extract_game_date_from_pgn(pgn: str) -> Optional[datetime]:
-    """Extract the game date from PGN headers and convert to datetime."""
+    """
+    Extract when the game was played from the PGN headers, as a UTC datetime.
+    UTCDate (with UTCTime, if present) is preferred over Date.
+    """
     # Try UTCDate first (more reliable), then fall back to Date
     date_match = re.search(r'\[UTCDate "([^"]+)"\]', pgn)
     if not date_match:
@@ -123,28 +159,46 @@ def extract_game_date_from_pgn(pgn: str) -> Optional[datetime]:
         date_str = date_match.group(1)
         try:
             # Parse date in format "YYYY.MM.DD"
-            return datetime.strptime(date_str, "%Y.%m.%d")
+            game_date = datetime.strptime(date_str, "%Y.%m.%d")
         except ValueError:
             try:
                 # Try alternative format "YYYY-MM-DD"
-                return datetime.strptime(date_str, "%Y-%m-%d")
+                game_date = datetime.strptime(date_str, "%Y-%m-%d")
             except ValueError:
                 return None
+        time_match = re.search(r'\[UTCTime "(\d{2}):(\d{2}):(\d{2})"\]', pgn)
+        if time_match:
+            hour, minute, second = (int(part) for part in time_match.groups())
+            game_date = game_date.replace(hour=hour, minute=minute, second=second)
+        return game_date.replace(tzinfo=timezone.utc)
     return None
 
 
 def get_user_id_from_username(username: str) -> str:
+    cached = user_ids.get(username)
+    if cached is not None:
+        if cached.value is None:
+            raise Exception(f"User not found for username: {username}")
+        return cached.value
+
     client = get_admin_client()
     response = client.table("profiles").select("id").eq("lichess_username", username).limit(1).execute()
     data = response.data
     if data and len(data) > 0:
         user_id: str = data[0]["id"]
+        user_ids.set(username, _Lookup(user_id))
         return user_id
+    # Remember unknown users briefly, so repeated requests for them skip the database too
+    user_ids.set(username, _Lookup(None), ttl_seconds=LOOKUP_NEGATIVE_TTL_SECONDS)
     raise Exception(f"User not found for username: {username}")
 
 
 def get_study_id_from_url(study_url: str, user_id: str) -> Optional[str]:
     """Get the study ID from the lichess_studies table based on study URL and user."""
+    cached = study_ids.get((study_url, user_id))
+    if cached is not None:
+        return cached.value
+
     client = get_admin_client()
     response = (
         client.table("lichess_studies")
@@ -156,27 +210,30 @@ def get_study_id_from_url(study_url: str, user_id: str) -> Optional[str]:
         .execute()
     )
     data = response.data
+    study_id = None
     if data and len(data) > 0:
-        study_id = data[0].get("id")
-        if isinstance(study_id, str):
-            return study_id
-    return None
+        found = data[0].get("id")
+        if isinstance(found, str):
+            study_id = found
+    study_ids.set(
+        (study_url, user_id), _Lookup(study_id), ttl_seconds=None if study_id else LOOKUP_NEGATIVE_TTL_SECONDS
+    )
+    return study_id
 
 
-def insert_deviation_to_db(deviation: Dict[str, Any], pgn: str, user_id: str, study_url: Optional[str] = None) -> None:
-    """Saves a deviation record to the database using user_id (UUID)."""
-    client = get_admin_client()
-    game_id = extract_game_id_from_pgn(pgn)
+def lookup_cache_stats() -> Dict[str, Dict[str, float]]:
+    """Hit, miss, eviction and expiry counters (plus hit rate) of the lookup caches."""
+    return {"user_ids": user_ids.stats.as_dict(), "study_ids": study_ids.stats.as_dict()}
 
-    # Get study_id if study_url is provided
-    study_id = None
-    if study_url:
-        study_id = get_study_id_from_url(study_url, user_id)
 
-    data = {
+def build_deviation_row(
+    deviation: Dict[str, Any], pgn: str, user_id: str, study_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Maps a deviation (DeviationResult dict plus opening_name) to an opening_deviations row."""
+    return {
         "user_id": user_id,
         "study_id": study_id,
-        "game_id": game_id,
+        "game_id": extract_game_id_from_pgn(pgn),
         "pgn": pgn,
         "opening_name": deviation.get("opening_name"),  # Still get opening_name
         "position_fen": deviation.get("board_fen"),
@@ -188,24 +245,186 @@ def insert_deviation_to_db(deviation: Dict[str, Any], pgn: str, user_id: str, st
         "reference_uci": deviation.get("reference_uci"),
         "first_deviator": deviation.get("first_deviator"),
         "previous_position_fen": deviation.get("previous_position_fen"),
+        # Sort key for get_deviations_for_user; games without a date header sort as if played now
+        "game_date": (extract_game_date_from_pgn(pgn) or datetime.now(timezone.utc)).isoformat(),
     }
+
+
+def insert_deviation_to_db(deviation: Dict[str, Any], pgn: str, user_id: str, study_url: Optional[str] = None) -> None:
+    """Saves a deviation record to the database using user_id (UUID)."""
+    client = get_admin_client()
+
+    # Get study_id if study_url is provided
+    study_id = None
+    if study_url:
+        study_id = get_study_id_from_url(study_url, user_id)
+
+    data = build_deviation_row(deviation, pgn, user_id, study_id)
     client.table("opening_deviations").upsert(data, on_conflict="game_id, user_id").execute()
 
 
+@dataclass
+class DeviationWriteFailure:
+    game_id: Optional[str]
+    error: str
+
+
+class DeviationWriter:
+    """
+    Collects the deviations found during one user's analysis and saves them
+    with multi-row upserts of up to ``chunk_size`` rows, instead of one study
+    lookup and one upsert per deviation.
+
+    Rows are upserted on (game_id, user_id) exactly as insert_deviation_to_db
+    does. A game added twice keeps only its last row, as sequential upserts
+    would leave it. Study IDs are looked up once per study URL. If a chunk is
+    rejected, its rows are retried one at a time so only the rows that
+    really fail are reported in ``failures``.
+
+    Use as a context manager, or call ``flush`` when done.
+    """
+
+    def __init__(self, user_id: str, chunk_size: int = DEVIATION_WRITE_CHUNK_SIZE) -> None:
+        self.user_id = user_id
+        self.chunk_size = max(1, chunk_size)
+        self.written = 0
+        self.failures: List[DeviationWriteFailure] = []
+        self._study_ids: Dict[str, Optional[str]] = {}
+        # Pending rows keyed by game ID; rows without one cannot conflict and are kept apart
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._pending_without_id: List[Dict[str, Any]] = []
+
+    def add(self, deviation: Dict[str, Any], pgn: str, study_url: Optional[str] = None) -> None:
+        row = build_deviation_row(deviation, pgn, self.user_id, self._study_id(study_url))
+        if row["game_id"] is None:
+            self._pending_without_id.append(row)
+        else:
+            self._pending.pop(row["game_id"], None)  # keep the latest row, at the end
+            self._pending[row["game_id"]] = row
+        if self.pending >= self.chunk_size:
+            self.flush()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending) + len(self._pending_without_id)
+
+    def flush(self) -> List[DeviationWriteFailure]:
+        """Writes every pending row. Returns the failures from this flush."""
+        rows = [*self._pending.values(), *self._pending_without_id]
+        self._pending.clear()
+        self._pending_without_id.clear()
+        failures: List[DeviationWriteFailure] = []
+        for start in range(0, len(rows), self.chunk_size):
+            failures.extend(self._write_chunk(rows[start : start + self.chunk_size]))
+        self.failures.extend(failures)
+        return failures
+
+    def _write_chunk(self, rows: List[Dict[str, Any]]) -> List[DeviationWriteFailure]:
+        table = get_admin_client().table("opening_deviations")
+        try:
+            table.upsert(rows, on_conflict="game_id, user_id").execute()
+            self.written += len(rows)
+            return []
+        except Exception as e:
+            if len(rows) == 1:
+                return [DeviationWriteFailure(game_id=rows[0]["game_id"], error=str(e))]
+            logger.warning(f"Upsert of {len(rows)} deviations failed ({e}); retrying row by row")
+
+        failures = []
+        for row in rows:
+            try:
+                table.upsert(row, on_conflict="game_id, user_id").execute()
+                self.written += 1
+            except Exception as e:
+                failures.append(DeviationWriteFailure(game_id=row["game_id"], error=str(e)))
+        return failures
+
+    def _study_id(self, study_url: Optional[str]) -> Optional[str]:
+        if not study_url:
+            return None
+        if study_url not in self._study_ids:
+            self._study_ids[study_url] = get_study_id_from_url(study_url, self.user_id)
+        return self._study_ids[study_url]
+
+    def __enter__(self) -> "DeviationWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.flush()
+
+
+def get_analysis_watermark(user_id: str) -> Optional[Dict[str, Any]]:
+    """Fetch the user's analysis watermark row, or None if they have never been analyzed."""
+    client = get_admin_client()
+    response = client.table("analysis_watermarks").select("*").eq("user_id", user_id).limit(1).execute()
+    data = response.data
+    if data and len(data) > 0:
+        return cast(Dict[str, Any], data[0])
+    return None
+
+
+def upsert_analysis_watermark(user_id: str, watermark: Dict[str, Any]) -> None:
+    """Store the user's analysis watermark, replacing any previous one."""
+    client = get_admin_client()
+    client.table("analysis_watermarks").upsert({"user_id": user_id, **watermark}, on_conflict="user_id").execute()
+
+
+# What the deviation list needs: everything but the full PGN, whose tag pairs come from
+# the pgn_headers computed column (see the 20250703000000 migration) instead
+DEVIATION_SUMMARY_COLUMNS = (
+    "id, user_id, study_id, game_id, game_date, detected_at, opening_name, position_fen, previous_position_fen, "
+    "expected_move, actual_move, move_number, color, first_deviator, review_status, pgn_headers"
+)
+
+
+@dataclass
+class DeviationPage:
+    rows: List[Dict[str, Any]]
+    # Pass back as ``cursor`` to fetch the following page; None on the last page
+    next_cursor: Optional[str]
+
+
+def encode_deviation_cursor(row: Dict[str, Any]) -> str:
+    """An opaque cursor pointing just past ``row`` in (game_date, id) descending order."""
+    return base64.urlsafe_b64encode(json.dumps([row["game_date"], row["id"]]).encode()).decode()
+
+
+def decode_deviation_cursor(cursor: str) -> Tuple[str, str]:
+    """Returns the (game_date, id) a cursor points past. Raises ValueError for a malformed cursor."""
+    try:
+        game_date, deviation_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        datetime.fromisoformat(str(game_date).replace("Z", "+00:00"))
+        deviation_id = uuid.UUID(str(deviation_id))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    return str(game_date), str(deviation_id)
+
+
 def get_deviations_for_user(
     user_id: str,
     limit: int = 10,
     offset: int = 0,
     review_status: Optional[str] = None,
     active_studies_only: bool = True,
-) -> list[Dict[str, Any]]:
+    cursor: Optional[str] = None,
+    summary: bool = False,
+) -> DeviationPage:
     """
-    Fetch deviations for ``user_id`` with pagination and an optional
-    ``review_status`` filter. If ``active_studies_only`` is ``True``, only
-    deviations from active studies are returned. Results are limited in the
-    database for scalability, but are ordered by the actual game date parsed
-    from the PGN after retrieval.
+    Fetch a page of deviations for ``user_id``, most recently played game
+    first, with an optional ``review_status`` filter. If
+    ``active_studies_only`` is ``True``, only deviations from active studies
+    are returned.
+
+    Ordering and paging happen in the database on (game_date, id), which the
+    (user_id, game_date) index serves directly. Pass the previous page's
+    ``next_cursor`` as ``cursor`` to continue (keyset pagination: each page
+    costs the same however deep it is); ``offset`` is still accepted for the
+    first page of older clients but is ignored when ``cursor`` is given.
+
+    With ``summary``, only DEVIATION_SUMMARY_COLUMNS are selected, so the
+    (often long) PGNs are not transferred at all.
     """
+    columns = DEVIATION_SUMMARY_COLUMNS if summary else "*"
     client = get_default_client()
 
     if active_studies_only:
@@ -217,36 +436,32 @@ def get_deviations_for_user(
 
         # If no active studies, return empty list
         if not active_study_ids:
-            return []
+            return DeviationPage(rows=[], next_cursor=None)
 
         # Query deviations that belong to active studies
-        query = client.table("opening_deviations").select("*").eq("user_id", user_id).in_("study_id", active_study_ids)
+        query = (
+            client.table("opening_deviations").select(columns).eq("user_id", user_id).in_("study_id", active_study_ids)
+        )
     else:
         # Query all deviations for the user
-        query = client.table("opening_deviations").select("*").eq("user_id", user_id)
+        query = client.table("opening_deviations").select(columns).eq("user_id", user_id)
 
     if review_status:
         query = query.eq("review_status", review_status)
 
-    response = query.order("detected_at", desc=True).range(offset, offset + limit - 1).execute()
-
-    deviations = response.data or []
-
-    def sort_key(dev: Dict[str, Any]) -> datetime:
-        game_date = extract_game_date_from_pgn(dev.get("pgn", ""))
-        if game_date:
-            return game_date
-        detected = dev.get("detected_at")
-        if detected:
-            try:
-                return datetime.fromisoformat(detected.replace("Z", "+00:00"))
-            except ValueError:
-                pass
-        return datetime(1900, 1, 1)
-
-    deviations.sort(key=sort_key, reverse=True)
-
-    return deviations
+    query = query.order("game_date", desc=True).order("id", desc=True)
+    if cursor is not None:
+        after_date, after_id = decode_deviation_cursor(cursor)
+        query = query.or_(f'game_date.lt."{after_date}",and(game_date.eq."{after_date}",id.lt.{after_id})')
+        offset = 0
+
+    # One extra row tells us whether there is a next page
+    response = query.range(offset, offset + limit).execute()
+    rows = cast(List[Dict[str, Any]], response.data or [])
+    if len(rows) <= limit:
+        return DeviationPage(rows=rows, next_cursor=None)
+    rows = rows[:limit]
+    return DeviationPage(rows=rows, next_cursor=encode_deviation_cursor(rows[-1]))
 
 
 def get_deviation_by_id(deviation_id: str) -> Optional[Dict[str, Any]]:
@@ -11,6 +11,7 @@ class OpeningDeviation(BaseModel):
     deviation_uci: Optional[str] = None
     expected_move: Optional[str] = None
     first_deviator: Optional[str] = None
+    game_date: Optional[str] = None
     game_id: Optional[str] = None
     id: Optional[str] = None
     move_number: Optional[int] = None
@@ -1,61 +1,72 @@
 # tests/test_analysis_service.py
 """Integration tests for analysis_service.py to ensure end-of-book scenarios are handled correctly."""
 
-from typing import Any, Dict, Generator, List
-from unittest.mock import patch
+import functools
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Tuple
+from unittest.mock import MagicMock, patch
 
 import pytest
 
-from analysis_service import perform_game_analysis
+import parallel_analysis
+import study_cache
+from analysis_service import AnalysisProgress, build_repertoire_trie, perform_game_analysis
 from deviation_result import DeviationResult
+from lichess_api import RefreshStatus, StudyRefresh, StudyValidators
+from supabase_client import DeviationWriteFailure, DeviationWriter
 
 
-class MockStudy:
-    """Mock Study class for testing."""
+def mock_study_pgn(study_id: str) -> str:
+    """Mock study PGNs with predefined chapters."""
+    if "white" in study_id.lower():
+        # White repertoire: 1. e4 e5 2. Nf3
+        return """[Event "White Repertoire"]
 
-    def __init__(self, chapters: List[Any]) -> None:
-        self.chapters = chapters
+1. e4 e5 2. Nf3 *"""
+    else:
+        # Black repertoire: 1... c5 2... d6
+        return """[Event "Black Repertoire"]
+[FEN "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"]
 
-    @classmethod
-    def fetch_url(cls, url: str) -> "MockStudy":
-        """Mock study fetching with predefined chapters."""
-        if "white" in url.lower():
-            # White repertoire: 1. e4 e5 2. Nf3
-            from pgn_utils import pgn_string_to_game
+1... c5 2. Nf3 d6 *"""
 
-            white_pgn = """[Event "White Repertoire"]
 
-1. e4 e5 2. Nf3 *"""
-            return cls([pgn_string_to_game(white_pgn)])
-        else:
-            # Black repertoire: 1... c5 2... d6
-            from pgn_utils import pgn_string_to_game
+def mock_refresh_study_pgn(study_id: str, validators: Optional[StudyValidators] = None) -> StudyRefresh:
+    """Mock study fetching: the study is unchanged whenever validators are sent."""
+    if validators is not None:
+        return StudyRefresh(status=RefreshStatus.UNCHANGED, validators=validators)
+    pgn = mock_study_pgn(study_id)
+    return StudyRefresh(status=RefreshStatus.UPDATED, validators=StudyValidators(etag=f'"{study_id}"'), pgn=pgn)
 
-            black_pgn = """[Event "Black Repertoire"]
-[FEN "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"]
 
-1... c5 2. Nf3 d6 *"""
-            return cls([pgn_string_to_game(black_pgn)])
+def export_stream(*games: Tuple[str, Dict[str, Any]]) -> Callable[..., Iterator[Dict[str, Any]]]:
+    """Fakes stream_user_games: every call streams the given (game ID, export record) pairs."""
+    return lambda *args, **kwargs: iter([{"id": game_id, **data} for game_id, data in games])
 
 
 @pytest.fixture
-def mock_dependencies() -> Generator[Dict[str, Any], None, None]:
+def mock_dependencies(tmp_path: Path) -> Generator[Dict[str, Any], None, None]:
     """Mock external dependencies for analysis service."""
     with (
-        patch("analysis_service.get_last_game_ids") as mock_game_ids,
-        patch("analysis_service.get_game_data_by_id") as mock_game_data,
-        patch("analysis_service.lichess_api.Study", MockStudy),
-        patch("analysis_service.insert_deviation_to_db") as mock_insert_db,
+        patch("analysis_service.stream_user_games") as mock_games,
+        patch("analysis_service.lichess_api.refresh_study_pgn", side_effect=mock_refresh_study_pgn),
+        patch("analysis_service.trie_cache.DEFAULT_CACHE_DIR", tmp_path),
+        patch("analysis_service.DeviationWriter") as mock_writer,
+        patch("watermarks.WATERMARK_DIR", tmp_path / "watermarks"),
+        patch("watermarks.supabase_client.get_analysis_watermark", side_effect=ConnectionError("offline")),
+        patch("watermarks.supabase_client.upsert_analysis_watermark", side_effect=ConnectionError("offline")),
     ):
-
-        yield {"game_ids": mock_game_ids, "game_data": mock_game_data, "insert_db": mock_insert_db}
+        study_cache.studies.clear()
+        mock_writer.return_value.failures = []
+        yield {"games": mock_games, "writer": mock_writer.return_value, "insert_db": mock_writer.return_value.add}
+        study_cache.studies.clear()
 
 
 def test_analysis_service_end_of_book_no_insertion(mock_dependencies: Dict[str, Any]) -> None:
     """Test that games continuing beyond prep don't get inserted into database."""
-    # Setup mock data
-    mock_dependencies["game_ids"].return_value = ["game123"]
-
     # Game that follows prep then continues beyond it
     game_data = {
         "pgn": """[Event "Test Game"]
@@ -65,7 +76,7 @@ def test_analysis_service_end_of_book_no_insertion(mock_dependencies: Dict[str,
 1. e4 e5 2. Nf3 Nc6 3. d4 exd4""",  # Continues beyond our prep (1. e4 e5 2. Nf3)
         "opening": {"name": "Italian Game"},
     }
-    mock_dependencies["game_data"].return_value = game_data
+    mock_dependencies["games"].side_effect = export_stream(("game123", game_data))
 
     # Run analysis
     results = perform_game_analysis(
@@ -87,9 +98,6 @@ def test_analysis_service_end_of_book_no_insertion(mock_dependencies: Dict[str,
 
 def test_analysis_service_true_deviation_gets_inserted(mock_dependencies: Dict[str, Any]) -> None:
     """Test that true deviations (when alternatives exist) get inserted into database."""
-    # Setup mock data
-    mock_dependencies["game_ids"].return_value = ["game456"]
-
     # Game with a real deviation - plays 1... c5 instead of prepared 1... e5
     game_data = {
         "pgn": """[Event "Test Game"]
@@ -99,7 +107,7 @@ def test_analysis_service_true_deviation_gets_inserted(mock_dependencies: Dict[s
 1. e4 c5""",  # Opponent deviates from our prep (we expected 1... e5)
         "opening": {"name": "Sicilian Defence"},
     }
-    mock_dependencies["game_data"].return_value = game_data
+    mock_dependencies["games"].side_effect = export_stream(("game456", game_data))
 
     # Run analysis
     results = perform_game_analysis(
@@ -125,9 +133,6 @@ def test_analysis_service_true_deviation_gets_inserted(mock_dependencies: Dict[s
 
 def test_analysis_service_validation_prevents_end_of_book_insertion(mock_dependencies: Dict[str, Any]) -> None:
     """Test that the analysis service validation layer prevents any End of book insertions."""
-    # Setup mock data
-    mock_dependencies["game_ids"].return_value = ["game789"]
-
     # This shouldn't happen with our fixed logic, but test the safety net
     game_data = {
         "pgn": """[Event "Test Game"]
@@ -137,7 +142,7 @@ def test_analysis_service_validation_prevents_end_of_book_insertion(mock_depende
 1. e4 e5 2. Nf3 Nc6""",
         "opening": {"name": "Italian Game"},
     }
-    mock_dependencies["game_data"].return_value = game_data
+    mock_dependencies["games"].side_effect = export_stream(("game789", game_data))
 
     # Mock a hypothetical DeviationResult with "End of book" (this shouldn't happen with fixed logic)
     mock_deviation = DeviationResult(
@@ -150,7 +155,7 @@ def test_analysis_service_validation_prevents_end_of_book_insertion(mock_depende
     )
 
     # Patch the trie to return this mock deviation (simulating old buggy behavior)
-    with patch("repertoire_trie.RepertoireTrie.find_deviation", return_value=mock_deviation):
+    with patch("repertoire_trie.CompactRepertoireTrie.find_deviation", return_value=mock_deviation):
         results = perform_game_analysis(
             username="testuser",
             user_id="user123",
@@ -172,8 +177,6 @@ def test_analysis_service_validation_prevents_end_of_book_insertion(mock_depende
 def test_analysis_service_multiple_games_mixed_scenarios(mock_dependencies: Dict[str, Any]) -> None:
     """Test analysis with multiple games having different deviation scenarios."""
     # Setup mock data for multiple games
-    mock_dependencies["game_ids"].return_value = ["game1", "game2", "game3"]
-
     # Game 1: End of book scenario (no deviation)
     # Game 2: True deviation
     # Game 3: No deviation (follows prep exactly)
@@ -204,20 +207,28 @@ def test_analysis_service_multiple_games_mixed_scenarios(mock_dependencies: Dict
         },
     ]
 
-    mock_dependencies["game_data"].side_effect = game_data_responses
+    mock_dependencies["games"].side_effect = export_stream(
+        *[(f"game{i}", data) for i, data in enumerate(game_data_responses, start=1)]
+    )
 
     # Run analysis
+    progress: List[AnalysisProgress] = []
     results = perform_game_analysis(
         username="testuser",
         user_id="user123",
         study_url_white="https://lichess.org/study/white",
         study_url_black="https://lichess.org/study/black",
         max_games=3,
+        on_progress=progress.append,
     )
 
     # Should have three results
     assert len(results) == 3
 
+    # Progress is reported after every game
+    assert [p.games_analyzed for p in progress] == [1, 2, 3]
+    assert progress[-1] == AnalysisProgress(games_fetched=3, games_analyzed=3, deviations_found=1)
+
     # Game 1: End of book - no deviation
     deviation1, pgn1 = results[0]
     assert deviation1 is None
@@ -238,11 +249,10 @@ def test_analysis_service_multiple_games_mixed_scenarios(mock_dependencies: Dict
 
 def test_analysis_service_error_handling_with_invalid_pgn(mock_dependencies: Dict[str, Any]) -> None:
     """Test that the analysis service handles errors gracefully."""
-    # Setup mock data
-    mock_dependencies["game_ids"].return_value = ["invalid_game"]
-
     # Invalid game data
-    mock_dependencies["game_data"].return_value = {"pgn": "invalid pgn format", "opening": {"name": "Unknown"}}
+    mock_dependencies["games"].side_effect = export_stream(
+        ("invalid_game", {"pgn": "invalid pgn format", "opening": {"name": "Unknown"}})
+    )
 
     # Run analysis - should not crash
     results = perform_game_analysis(
@@ -262,11 +272,61 @@ def test_analysis_service_error_handling_with_invalid_pgn(mock_dependencies: Dic
     mock_dependencies["insert_db"].assert_not_called()
 
 
+def test_analysis_service_skips_variant_games(mock_dependencies: Dict[str, Any]) -> None:
+    """Variant games are skipped from their headers and left out of the results."""
+    variant = {"pgn": '[White "testuser"]\n[Black "opponent"]\n[Variant "Chess960"]\n\n1. e4 c5', "opening": {}}
+    standard = {"pgn": '[White "testuser"]\n[Black "opponent"]\n\n1. e4 c5', "opening": {"name": "Sicilian"}}
+    mock_dependencies["games"].side_effect = export_stream(("variant", variant), ("standard", standard))
+    progress: List[AnalysisProgress] = []
+
+    results = perform_game_analysis(
+        username="testuser",
+        user_id="user123",
+        study_url_white="https://lichess.org/study/white",
+        study_url_black="https://lichess.org/study/black",
+        max_games=2,
+        on_progress=progress.append,
+    )
+
+    assert [pgn for _, pgn in results] == [standard["pgn"]]
+    mock_dependencies["insert_db"].assert_called_once()
+    assert progress[-1] == AnalysisProgress(games_fetched=2, games_analyzed=1, deviations_found=1)
+
+
+def test_analysis_service_raises_when_a_study_cannot_be_loaded(mock_dependencies: Dict[str, Any]) -> None:
+    """A sync whose study fails to download is a failure, not a sync that found nothing."""
+    game_data = {"pgn": '[White "testuser"]\n[Black "opponent"]\n\n1. e4 c5', "opening": {}}
+    mock_dependencies["games"].side_effect = export_stream(("game1", game_data))
+    failed = StudyRefresh(status=RefreshStatus.FAILED, validators=StudyValidators(), error="timed out")
+
+    with (
+        patch("analysis_service.lichess_api.refresh_study_pgn", return_value=failed),
+        pytest.raises(Exception, match="timed out"),
+    ):
+        perform_game_analysis(
+            username="testuser",
+            user_id="user123",
+            study_url_white="https://lichess.org/study/white",
+            study_url_black="https://lichess.org/study/black",
+            max_games=1,
+        )
+    mock_dependencies["insert_db"].assert_not_called()
+
+
+def test_analysis_service_raises_when_the_game_export_fails(mock_dependencies: Dict[str, Any]) -> None:
+    mock_dependencies["games"].side_effect = ConnectionError("export failed")
+
+    with pytest.raises(ConnectionError):
+        perform_game_analysis(
+            username="testuser",
+            user_id="user123",
+            study_url_white="https://lichess.org/study/white",
+            study_url_black="https://lichess.org/study/black",
+        )
+
+
 def test_analysis_service_security_no_code_injection(mock_dependencies: Dict[str, Any]) -> None:
     """Test that the analysis service handles potentially malicious input safely."""
-    # Setup mock data with potentially malicious content
-    mock_dependencies["game_ids"].return_value = ["malicious_game"]
-
     # Game data with potentially problematic content
     game_data = {
         "pgn": """[Event "'; DROP TABLE opening_deviations; --"]
@@ -276,7 +336,7 @@ def test_analysis_service_security_no_code_injection(mock_dependencies: Dict[str
 1. e4 e5 2. Nf3""",
         "opening": {"name": '<script>alert("xss")</script>'},
     }
-    mock_dependencies["game_data"].return_value = game_data
+    mock_dependencies["games"].side_effect = export_stream(("malicious_game", game_data))
 
     # Run analysis - should handle malicious input safely
     results = perform_game_analysis(
@@ -295,3 +355,259 @@ def test_analysis_service_security_no_code_injection(mock_dependencies: Dict[str
 
     # No database insertion for this case
     mock_dependencies["insert_db"].assert_not_called()
+
+
+def test_analysis_service_repeat_sync_uses_study_cache(mock_dependencies: Dict[str, Any]) -> None:
+    """A second sync with the same studies skips the study download entirely."""
+    mock_dependencies["games"].side_effect = export_stream(
+        (
+            "game456",
+            {
+                "pgn": '[White "testuser"]\n[Black "opponent"]\n\n1. e4 c5',
+                "opening": {"name": "Sicilian Defence"},
+            },
+        )
+    )
+    kwargs: Dict[str, Any] = {
+        "username": "testuser",
+        "user_id": "user123",
+        "study_url_white": "https://lichess.org/study/white",
+        "study_url_black": "https://lichess.org/study/black",
+        "max_games": 1,
+    }
+
+    with patch("analysis_service.lichess_api.refresh_study_pgn", side_effect=mock_refresh_study_pgn) as mock_fetch:
+        first = perform_game_analysis(**kwargs)
+        assert mock_fetch.call_count == 2
+
+        second = perform_game_analysis(**kwargs)
+        assert mock_fetch.call_count == 2
+
+    assert first[0][0] == second[0][0]
+    assert study_cache.studies.stats.hits == 2
+
+
+def test_analysis_service_revalidates_expired_study(mock_dependencies: Dict[str, Any]) -> None:
+    """An expired cache entry is revalidated; an unchanged study keeps its trie."""
+    mock_dependencies["games"].side_effect = export_stream(
+        (
+            "game456",
+            {
+                "pgn": '[White "testuser"]\n[Black "opponent"]\n\n1. e4 c5',
+                "opening": {"name": "Sicilian Defence"},
+            },
+        )
+    )
+    kwargs: Dict[str, Any] = {
+        "username": "testuser",
+        "user_id": "user123",
+        "study_url_white": "https://lichess.org/study/white",
+        "study_url_black": "https://lichess.org/study/black",
+        "max_games": 1,
+    }
+
+    with patch("analysis_service.lichess_api.refresh_study_pgn", side_effect=mock_refresh_study_pgn) as mock_fetch:
+        perform_game_analysis(**kwargs)
+        white_trie = study_cache.studies.peek("white")
+
+        with patch.object(study_cache.studies, "ttl_seconds", 0):
+            # Re-store with a zero TTL so the next lookup sees an expired entry.
+            assert white_trie is not None
+            study_cache.studies.set("white", white_trie)
+        with patch("analysis_service.trie_cache.load_or_build") as mock_build:
+            results = perform_game_analysis(**kwargs)
+            mock_build.assert_not_called()
+
+    # The second sync only revalidated the expired white study.
+    assert mock_fetch.call_count == 3
+    assert mock_fetch.call_args.args[1] == StudyValidators(etag='"white"')
+    assert study_cache.studies.peek("white") is white_trie
+    assert isinstance(results[0][0], DeviationResult)
+
+
+def test_analysis_service_no_games_skips_studies(mock_dependencies: Dict[str, Any]) -> None:
+    """With no games in the export stream, no study is fetched or built."""
+    mock_dependencies["games"].side_effect = export_stream()
+
+    with patch("analysis_service.build_repertoire_trie") as mock_build:
+        results = perform_game_analysis(
+            username="testuser",
+            user_id="user123",
+            study_url_white="https://lichess.org/study/white",
+            study_url_black="https://lichess.org/study/black",
+        )
+
+    assert results == []
+    mock_build.assert_not_called()
+
+
+def test_concurrent_analyses_share_one_study_fetch(mock_dependencies: Dict[str, Any]) -> None:
+    """Users analyzed at the same time with the same study fetch and build it once."""
+    fetched = threading.Event()
+
+    def slow_refresh(study_id: str, validators: Optional[StudyValidators] = None) -> StudyRefresh:
+        time.sleep(0.1)  # keep the first fetch in flight while the others arrive
+        fetched.set()
+        return mock_refresh_study_pgn(study_id, validators)
+
+    with patch("analysis_service.lichess_api.refresh_study_pgn", side_effect=slow_refresh) as mock_fetch:
+        threads = [
+            threading.Thread(target=build_repertoire_trie, args=("https://lichess.org/study/white",)) for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert fetched.is_set()
+    assert mock_fetch.call_count == 1
+
+
+def refresh_with_hash(study_id: str, validators: Optional[StudyValidators] = None) -> StudyRefresh:
+    """Like mock_refresh_study_pgn, but with content hashes so study versions are known."""
+    pgn = mock_study_pgn(study_id)
+    return StudyRefresh(
+        status=RefreshStatus.UPDATED, validators=StudyValidators(content_hash=f"hash-{study_id}"), pgn=pgn
+    )
+
+
+def exported_game(game_id: str, created_at_ms: int) -> Tuple[str, Dict[str, Any]]:
+    pgn = f'[Site "https://lichess.org/{game_id}"]\n[White "testuser"]\n[Black "opponent"]\n\n1. e4 c5'
+    return game_id, {"pgn": pgn, "createdAt": created_at_ms, "opening": {"name": "Sicilian Defence"}}
+
+
+def test_analysis_service_incremental_sync_uses_watermark(mock_dependencies: Dict[str, Any]) -> None:
+    """A second sync fetches games since the newest analyzed one and skips that game when it comes back."""
+    kwargs: Dict[str, Any] = {
+        "username": "testuser",
+        "user_id": "user123",
+        "study_url_white": "https://lichess.org/study/white",
+        "study_url_black": "https://lichess.org/study/black",
+        "max_games": 10,
+    }
+    with patch("analysis_service.lichess_api.refresh_study_pgn", side_effect=refresh_with_hash):
+        mock_dependencies["games"].side_effect = export_stream(
+            exported_game("game0002", 1_700_000_200_000), exported_game("game0001", 1_700_000_100_000)
+        )
+        first = perform_game_analysis(**kwargs)
+        assert len(first) == 2
+        assert mock_dependencies["games"].call_args.args[2] is None
+
+        # Lichess's since is inclusive, so the newest analyzed game is exported again
+        mock_dependencies["games"].side_effect = export_stream(
+            exported_game("game0003", 1_700_000_300_000), exported_game("game0002", 1_700_000_200_000)
+        )
+        second = perform_game_analysis(**kwargs)
+
+    since = mock_dependencies["games"].call_args.args[2]
+    assert since == datetime.fromtimestamp(1_700_000_200, tz=timezone.utc)
+    assert [pgn.split('"')[1] for _, pgn in second] == ["https://lichess.org/game0003"]
+    assert mock_dependencies["insert_db"].call_count == 3
+
+
+def test_analysis_service_changed_study_resets_watermark(mock_dependencies: Dict[str, Any]) -> None:
+    """After a study changes, the recent games are fetched and analyzed again."""
+    kwargs: Dict[str, Any] = {
+        "username": "testuser",
+        "user_id": "user123",
+        "study_url_white": "https://lichess.org/study/white",
+        "study_url_black": "https://lichess.org/study/black",
+        "max_games": 10,
+    }
+    mock_dependencies["games"].side_effect = export_stream(exported_game("game0001", 1_700_000_100_000))
+    with patch("analysis_service.lichess_api.refresh_study_pgn", side_effect=refresh_with_hash):
+        perform_game_analysis(**kwargs)
+
+    study_cache.studies.clear()
+
+    def edited(study_id: str, validators: Optional[StudyValidators] = None) -> StudyRefresh:
+        result = refresh_with_hash(study_id, validators)
+        result.validators.content_hash = f"edited-{study_id}"
+        return result
+
+    with patch("analysis_service.lichess_api.refresh_study_pgn", side_effect=edited):
+        again = perform_game_analysis(**kwargs)
+
+    assert len(again) == 1
+    assert mock_dependencies["games"].call_args.args[2] is None  # re-fetched without the watermark
+
+
+def test_analysis_service_keeps_watermark_when_deviations_fail_to_save(mock_dependencies: Dict[str, Any]) -> None:
+    """Games whose deviations could not be saved are fetched again on the next sync."""
+    mock_dependencies["games"].side_effect = export_stream(exported_game("game0001", 1_700_000_100_000))
+    mock_dependencies["writer"].failures = [DeviationWriteFailure(game_id="game0001", error="timeout")]
+
+    with (
+        patch("analysis_service.lichess_api.refresh_study_pgn", side_effect=refresh_with_hash),
+        patch("analysis_service.watermarks.save") as save,
+    ):
+        perform_game_analysis(
+            username="testuser",
+            user_id="user123",
+            study_url_white="https://lichess.org/study/white",
+            study_url_black="https://lichess.org/study/black",
+        )
+
+    save.assert_not_called()
+
+
+def test_analysis_service_keeps_watermark_when_an_early_chunk_fails(mock_dependencies: Dict[str, Any]) -> None:
+    """Failures from the chunks the writer flushes mid-sync hold the watermark back too."""
+    mock_dependencies["games"].side_effect = export_stream(
+        *[exported_game(f"game000{i}", 1_700_000_100_000 + i) for i in range(1, 4)]
+    )
+    client = MagicMock()
+    client.table.return_value.upsert.return_value.execute.side_effect = [
+        Exception("timeout"),
+        Exception("timeout"),
+        None,
+        None,
+    ]
+
+    with (
+        patch("analysis_service.DeviationWriter", functools.partial(DeviationWriter, chunk_size=2)),
+        patch("supabase_client.get_admin_client", return_value=client),
+        patch("supabase_client.get_study_id_from_url", return_value="study-uuid"),
+        patch("analysis_service.lichess_api.refresh_study_pgn", side_effect=refresh_with_hash),
+        patch("analysis_service.watermarks.save") as save,
+    ):
+        results = perform_game_analysis(
+            username="testuser",
+            user_id="user123",
+            study_url_white="https://lichess.org/study/white",
+            study_url_black="https://lichess.org/study/black",
+        )
+
+    assert len([d for d, _ in results if d is not None]) == 3
+    # The first chunk of two is retried row by row and game0001 fails again; the final flush writes game0003
+    assert client.table.return_value.upsert.call_count == 4
+    save.assert_not_called()
+
+
+def test_large_syncs_run_on_the_process_pool_in_order(mock_dependencies: Dict[str, Any]) -> None:
+    """With analysis processes enabled, results and saved deviations match the inline run, in order."""
+    games = [
+        (f"game{i:04d}", {"pgn": f'[White "testuser"]\n[Black "opponent"]\n\n1. e4 {move}', "opening": {"name": "x"}})
+        for i, move in enumerate(["c5", "e5", "d5", "e5", "c6", "e5"])
+    ]
+    mock_dependencies["games"].side_effect = export_stream(*games)
+    kwargs: Dict[str, Any] = dict(
+        username="testuser",
+        user_id="user123",
+        study_url_white="https://lichess.org/study/white",
+        study_url_black="https://lichess.org/study/black",
+        max_games=len(games),
+        since=datetime(2024, 1, 1, tzinfo=timezone.utc),
+    )
+    inline = perform_game_analysis(**kwargs)
+
+    with patch("parallel_analysis.ANALYSIS_PROCESSES", 2), patch("parallel_analysis.ANALYSIS_CHUNK_SIZE", 2):
+        try:
+            with patch("parallel_analysis.analyze_games", wraps=parallel_analysis.analyze_games) as pooled_run:
+                pooled = perform_game_analysis(**kwargs)
+        finally:
+            parallel_analysis.shutdown()
+
+    assert pooled_run.called
+    assert pooled == inline
+    assert [d.deviation_san if d else None for d, _ in pooled] == ["c5", None, "d5", None, "c6", None]
@@ -3,8 +3,9 @@ Tests for chess_utils module
 """
 
 import chess
+import pytest
 
-from chess_utils import calculate_previous_position_fen
+from chess_utils import analysis_skip_reason, calculate_previous_position_fen, game_speed, get_player_color_from_headers
 
 
 class TestCalculatePreviousPositionFen:
@@ -124,3 +125,47 @@ class TestCalculatePreviousPositionFen:
         bad_pgn = "This is not a valid PGN"
         result = calculate_previous_position_fen(bad_pgn, 1, "White")
         assert result is None
+
+
+@pytest.mark.parametrize(
+    "time_control, speed",
+    [
+        ("15+0", "ultraBullet"),
+        ("60+0", "bullet"),
+        ("120+1", "bullet"),
+        ("180+2", "blitz"),
+        ("600+0", "rapid"),
+        ("900+10", "rapid"),
+        ("1800+0", "classical"),
+        ("-", "correspondence"),
+        ("?", "unknown"),
+    ],
+)
+def test_game_speed_follows_lichess_categories(time_control: str, speed: str) -> None:
+    assert game_speed(time_control) == speed
+
+
+def test_analysis_skip_reason_uses_headers_only() -> None:
+    standard = {"White": "a", "Black": "b", "Variant": "Standard", "TimeControl": "300+0"}
+
+    assert analysis_skip_reason(standard) is None
+    assert analysis_skip_reason(standard, speeds={"blitz", "rapid"}) is None
+    assert analysis_skip_reason(standard, speeds={"rapid"}) == "blitz game"
+    assert analysis_skip_reason({**standard, "Variant": "Crazyhouse"}) == "variant Crazyhouse"
+    assert (
+        analysis_skip_reason({**standard, "Variant": "From Position", "FEN": "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"})
+        == "variant From Position"
+    )
+    assert analysis_skip_reason({**standard, "SetUp": "1", "FEN": "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"}) == (
+        "custom starting position"
+    )
+    assert analysis_skip_reason({**standard, "FEN": chess.STARTING_FEN}) is None
+
+
+def test_get_player_color_from_headers_ignores_case() -> None:
+    headers = {"White": "Alice", "Black": "bob"}
+
+    assert get_player_color_from_headers(headers, "alice") == "White"
+    assert get_player_color_from_headers(headers, " BOB ") == "Black"
+    with pytest.raises(Exception, match="Could not find match"):
+        get_player_color_from_headers(headers, "carol")
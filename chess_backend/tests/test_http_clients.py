@@ -0,0 +1,57 @@
+# tests/test_http_clients.py
+import asyncio
+import builtins
+from typing import Any, Generator
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+import http_clients
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients() -> Generator[None, None, None]:
+    http_clients.close_clients()
+    yield
+    asyncio.run(http_clients.aclose_clients())
+
+
+def test_sync_client_is_shared_until_closed() -> None:
+    first = http_clients.sync_client()
+    assert http_clients.sync_client() is first
+
+    http_clients.close_clients()
+    assert first.is_closed
+    second = http_clients.sync_client()
+    assert second is not first and not second.is_closed
+
+
+def test_pool_limits_follow_configuration() -> None:
+    with patch("http_clients.HTTP_MAX_CONNECTIONS", 7), patch("http_clients.HTTP_MAX_KEEPALIVE_CONNECTIONS", 3):
+        limits = http_clients.pool_limits()
+    assert limits.max_connections == 7
+    assert limits.max_keepalive_connections == 3
+
+
+def test_http2_falls_back_when_h2_is_missing() -> None:
+    real_import = builtins.__import__
+
+    def no_h2(name: str, *args: Any, **kwargs: Any) -> Any:
+        if name == "h2":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    with patch("http_clients.HTTP2_ENABLED", True), patch("builtins.__import__", no_h2):
+        assert http_clients.http2_available() is False
+    assert http_clients.http2_available() is False  # disabled by default
+
+
+def test_app_lifespan_opens_and_closes_clients() -> None:
+    from main import app
+
+    with TestClient(app) as client:
+        assert client.get("/health").status_code == 200
+        clients = [http_clients.sync_client(), http_clients.async_client()]
+        assert not any(c.is_closed for c in clients)
+    assert all(c.is_closed for c in clients)
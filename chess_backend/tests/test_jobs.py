@@ -0,0 +1,131 @@
+# tests/test_jobs.py
+import asyncio
+import time
+from typing import Any, Generator, List, Optional, Tuple
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+import jobs
+import workers
+from analysis_service import AnalysisProgress
+from deviation_result import DeviationResult
+from jobs import AnalysisJob, JobStatus, JobStore
+
+DEVIATION = DeviationResult(
+    first_deviator="opponent",
+    move_number=1,
+    deviation_san="c5",
+    reference_san="e5",
+    player_color="White",
+    board_fen="rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1",
+)
+
+
+def fake_analysis(on_progress: Any = None, **kwargs: Any) -> List[Tuple[Optional[DeviationResult], str]]:
+    on_progress(AnalysisProgress(games_fetched=1, games_analyzed=1, deviations_found=1))
+    on_progress(AnalysisProgress(games_fetched=2, games_analyzed=2, deviations_found=1))
+    return [(DEVIATION, "pgn1"), (None, "pgn2")]
+
+
+def failing_analysis(**kwargs: Any) -> List[Tuple[Optional[DeviationResult], str]]:
+    raise RuntimeError("studies unavailable")
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool() -> Generator[None, None, None]:
+    yield
+    workers.shutdown()
+
+
+def submit(store: JobStore) -> AnalysisJob:
+    return jobs.submit_analysis(
+        username="someone",
+        user_id="u1",
+        study_url_white="https://lichess.org/study/white123",
+        study_url_black="https://lichess.org/study/black123",
+        max_games=10,
+        since=None,
+        job_store=store,
+    )
+
+
+def wait_for(store: JobStore, job_id: str) -> AnalysisJob:
+    deadline = time.monotonic() + 5
+    while True:
+        job = store.get(job_id)
+        assert job is not None
+        if job.status.finished:
+            return job
+        assert time.monotonic() < deadline, "job never finished"
+        time.sleep(0.01)
+
+
+def test_job_runs_in_background_and_records_results() -> None:
+    store = JobStore()
+    with patch("jobs.perform_game_analysis", fake_analysis):
+        job = submit(store)
+        assert job.status is JobStatus.QUEUED
+        done = wait_for(store, job.id)
+
+    assert done.status is JobStatus.SUCCEEDED
+    assert done.progress.games_analyzed == 2 and done.progress.deviations_found == 1
+    assert done.deviations == [DEVIATION]
+    assert done.message == "Found 1 deviations in 2 games"
+    assert done.started_at is not None and done.finished_at is not None
+
+
+def test_failed_job_reports_its_error() -> None:
+    store = JobStore()
+    with patch("jobs.perform_game_analysis", failing_analysis):
+        done = wait_for(store, submit(store).id)
+    assert done.status is JobStatus.FAILED
+    assert done.error == "studies unavailable"
+
+
+def test_job_events_stream_progress_then_done() -> None:
+    store = JobStore()
+    with patch("jobs.perform_game_analysis", fake_analysis):
+        job_id = submit(store).id
+        wait_for(store, job_id)
+
+    async def collect(job_id: str) -> List[str]:
+        return [event async for event in jobs.job_events(job_id, store)]
+
+    events = asyncio.run(collect(job_id))
+    assert events[-1].startswith("event: done\n")
+    assert '"status":"succeeded"' in events[-1]
+
+    assert asyncio.run(collect("nope")) == ['event: error\ndata: {"detail": "Job not found"}\n\n']
+
+
+def test_job_endpoints() -> None:
+    from main import app
+
+    with (
+        patch("jobs.perform_game_analysis", fake_analysis),
+        patch("main.get_user_id_from_username", return_value="u1"),
+        TestClient(app) as client,
+    ):
+        response = client.post(
+            "/api/analysis_jobs",
+            json={
+                "username": "someone",
+                "study_url_white": "https://lichess.org/study/white123",
+                "study_url_black": "https://lichess.org/study/black123",
+            },
+        )
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+
+        wait_for(jobs.store, job_id)
+        polled = client.get(f"/api/analysis_jobs/{job_id}").json()
+        assert polled["status"] == "succeeded"
+        assert len(polled["deviations"]) == 1
+
+        with client.stream("GET", f"/api/analysis_jobs/{job_id}/events") as events:
+            assert events.headers["content-type"].startswith("text/event-stream")
+            assert "event: done" in events.read().decode()
+
+        assert client.get("/api/analysis_jobs/unknown").status_code == 404
@@ -0,0 +1,157 @@
+# tests/test_lichess_api.py
+import json
+from datetime import datetime, timezone
+from typing import Any, Callable, ContextManager, Generator, List
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+import lichess_api
+from lichess_api import RefreshStatus, Study, StudyValidators, refresh_study_pgn
+from rate_limit import RateLimiter
+
+STUDY_PGN = """[Event "Chapter 1"]
+
+1. e4 e5 *
+
+
+[Event "Chapter 2"]
+
+1. d4 d5 *"""
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit() -> Generator[None, None, None]:
+    with patch("lichess_api.rate_limit.lichess", RateLimiter(rate=1000, burst=1000)):
+        yield
+
+
+def mock_lichess(handler: Callable[[httpx.Request], httpx.Response]) -> ContextManager[Any]:
+    """Routes every request made through the shared client by lichess_api to ``handler``."""
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    return patch("lichess_api.http_clients.sync_client", return_value=client)
+
+
+def test_refresh_without_validators_downloads_and_remembers_them() -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert "If-None-Match" not in request.headers
+        return httpx.Response(200, text=STUDY_PGN, headers={"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024"})
+
+    with mock_lichess(handler):
+        result = refresh_study_pgn("abc123")
+
+    assert result.status is RefreshStatus.UPDATED
+    assert result.pgn == STUDY_PGN
+    assert result.validators.etag == '"v1"'
+    assert result.validators.last_modified == "Mon, 01 Jan 2024"
+    assert result.validators.content_hash is not None
+
+
+def test_refresh_sends_validators_and_handles_304() -> None:
+    seen: List[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return httpx.Response(304)
+
+    validators = StudyValidators(etag='"v1"', last_modified="Mon, 01 Jan 2024", content_hash="abc")
+    with mock_lichess(handler):
+        result = refresh_study_pgn("abc123", validators)
+
+    assert seen[0].headers["If-None-Match"] == '"v1"'
+    assert seen[0].headers["If-Modified-Since"] == "Mon, 01 Jan 2024"
+    assert result.status is RefreshStatus.UNCHANGED
+    assert result.pgn is None
+    assert result.validators == validators
+
+
+def test_refresh_falls_back_to_content_hash() -> None:
+    """Without server validators an identical body is still reported as unchanged."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, text=STUDY_PGN)
+
+    with mock_lichess(handler):
+        first = refresh_study_pgn("abc123")
+        second = refresh_study_pgn("abc123", first.validators)
+
+    assert first.status is RefreshStatus.UPDATED
+    assert second.status is RefreshStatus.UNCHANGED
+    assert second.pgn is None
+
+
+def test_refresh_reports_failures() -> None:
+    def server_error(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(500)
+
+    def network_error(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("boom", request=request)
+
+    with mock_lichess(server_error):
+        assert refresh_study_pgn("abc123").status is RefreshStatus.FAILED
+    with mock_lichess(network_error):
+        result = refresh_study_pgn("abc123")
+    assert result.status is RefreshStatus.FAILED
+    assert result.error is not None and "boom" in result.error
+
+
+def test_study_refresh_updates_chapters_in_place() -> None:
+    versions = [STUDY_PGN, STUDY_PGN, STUDY_PGN + '\n\n\n[Event "Chapter 3"]\n\n1. c4 *']
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, text=versions.pop(0))
+
+    with mock_lichess(handler):
+        study = Study.fetch_id("abc123")
+        assert len(study.chapters) == 2
+        assert study.refresh() is RefreshStatus.UNCHANGED
+        assert study.refresh() is RefreshStatus.UPDATED
+
+    assert len(study.chapters) == 3
+    assert lichess_api.extract_study_id_from_url("https://lichess.org/study/abc123") == "abc123"
+
+
+def test_stream_user_games_uses_one_bulk_request() -> None:
+    seen: List[httpx.Request] = []
+    lines = [
+        {"id": "game0001", "pgn": '[White "a"]\n\n1. e4 *', "opening": {"name": "King's Pawn"}},
+        {"id": "game0002", "pgn": '[White "a"]\n\n1. d4 *', "opening": {"name": "Queen's Pawn"}},
+    ]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        body = "\n".join(json.dumps(line) for line in lines) + "\n\n"
+        return httpx.Response(200, text=body, headers={"Content-Type": "application/x-ndjson"})
+
+    since = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with mock_lichess(handler):
+        games = list(lichess_api.stream_user_games("someone", 2, since))
+
+    assert games == lines
+    assert len(seen) == 1
+    assert seen[0].url.path == "/api/games/user/someone"
+    params = seen[0].url.params
+    assert params["max"] == "2"
+    assert params["pgnInJson"] == "true"
+    assert params["opening"] == "true"
+    assert params["since"] == str(int(since.timestamp() * 1000))
+
+
+def test_stream_user_games_raises_on_network_error() -> None:
+    """A failed export is an error for the sync, not an empty list of games."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("offline", request=request)
+
+    with mock_lichess(handler), pytest.raises(httpx.ConnectError):
+        list(lichess_api.stream_user_games("someone", 5))
+
+
+def test_get_last_game_ids_streams_ids() -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = '{"id": "game0001"}\n\n{"id": null}\n{"id": "game0002"}\n'
+        return httpx.Response(200, text=body, headers={"Content-Type": "application/x-ndjson"})
+
+    with mock_lichess(handler):
+        assert lichess_api.get_last_game_ids("someone", 3) == ["game0001", "game0002"]
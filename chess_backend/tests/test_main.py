@@ -0,0 +1,189 @@
+# tests/test_main.py
+from typing import Any, List, Optional, Tuple
+from unittest.mock import patch
+
+import httpx
+from fastapi.testclient import TestClient
+
+import token_cache
+import workers
+from deviation_result import DeviationResult
+from main import BATCH_MAX_USERS, app, get_current_user
+from supabase_client import DeviationPage, encode_deviation_cursor
+from supabase_models import User
+
+DEVIATION = DeviationResult(
+    first_deviator="opponent",
+    move_number=1,
+    deviation_san="c5",
+    reference_san="e5",
+    player_color="White",
+    board_fen="rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1",
+)
+
+
+def user_payload(username: str) -> dict:
+    return {
+        "username": username,
+        "study_url_white": "https://lichess.org/study/white123",
+        "study_url_black": "https://lichess.org/study/black123",
+    }
+
+
+def test_analyze_batch_reports_each_user_separately() -> None:
+    def analysis(username: str, **kwargs: Any) -> List[Tuple[Optional[DeviationResult], str]]:
+        return [(DEVIATION, "pgn1"), (None, "pgn2")]
+
+    def lookup(username: str) -> str:
+        if username == "ghost":
+            raise Exception(f"User with lichess_username '{username}' not found.")
+        return f"id-{username}"
+
+    with (
+        patch("main.perform_game_analysis", analysis),
+        patch("main.get_user_id_from_username", lookup),
+        TestClient(app) as client,
+    ):
+        response = client.post(
+            "/api/analyze_batch", json={"users": [user_payload("alice"), user_payload("ghost"), user_payload("bob")]}
+        )
+    workers.shutdown()
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["message"] == "Synced 2 of 3 users"
+    assert [r["username"] for r in body["results"]] == ["alice", "ghost", "bob"]
+    alice, ghost, bob = body["results"]
+    assert alice["ok"] and alice["games_analyzed"] == 2 and alice["deviations_found"] == 1
+    assert not ghost["ok"] and "not found" in ghost["error"]
+    assert bob["ok"]
+
+
+def test_analyze_batch_rejects_an_empty_batch() -> None:
+    with TestClient(app) as client:
+        assert client.post("/api/analyze_batch", json={"users": []}).status_code == 422
+
+
+def test_analyze_batch_rejects_more_than_the_batch_cap() -> None:
+    users = [user_payload(f"user{i}") for i in range(BATCH_MAX_USERS + 1)]
+    with TestClient(app) as client:
+        assert client.post("/api/analyze_batch", json={"users": users}).status_code == 422
+
+
+def test_validated_tokens_are_cached_until_lichess_rejects_them() -> None:
+    account_checks: List[str] = []
+
+    def lichess(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/account":
+            account_checks.append(request.headers["Authorization"])
+            return httpx.Response(200, json={"username": "alice"})
+        return httpx.Response(401, json={"error": "No such token"})
+
+    token_cache.tokens.clear()
+    client_for_lichess = httpx.AsyncClient(transport=httpx.MockTransport(lichess))
+    headers = {"Authorization": "Bearer tok"}
+    with (
+        patch("main.http_clients.async_client", return_value=client_for_lichess),
+        patch("main.get_user_id_from_username", return_value="id-alice"),
+        patch("main.get_deviations_for_user", return_value=DeviationPage(rows=[], next_cursor=None)),
+        TestClient(app) as client,
+    ):
+        for _ in range(3):
+            assert client.get("/api/deviations", headers=headers).status_code == 200
+        assert len(account_checks) == 1
+
+        # The token was revoked: the proxied 401 evicts it, so the next request revalidates
+        client.get("/api/proxy/lichess/account/playing", headers=headers)
+        client.get("/api/deviations", headers=headers)
+    token_cache.tokens.clear()
+
+    assert len(account_checks) == 2
+
+
+CURSOR = encode_deviation_cursor({"id": "00000000-0000-0000-0000-000000000002", "game_date": "2024-03-21T00:00:00Z"})
+
+
+def test_deviations_pass_the_next_cursor_in_a_header() -> None:
+    row = {"id": "00000000-0000-0000-0000-000000000001", "game_date": "2024-03-20T12:00:00+00:00"}
+    page = DeviationPage(rows=[row], next_cursor="next")
+    with (
+        patch("main.get_deviations_for_user", return_value=page) as fetch,
+        TestClient(app) as client,
+    ):
+        app.dependency_overrides[get_current_user] = lambda: User(id="id-alice", lichess_username="alice")
+        response = client.get("/api/deviations", params={"limit": 1, "cursor": CURSOR})
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.headers["X-Next-Cursor"] == "next"
+    assert response.json()[0]["game_date"] == row["game_date"]
+    assert fetch.call_args.kwargs["cursor"] == CURSOR
+
+
+def test_deviations_reject_a_malformed_cursor() -> None:
+    app.dependency_overrides[get_current_user] = lambda: User(id="id-alice", lichess_username="alice")
+    with TestClient(app) as client:
+        response = client.get("/api/deviations", params={"cursor": "garbage"})
+    app.dependency_overrides.clear()
+    assert response.status_code == 400
+
+
+def test_summary_view_drops_the_pgn_and_large_lists_are_gzipped() -> None:
+    rows = [
+        {
+            "id": f"00000000-0000-0000-0000-{i:012d}",
+            "game_date": "2024-03-20T12:00:00+00:00",
+            "actual_move": "c5",
+            "pgn_headers": '[White "alice"]\n[Black "bob"]',
+        }
+        for i in range(50)
+    ]
+    app.dependency_overrides[get_current_user] = lambda: User(id="id-alice", lichess_username="alice")
+    with (
+        patch("main.get_deviations_for_user", return_value=DeviationPage(rows=rows, next_cursor=None)) as fetch,
+        TestClient(app) as client,
+    ):
+        response = client.get("/api/deviations", params={"view": "summary"}, headers={"Accept-Encoding": "gzip"})
+    app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert fetch.call_args.kwargs["summary"] is True
+    assert response.headers["Content-Encoding"] == "gzip"
+    first = response.json()[0]
+    assert "pgn" not in first and first["pgn_headers"].startswith('[White "alice"]')
+
+
+def test_a_deviation_is_only_served_to_its_owner() -> None:
+    row = {
+        "id": "00000000-0000-0000-0000-000000000001",
+        "user_id": "id-alice",
+        "game_date": "2024-03-20T12:00:00+00:00",
+        "pgn": "1. e4 c5 *",
+    }
+    with (
+        patch("main.get_deviation_by_id", side_effect=lambda deviation_id: row if deviation_id == row["id"] else None),
+        TestClient(app) as client,
+    ):
+        assert client.get(f"/api/deviations/{row['id']}").status_code == 401
+
+        app.dependency_overrides[get_current_user] = lambda: User(id="id-alice", lichess_username="alice")
+        own = client.get(f"/api/deviations/{row['id']}")
+        missing = client.get("/api/deviations/00000000-0000-0000-0000-000000000002")
+        app.dependency_overrides[get_current_user] = lambda: User(id="id-bob", lichess_username="bob")
+        other = client.get(f"/api/deviations/{row['id']}")
+        app.dependency_overrides.clear()
+
+    assert own.status_code == 200 and own.json()["pgn"] == row["pgn"]
+    assert missing.status_code == 404
+    assert other.status_code == 403
+
+
+def test_cache_counters_are_served_beside_the_health_check() -> None:
+    with TestClient(app) as client:
+        response = client.get("/health/caches")
+    assert response.status_code == 200
+    body = response.json()
+    assert set(body["lookups"]) == {"user_ids", "study_ids"}
+    assert "hit_rate" in body["lookups"]["user_ids"]
+    assert "hit_rate" in body["tokens"]
+    assert {"hits", "misses", "evictions"} <= set(body["studies"])
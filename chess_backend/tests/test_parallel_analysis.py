@@ -0,0 +1,107 @@
+# tests/test_parallel_analysis.py
+import gc
+from multiprocessing.shared_memory import SharedMemory
+from typing import Generator, List
+from unittest.mock import patch
+
+import pytest
+
+import parallel_analysis
+import pgn_utils
+from parallel_analysis import analyze_game, analyze_games, share_trie
+from pgn_utils import pgn_string_to_game
+from repertoire_trie import CompactRepertoireTrie
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool() -> Generator[None, None, None]:
+    parallel_analysis.shutdown()
+    with patch("parallel_analysis.ANALYSIS_PROCESSES", 2):
+        yield
+    parallel_analysis.shutdown()
+
+
+def trie_for(*chapters: str) -> CompactRepertoireTrie:
+    trie = CompactRepertoireTrie()
+    for chapter in chapters:
+        trie.add_study_chapter(pgn_string_to_game(chapter))
+    return trie
+
+
+def game(white: str, black: str, moves: str) -> str:
+    return f'[White "{white}"]\n[Black "{black}"]\n\n{moves} *'
+
+
+GAMES: List[str] = [
+    game("me", "them", "1. e4 e5 2. Nf3 Nc6 3. Bb5"),
+    game("me", "them", "1. e4 e5 2. Nf3 Nf6"),
+    game("them", "me", "1. d4 d5 2. c4 e6"),
+    game("them", "me", "1. e4 c5"),
+    game("someone", "else", "1. e4 e5"),
+    game("me", "them", "1. d4"),
+]
+
+
+def test_pool_results_match_inline_analysis_in_order() -> None:
+    white = trie_for("1. e4 e5 2. Nf3 Nc6 (2... d6) 3. Bb5 *")
+    black = trie_for("1. d4 d5 2. c4 e6 *", "1. e4 e5 *")
+
+    inline = [analyze_game(pgn, "me", white, black) for pgn in GAMES]
+    pooled = list(analyze_games(GAMES * 5, "me", white, black, chunk_size=4))
+
+    assert pooled == inline * 5
+    assert [a.player_color for a in inline] == ["White", "White", "Black", "Black", None, "White"]
+    assert inline[1].deviation is not None and inline[1].deviation.deviation_san == "Nf6"
+    assert inline[3].deviation is not None and inline[3].deviation.reference_san == "e5"
+    assert inline[4].error is not None and "Could not find match" in inline[4].error
+
+
+def test_a_trie_is_shared_once_and_released_with_it() -> None:
+    trie = trie_for("1. e4 e5 *")
+    shared = share_trie(trie)
+    assert share_trie(trie) is shared
+
+    segment = SharedMemory(name=shared.name)
+    assert segment.buf is not None
+    loaded = CompactRepertoireTrie.from_buffer(bytes(segment.buf[: shared.size]))
+    assert loaded.root_moves() == trie.root_moves()
+    segment.close()
+
+    del trie
+    gc.collect()
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(name=shared.name)
+
+
+def test_games_are_skipped_from_their_headers() -> None:
+    white = trie_for("1. e4 e5 *")
+    black = trie_for("1. d4 d5 *")
+    crazyhouse = '[White "me"]\n[Black "them"]\n[Variant "Crazyhouse"]\n\n1. e4 e5 2. Nf3 Nc6 3. N@h6 *'
+    bullet = '[White "me"]\n[Black "them"]\n[TimeControl "60+0"]\n\n1. d4 *'
+
+    with patch("pgn_utils.read_mainline", wraps=pgn_utils.read_mainline) as read_mainline:
+        assert analyze_game(crazyhouse, "me", white, black).skipped == "variant Crazyhouse"
+        read_mainline.assert_not_called()
+
+    with patch("parallel_analysis.ANALYSIS_SPEEDS", frozenset({"blitz", "rapid"})):
+        assert analyze_game(bullet, "me", white, black).skipped == "bullet game"
+    analysis = analyze_game(bullet, "me", white, black)
+    assert analysis.skipped is None and analysis.deviation is not None
+
+
+def test_worker_detaches_evicted_tries() -> None:
+    tries = [trie_for("1. e4 e5 *"), trie_for("1. d4 d5 *")]
+    first, second = share_trie(tries[0]), share_trie(tries[1])
+    try:
+        with patch("parallel_analysis.WORKER_ATTACHED_TRIES", 1):
+            parallel_analysis._attached_trie(first)
+            first_segment, _ = parallel_analysis._attached[first.name]
+            assert parallel_analysis._attached_trie(second).root_moves() == [("d2d4", "d4")]
+
+        assert first.name not in parallel_analysis._attached
+        assert getattr(first_segment, "_mmap") is None  # unmapped, not left open behind a BufferError
+    finally:
+        for segment, trie in parallel_analysis._attached.values():
+            trie.release()
+            segment.close()
+        parallel_analysis._attached.clear()
@@ -1,6 +1,33 @@
 # tests/test_pgn_utils.py
 
-from pgn_utils import pgn_string_to_game, walk_pgn_variations
+import io
+import mmap
+from pathlib import Path
+
+import chess
+import pytest
+
+from chess_utils import get_player_color
+from pgn_utils import (
+    iter_pgn_games,
+    pgn_string_to_game,
+    pgn_to_pgn_list,
+    read_headers,
+    read_mainline,
+    walk_pgn_variations,
+)
+
+LICHESS_PGN = """[Event "Rated blitz game"]
+[Site "https://lichess.org/abcdefgh"]
+[White "Opponent"]
+[Black "Me"]
+[Result "1-0"]
+[TimeControl "180+0"]
+
+1. e4 { [%clk 0:03:00] } 1... e5 { [%clk 0:03:00] } 2. Nf3 { [%clk 0:02:59] } (2. f4 exf4 (2... d5) 3. Nf3)
+2... Nc6?! $6 { [%clk 0:02:58] } 3. Bb5 a6 4. Ba4 Nf6 5. 0-0 Be7 ; rest of line
+6. Re1 b5 7. Bb3 O-O 1-0
+"""
 
 
 def test_walk_pgn_variations_with_complex_pgn() -> None:
@@ -69,3 +96,108 @@ def test_walk_pgn_variations_simple_line() -> None:
     }
 
     assert uci_paths == expected_paths
+
+
+def test_read_mainline_matches_read_game() -> None:
+    """Headers and mainline moves agree with chess.pgn, skipping clocks, NAGs and variations."""
+    game = read_mainline(LICHESS_PGN)
+    expected = pgn_string_to_game(LICHESS_PGN)
+
+    assert dict(game.headers) == dict(expected.headers)
+    assert list(game.mainline_moves()) == list(expected.mainline_moves())
+    assert game.sans[:4] == ["e4", "e5", "Nf3", "Nc6"]
+    assert get_player_color(game, "me") == "Black"
+
+
+def test_read_headers_matches_read_game_without_reading_moves() -> None:
+    headers = read_headers(LICHESS_PGN + "2. Ke3 this is not movetext")
+
+    assert dict(headers) == dict(pgn_string_to_game(LICHESS_PGN).headers)
+    assert headers["TimeControl"] == "180+0"
+
+
+def test_read_mainline_stops_at_the_next_game() -> None:
+    """Only the first game of a multi-game string is read."""
+    game = read_mainline('[White "a"]\n\n1. d4 d5 *\n\n[White "b"]\n\n1. e4 e5 *')
+
+    assert game.headers["White"] == "a"
+    assert game.sans == ["d4", "d5"]
+
+
+def test_read_mainline_stops_at_max_plies() -> None:
+    game = read_mainline(LICHESS_PGN, max_plies=3)
+
+    assert game.sans == ["e4", "e5", "Nf3"]
+    assert game.headers["Black"] == "Me"
+
+
+def test_read_mainline_starts_from_fen_header() -> None:
+    fen = "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"
+    game = read_mainline(f'[SetUp "1"]\n[FEN "{fen}"]\n\n1. e4 Kd7 *')
+
+    assert game.board().fen() == fen
+    assert [move.uci() for move in game.mainline_moves()] == ["e2e4", "e8d7"]
+
+
+def test_read_mainline_ends_mainline_at_illegal_move() -> None:
+    game = read_mainline("1. e4 e5 2. Ke3 Nc6 *")
+
+    assert list(game.mainline_moves()) == [chess.Move.from_uci("e2e4"), chess.Move.from_uci("e7e5")]
+
+
+def test_read_mainline_rejects_empty_pgn() -> None:
+    with pytest.raises(Exception):
+        read_mainline("  \n")
+
+
+# Chapters separated by one, three and no blank lines, a comment holding a tag-like line, and a non-ASCII name
+MULTI_GAME_PGN = """[Event "Chapter 1"]
+[White "Zoë"]
+
+1. e4 e5 { Main line.
+[%cal Ge2e4] still a comment } 2. Nf3 *
+[Event "Chapter 2"]
+
+1. d4 d5 *
+
+
+
+[Event "Chapter 3"]
+1. c4 *
+
+[Event "Chapter 4"]
+
+1. Nf3 Nf6 2. g3 1/2-1/2
+"""
+
+
+def test_iter_pgn_games_splits_at_header_boundaries() -> None:
+    games = list(iter_pgn_games(MULTI_GAME_PGN))
+
+    assert [read_headers(game.pgn)["Event"] for game in games] == ["Chapter 1", "Chapter 2", "Chapter 3", "Chapter 4"]
+    assert read_mainline(games[0].pgn).sans == ["e4", "e5", "Nf3"]
+    assert [len(list(game.mainline_moves())) for game in pgn_to_pgn_list(MULTI_GAME_PGN)] == [3, 2, 1, 3]
+
+
+def test_iter_pgn_games_splits_headerless_games_after_their_result() -> None:
+    games = list(iter_pgn_games("1. e4 e5 *\n1. d4 1-0\n\n1. c4"))
+
+    assert [game.pgn for game in games] == ["1. e4 e5 *", "1. d4 1-0", "1. c4"]
+
+
+def test_iter_pgn_games_offsets_index_any_source(tmp_path: Path) -> None:
+    data = MULTI_GAME_PGN.encode("utf-8")
+    games = list(iter_pgn_games(MULTI_GAME_PGN))
+
+    for game in games:
+        assert data[game.offset :].startswith(b"[Event")
+        assert next(iter_pgn_games(data, start=game.offset)) == game
+
+    path = tmp_path / "games.pgn"
+    path.write_bytes(data)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        assert list(iter_pgn_games(mapped)) == games
+        assert list(iter_pgn_games(f, start=games[2].offset)) == games[2:]
+    with open(path, encoding="utf-8") as text:
+        assert list(iter_pgn_games(text)) == games
+    assert list(iter_pgn_games(io.BytesIO(data))) == games
@@ -0,0 +1,121 @@
+# tests/test_rate_limit.py
+import asyncio
+import threading
+import time
+from email.utils import formatdate
+from typing import List
+
+import httpx
+import pytest
+
+from rate_limit import RateLimiter, _seconds_from_header
+
+
+def wait_until_queued(limiter: RateLimiter, count: int) -> None:
+    deadline = time.monotonic() + 2
+    while limiter.queued < count:
+        assert time.monotonic() < deadline, "waiters never queued"
+        time.sleep(0.001)
+
+
+def test_burst_is_served_immediately_then_rate_applies() -> None:
+    limiter = RateLimiter(rate=10, burst=3)
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.05
+
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.08
+
+
+def test_waiters_are_served_round_robin_across_keys() -> None:
+    limiter = RateLimiter(rate=50, burst=1)
+    limiter.acquire("heavy")  # empty the bucket so everything below queues
+    order: List[str] = []
+
+    def request(key: str) -> None:
+        limiter.acquire(key)
+        order.append(key)
+
+    threads = []
+    for key, count in [("heavy", 4), ("light", 1)]:
+        for _ in range(count):
+            thread = threading.Thread(target=request, args=(key,))
+            thread.start()
+            threads.append(thread)
+        wait_until_queued(limiter, len(threads))
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert order[:2] == ["heavy", "light"]
+    assert order.count("heavy") == 4
+
+
+def test_retry_after_pauses_the_bucket() -> None:
+    limiter = RateLimiter(rate=1000, burst=10)
+    limiter.observe(httpx.Response(429, headers={"Retry-After": "0.2"}))
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.15
+
+
+def test_exhausted_rate_limit_headers_pause_until_reset() -> None:
+    limiter = RateLimiter(rate=1000, burst=10)
+    limiter.observe(httpx.Response(200, headers={"X-RateLimit-Remaining": "5", "X-RateLimit-Reset": "30"}))
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start < 0.05
+
+    limiter.observe(httpx.Response(200, headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "0.2"}))
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.15
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("120", 120.0), (None, None), ("soon", None), ("-5", 0.0)],
+)
+def test_seconds_from_header(value: str, expected: float) -> None:
+    assert _seconds_from_header(value, now=time.time()) == expected
+
+
+def test_seconds_from_header_accepts_dates_and_timestamps() -> None:
+    now = time.time()
+    assert _seconds_from_header(str(int(now) + 30), now) == pytest.approx(30, abs=1)
+    assert _seconds_from_header(formatdate(now + 30, usegmt=True), now) == pytest.approx(30, abs=1)
+
+
+def test_async_waiters_do_not_block_the_event_loop() -> None:
+    limiter = RateLimiter(rate=10, burst=1)
+
+    async def scenario() -> int:
+        ticks = 0
+        stop = asyncio.Event()
+
+        async def ticker() -> None:
+            nonlocal ticks
+            while not stop.is_set():
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        task = asyncio.create_task(ticker())
+        await limiter.acquire_async("a")
+        await limiter.acquire_async("a")  # waits ~100 ms for a token
+        stop.set()
+        await task
+        return ticks
+
+    assert asyncio.run(scenario()) >= 5
+
+
+def test_cancelled_async_waiter_leaves_the_queue() -> None:
+    limiter = RateLimiter(rate=0.1, burst=1)
+
+    async def scenario() -> None:
+        await limiter.acquire_async()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire_async(), 0.05)
+
+    asyncio.run(scenario())
+    assert limiter.queued == 0
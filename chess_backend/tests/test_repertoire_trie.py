@@ -1,9 +1,22 @@
 # tests/test_repertoire_trie.py
+from typing import Optional
+from unittest.mock import patch
+
+import chess
 import pytest
 
+from chess_utils import calculate_previous_position_fen
 from deviation_result import DeviationResult
-from pgn_utils import pgn_string_to_game
-from repertoire_trie import RepertoireTrie, TrieNode
+from pgn_utils import pgn_string_to_game, read_mainline
+from repertoire_trie import (
+    CompactRepertoireTrie,
+    RepertoireGraph,
+    RepertoireTrie,
+    TrieNode,
+    _TrieWalker,
+    decode_move,
+    encode_move,
+)
 
 
 def test_trie_node_initialization() -> None:
@@ -163,6 +176,55 @@ def test_find_deviation_by_opponent(sample_trie: RepertoireTrie) -> None:
     assert "d6" in result.reference_san
 
 
+@pytest.mark.parametrize(
+    "game_pgn",
+    ["1. d4", "1. e4 d5", "1. e4 e5 2. Nf3 Nf6", "1. e4 e5 2. Nf3 Nc6 3. d4", "1. e4 c5 2. Nf3"],
+)
+def test_find_deviation_previous_position_matches_replaying_the_pgn(sample_trie: RepertoireTrie, game_pgn: str) -> None:
+    """The previous position taken from the walk is the one the PGN replay used to produce."""
+    game = pgn_string_to_game(f'[White "user_test"]\n[Black "opponent"]\n\n{game_pgn}')
+    result = sample_trie.find_deviation(game, "user_test")
+
+    assert result is not None
+    assert result.previous_position_fen == calculate_previous_position_fen(
+        str(game), result.move_number, result.player_color
+    )
+
+
+@pytest.mark.parametrize(
+    "game_pgn",
+    [
+        "1. e4 { [%clk 0:03:00] } 1... e5 { [%clk 0:03:00] } 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6",
+        "1. e4 { [%clk 0:03:00] } 1... e5 2. Nf3 (2. f4 exf4) 2... Nc6 3. d4!? exd4",
+        "1. e4 e5 2. Nf3 Nf6 $2 3. Nxe5 1-0",
+        "1. e4 c5 2. Nf3 { [%clk 0:02:58] } *",
+    ],
+)
+def test_find_deviation_on_mainline_only_reader_matches_full_parse(sample_trie: RepertoireTrie, game_pgn: str) -> None:
+    """The lightweight reader yields the same deviation as a full chess.pgn parse."""
+    pgn = f'[White "opponent"]\n[Black "user_test"]\n\n{game_pgn}'
+
+    assert sample_trie.find_deviation(read_mainline(pgn), "user_test") == sample_trie.find_deviation(
+        pgn_string_to_game(pgn), "user_test"
+    )
+
+
+def test_find_deviation_only_renders_the_deviating_position(sample_trie: RepertoireTrie) -> None:
+    """In-book and past-book plies cost no FEN or SAN; the deviation needs one of each per position."""
+    in_book = pgn_string_to_game('[White "user_test"]\n[Black "opponent"]\n\n1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6')
+    deviating = pgn_string_to_game('[White "user_test"]\n[Black "opponent"]\n\n1. e4 e5 2. Nf3 Nc6 3. d4 exd4')
+
+    with (
+        patch.object(chess.Board, "fen", autospec=True, side_effect=chess.Board.fen) as fen,
+        patch.object(chess.Board, "san", autospec=True, side_effect=chess.Board.san) as san,
+    ):
+        assert sample_trie.find_deviation(in_book, "user_test") is None
+        assert (fen.call_count, san.call_count) == (0, 0)
+
+        assert sample_trie.find_deviation(deviating, "user_test") is not None
+        assert (fen.call_count, san.call_count) == (2, 1)
+
+
 def test_find_deviation_end_of_book_no_false_positive(sample_trie: RepertoireTrie) -> None:
     """Game continues beyond end of repertoire - should NOT be flagged as deviation."""
     # Game follows our prep: 1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 (all in repertoire)
@@ -178,6 +240,33 @@ def test_find_deviation_end_of_book_no_false_positive(sample_trie: RepertoireTri
     assert result is None
 
 
+def test_find_deviation_stops_reading_the_game_at_end_of_book(sample_trie: RepertoireTrie) -> None:
+    """Moves past the end of the book are never resolved from SAN."""
+    game = read_mainline(
+        '[White "user_test"]\n[Black "opponent"]\n\n1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. O-O Be7'
+    )
+
+    with patch.object(chess.Board, "push_san", autospec=True, side_effect=chess.Board.push_san) as push_san:
+        assert sample_trie.find_deviation(game, "user_test") is None
+
+    # Six plies in book plus the one that leaves it
+    assert push_san.call_count == 7
+
+
+def test_max_depth_is_the_longest_prepared_line(sample_trie: RepertoireTrie) -> None:
+    compact = CompactRepertoireTrie()
+    compact.add_study_chapter(pgn_string_to_game("1. e4 e5 2. Nf3 Nc6 (2... d6 3. d4) 3. Bb5 a6 (3... Nf6) *"))
+    compact.add_study_chapter(pgn_string_to_game("1. e4 c5 2. Nc3 *"))
+    graph = RepertoireGraph()
+    graph.add_study_chapter(pgn_string_to_game("1. e4 e5 2. Nf3 Nc6 *"))
+
+    assert sample_trie.max_depth == 6
+    assert compact.max_depth == 6
+    assert CompactRepertoireTrie.from_buffer(compact.to_bytes()).max_depth == 6
+    assert CompactRepertoireTrie().max_depth == 0
+    assert graph.max_depth is None
+
+
 def test_find_deviation_end_of_book_different_line(sample_trie: RepertoireTrie) -> None:
     """Game follows a different prep line to the end, then continues - should NOT be flagged."""
     # Follow the Sicilian prep: 1. e4 c5 2. Nc3 (end of our prep)
@@ -322,3 +411,173 @@ def test_no_end_of_book_reference_in_valid_deviations(sample_trie: RepertoireTri
         assert result.first_deviator == expected_deviator
         assert expected_reference in result.reference_san
         assert "End of book" not in result.reference_san, f"Found 'End of book' in reference for: {game_pgn}"
+
+
+# --- CompactRepertoireTrie ---
+
+
+def test_encode_decode_move_roundtrip() -> None:
+    """Packed moves survive a roundtrip, including promotions."""
+    for uci in ["e2e4", "g1f3", "e7e8q", "a2a1n", "h7g8r", "b2c1b"]:
+        move = chess.Move.from_uci(uci)
+        code = encode_move(move)
+        assert code < 1 << 16
+        assert decode_move(code) == move
+
+
+def test_compact_trie_matches_node_trie_structure() -> None:
+    """The compact trie stores the same moves and SANs as the node-based trie."""
+    pgn = "1. e4 (1. d4 d5) e5 2. Nf3 (2. f4) Nc6"
+    trie = CompactRepertoireTrie()
+    trie.add_study_chapter(pgn_string_to_game(pgn))
+
+    assert sorted(trie.root_moves()) == [("d2d4", "d4"), ("e2e4", "e4")]
+    # root + e4, d4, e5, d5, Nf3, f4, Nc6
+    assert len(trie) == 8
+    assert trie.nbytes > 0
+
+
+def test_compact_trie_merges_chapters() -> None:
+    """Adding a second chapter keeps the lines from the first one."""
+    trie = CompactRepertoireTrie()
+    trie.add_study_chapter(pgn_string_to_game("1. e4 e5 2. Nf3 *"))
+    trie.add_study_chapter(pgn_string_to_game("1. e4 c5 2. Nc3 *"))
+
+    assert trie.root_moves() == [("e2e4", "e4")]
+    assert len(trie) == 6
+
+    game = pgn_string_to_game('[White "user_test"]\n[Black "opponent"]\n\n1. e4 d5')
+    result = trie.find_deviation(game, "user_test")
+    assert isinstance(result, DeviationResult)
+    assert result.reference_san == "c5 or e5"
+    assert result.reference_uci == "c7c5, e7e5"
+
+
+@pytest.mark.parametrize(
+    "game_pgn",
+    [
+        "1. e4 e5 2. Nf3 Nc6 3. Bb5",
+        "1. e4 e5 2. Nf3 Nc6 3. d4",
+        "1. e4 e5 2. Nf3 Nf6",
+        "1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. O-O Be7",
+        "1. e4 c5 2. Nc3 d6 3. f4 g6 4. Nf3",
+        "1. d4",
+        "1. e4 d5",
+    ],
+)
+def test_compact_trie_find_deviation_matches_node_trie(sample_trie: RepertoireTrie, game_pgn: str) -> None:
+    """Both engines report identical deviations for the same repertoire."""
+    compact = CompactRepertoireTrie()
+    compact.add_study_chapter(pgn_string_to_game("1. e4 e5 2. Nf3 Nc6 (2... d6 3. d4) 3. Bb5 a6 (3... Nf6) *"))
+    compact.add_study_chapter(pgn_string_to_game("1. e4 c5 2. Nc3 *"))
+
+    game = pgn_string_to_game(f'[White "user_test"]\n[Black "opponent"]\n\n{game_pgn}')
+    expected = sample_trie.find_deviation(game, "user_test")
+    result = compact.find_deviation(game, "user_test")
+
+    assert result == expected
+    if expected is not None:
+        assert result is not None
+        assert result.reference_uci == expected.reference_uci
+        assert result.board_fen == expected.board_fen
+        assert result.previous_position_fen == expected.previous_position_fen
+
+
+# --- RepertoireGraph ---
+
+
+def test_repertoire_graph_shares_transposed_positions() -> None:
+    """Two move orders reaching the same position are stored once."""
+    graph = RepertoireGraph()
+    graph.add_study_chapter(pgn_string_to_game("1. d4 Nf6 2. c4 e6 *"))
+    graph.add_study_chapter(pgn_string_to_game("1. c4 e6 2. d4 Nf6 *"))
+
+    # start, d4, d4 Nf6, d4 Nf6 c4, c4, c4 e6, c4 e6 d4, final (shared)
+    assert len(graph) == 8
+    assert sorted(graph.root_moves()) == [("c2c4", "c4"), ("d2d4", "d4")]
+
+
+def test_repertoire_graph_follows_transposition() -> None:
+    """A game reaching a prepared position by another move order is not a deviation."""
+    chapters = ["1. d4 Nf6 2. c4 e6 3. Nc3 Bb4 *", "1. c4 Nf6 2. Nc3 e6 3. e4 d5 *"]
+    graph = RepertoireGraph()
+    trie = RepertoireTrie()
+    for chapter in chapters:
+        graph.add_study_chapter(pgn_string_to_game(chapter))
+        trie.add_study_chapter(pgn_string_to_game(chapter))
+
+    # 3. d4 transposes from the English into the Nimzo-Indian chapter.
+    game = pgn_string_to_game('[White "opponent"]\n[Black "user_test"]\n\n1. c4 Nf6 2. Nc3 e6 3. d4 Bb4')
+    trie_result = trie.find_deviation(game, "user_test")
+    assert isinstance(trie_result, DeviationResult)
+    assert trie_result.deviation_san == "d4"
+    assert graph.find_deviation(game, "user_test") is None
+
+    # Deviating after the transposition is still caught.
+    game = pgn_string_to_game('[White "opponent"]\n[Black "user_test"]\n\n1. c4 Nf6 2. Nc3 e6 3. d4 b6')
+    result = graph.find_deviation(game, "user_test")
+    assert isinstance(result, DeviationResult)
+    assert result.first_deviator == "user"
+    assert result.move_number == 3
+    assert result.deviation_san == "b6"
+    assert result.reference_san == "Bb4"
+
+
+def test_repertoire_graph_finds_deviations_in_fen_rooted_chapters() -> None:
+    """A game from the standard start transposes into chapters that start after 1. e4."""
+    graph = RepertoireGraph()
+    graph.add_study_chapter(
+        pgn_string_to_game('[FEN "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"]\n\n1... c5 2. Nf3 d6 *')
+    )
+
+    game = pgn_string_to_game('[White "opponent"]\n[Black "user_test"]\n\n1. e4 e5')
+    result = graph.find_deviation(game, "user_test")
+    assert isinstance(result, DeviationResult)
+    assert result.first_deviator == "user"
+    assert result.deviation_san == "e5"
+    assert result.reference_san == "c5"
+
+    game = pgn_string_to_game('[White "opponent"]\n[Black "user_test"]\n\n1. e4 c5 2. Nf3 d6 3. d4 cxd4')
+    assert graph.find_deviation(game, "user_test") is None
+
+
+@pytest.mark.parametrize(
+    "game_pgn",
+    [
+        "1. e4 e5 2. Nf3 Nc6 3. Bb5",
+        "1. e4 e5 2. Nf3 Nc6 3. d4",
+        "1. e4 e5 2. Nf3 Nf6",
+        "1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. O-O Be7",
+        "1. e4 c5 2. Nc3 d6 3. f4 g6 4. Nf3",
+        "1. d4",
+        "1. e4 d5",
+    ],
+)
+def test_repertoire_graph_find_deviation_matches_node_trie(sample_trie: RepertoireTrie, game_pgn: str) -> None:
+    """Without transpositions the graph reports the same deviations as the trie."""
+    graph = RepertoireGraph()
+    graph.add_study_chapter(pgn_string_to_game("1. e4 e5 2. Nf3 Nc6 (2... d6 3. d4) 3. Bb5 a6 (3... Nf6) *"))
+    graph.add_study_chapter(pgn_string_to_game("1. e4 c5 2. Nc3 *"))
+
+    game = pgn_string_to_game(f'[White "user_test"]\n[Black "opponent"]\n\n{game_pgn}')
+    expected = sample_trie.find_deviation(game, "user_test")
+    result = graph.find_deviation(game, "user_test")
+
+    assert result == expected
+    if expected is not None:
+        assert result is not None
+        assert result.reference_uci == expected.reference_uci
+
+
+def test_trie_walker_subclass_must_implement_every_hook() -> None:
+    """A walker missing a navigation hook fails when created, not partway through a walk."""
+
+    class Incomplete(_TrieWalker[int]):
+        def _root_node(self, board: chess.Board) -> int:
+            return 0
+
+        def _child_node(self, node: int, move: chess.Move) -> Optional[int]:
+            return None
+
+    with pytest.raises(TypeError, match="_expected_moves"):
+        Incomplete()  # type: ignore[abstract]
@@ -0,0 +1,66 @@
+# tests/test_singleflight.py
+import asyncio
+import threading
+import time
+from typing import List
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_for_one_key_share_a_single_run() -> None:
+    flights: SingleFlight[str, int] = SingleFlight()
+    calls: List[int] = []
+    results: List[int] = []
+
+    def slow() -> int:
+        calls.append(1)
+        time.sleep(0.1)
+        return 42
+
+    threads = [threading.Thread(target=lambda: results.append(flights.do("study", slow))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [42] * 8
+
+
+def test_errors_are_shared_and_not_remembered() -> None:
+    flights: SingleFlight[str, int] = SingleFlight()
+
+    def broken() -> int:
+        raise ValueError("fetch failed")
+
+    with pytest.raises(ValueError):
+        flights.do("study", broken)
+    assert flights.do("study", lambda: 7) == 7
+
+
+def test_different_keys_run_independently() -> None:
+    flights: SingleFlight[str, str] = SingleFlight()
+    assert flights.do("a", lambda: "A") == "A"
+    assert flights.do("b", lambda: "B") == "B"
+
+
+def test_async_calls_share_a_run_and_survive_a_cancelled_waiter() -> None:
+    flights: AsyncSingleFlight[str, int] = AsyncSingleFlight()
+    calls: List[int] = []
+
+    async def slow() -> int:
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def scenario() -> List[int]:
+        impatient = asyncio.ensure_future(flights.do("token", slow))
+        patient = [asyncio.ensure_future(flights.do("token", slow)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return list(await asyncio.gather(*patient))
+
+    assert asyncio.run(scenario()) == [42, 42, 42]
+    assert len(calls) == 1
@@ -0,0 +1,82 @@
+# tests/test_streaming.py
+import threading
+import time
+from typing import Iterator, List
+
+import pytest
+
+from streaming import bounded_prefetch, iter_ndjson
+
+
+def test_iter_ndjson_skips_blank_malformed_and_oversized_lines() -> None:
+    lines = [
+        '{"id": "a"}',
+        "",
+        "   ",
+        "{not json",
+        '["not", "an", "object"]',
+        '{"id": "' + "x" * 50 + '"}',
+        '{"id": "b"}',
+    ]
+    records = list(iter_ndjson(lines, max_line_chars=40))
+    assert records == [{"id": "a"}, {"id": "b"}]
+
+
+def test_iter_ndjson_is_lazy() -> None:
+    consumed: List[int] = []
+
+    def lines() -> Iterator[str]:
+        for i in range(3):
+            consumed.append(i)
+            yield f'{{"n": {i}}}'
+
+    records = iter_ndjson(lines())
+    assert next(records) == {"n": 0}
+    assert consumed == [0]
+
+
+def test_bounded_prefetch_preserves_order() -> None:
+    assert list(bounded_prefetch(range(100), maxsize=4)) == list(range(100))
+
+
+def test_bounded_prefetch_limits_read_ahead() -> None:
+    produced: List[int] = []
+
+    def source() -> Iterator[int]:
+        for i in range(50):
+            produced.append(i)
+            yield i
+
+    items = bounded_prefetch(source(), maxsize=3)
+    assert next(items) == 0
+    time.sleep(0.3)
+    # One item consumed, three buffered, one held by the blocked producer.
+    assert len(produced) <= 5
+    items.close()
+
+
+def test_bounded_prefetch_reraises_producer_errors() -> None:
+    def source() -> Iterator[int]:
+        yield 1
+        raise ValueError("stream broke")
+
+    items = bounded_prefetch(source(), maxsize=2)
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="stream broke"):
+        next(items)
+
+
+def test_bounded_prefetch_closes_source_on_early_exit() -> None:
+    closed = threading.Event()
+
+    def source() -> Iterator[int]:
+        try:
+            for i in range(1000):
+                yield i
+        finally:
+            closed.set()
+
+    items = bounded_prefetch(source(), maxsize=2)
+    assert next(items) == 0
+    items.close()
+    assert closed.wait(timeout=2.0)
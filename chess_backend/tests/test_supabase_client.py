@@ -0,0 +1,195 @@
+# tests/test_supabase_client.py
+from typing import Any, Dict, Generator, List
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import supabase_client
+from supabase_client import DeviationWriter, get_study_id_from_url, get_user_id_from_username
+
+
+class FakeTable:
+    """Records upserts; rows whose game_id is in ``reject`` make the whole call fail."""
+
+    def __init__(self, reject: List[str]) -> None:
+        self.reject = reject
+        self.calls: List[Any] = []
+        self._pending: Any = None
+
+    def upsert(self, rows: Any, on_conflict: str) -> "FakeTable":
+        assert on_conflict == "game_id, user_id"
+        self._pending = rows
+        return self
+
+    def execute(self) -> None:
+        rows = self._pending if isinstance(self._pending, list) else [self._pending]
+        if any(row["game_id"] in self.reject for row in rows):
+            raise Exception("violates check constraint")
+        self.calls.append(self._pending)
+
+
+@pytest.fixture(autouse=True)
+def empty_lookup_caches() -> Generator[None, None, None]:
+    supabase_client.user_ids.clear()
+    supabase_client.study_ids.clear()
+    yield
+    supabase_client.user_ids.clear()
+    supabase_client.study_ids.clear()
+
+
+def admin_client_returning(rows: List[Dict[str, Any]]) -> MagicMock:
+    """An admin client whose every select query returns ``rows``."""
+    client = MagicMock()
+    query = client.table.return_value.select.return_value
+    query.eq.return_value = query
+    query.limit.return_value = query
+    query.execute.return_value.data = rows
+    return client
+
+
+@pytest.fixture
+def table() -> Generator[FakeTable, None, None]:
+    fake = FakeTable(reject=[])
+    client = MagicMock()
+    client.table.return_value = fake
+    with patch("supabase_client.get_admin_client", return_value=client):
+        yield fake
+
+
+def deviation(move: str = "c5") -> Dict[str, Any]:
+    return {"board_fen": "fen", "reference_san": "e5", "deviation_san": move, "move_number": 1}
+
+
+def pgn(game_id: str) -> str:
+    return f'[Site "https://lichess.org/{game_id}"]\n\n1. e4 *'
+
+
+def test_rows_are_upserted_in_chunks_with_one_study_lookup(table: FakeTable) -> None:
+    with patch("supabase_client.get_study_id_from_url", return_value="study-uuid") as lookup:
+        with DeviationWriter("user-1", chunk_size=2) as writer:
+            for i in range(5):
+                writer.add(deviation(), pgn(f"game{i:04d}"), "https://lichess.org/study/white")
+
+    assert [len(call) for call in table.calls] == [2, 2, 1]
+    assert lookup.call_count == 1
+    assert all(row["study_id"] == "study-uuid" and row["user_id"] == "user-1" for call in table.calls for row in call)
+    assert writer.written == 5 and writer.failures == []
+
+
+def test_duplicate_games_keep_the_last_row(table: FakeTable) -> None:
+    writer = DeviationWriter("user-1")
+    writer.add(deviation("c5"), pgn("game0001"))
+    writer.add(deviation("e6"), pgn("game0002"))
+    writer.add(deviation("d5"), pgn("game0001"))
+    writer.flush()
+
+    (rows,) = table.calls
+    assert [(row["game_id"], row["actual_move"]) for row in rows] == [("game0002", "e6"), ("game0001", "d5")]
+
+
+def test_failed_chunk_is_retried_row_by_row(table: FakeTable) -> None:
+    table.reject = ["game0002"]
+    writer = DeviationWriter("user-1")
+    for i in range(1, 4):
+        writer.add(deviation(), pgn(f"game{i:04d}"))
+    failures = writer.flush()
+
+    assert [f.game_id for f in failures] == ["game0002"]
+    assert "check constraint" in failures[0].error
+    assert [row["game_id"] for row in table.calls] == ["game0001", "game0003"]
+    assert writer.written == 2
+
+
+def test_user_id_lookups_are_cached() -> None:
+    client = admin_client_returning([{"id": "uuid-1"}])
+    with patch("supabase_client.get_admin_client", return_value=client):
+        assert get_user_id_from_username("alice") == "uuid-1"
+        assert get_user_id_from_username("alice") == "uuid-1"
+    assert client.table.call_count == 1
+    assert supabase_client.lookup_cache_stats()["user_ids"]["hit_rate"] == 0.5
+
+
+def test_unknown_users_are_negatively_cached_briefly() -> None:
+    client = admin_client_returning([])
+    now = [0.0]
+    with (
+        patch("supabase_client.get_admin_client", return_value=client),
+        patch.object(supabase_client.user_ids, "_clock", lambda: now[0]),
+    ):
+        for _ in range(3):
+            with pytest.raises(Exception, match="User not found"):
+                get_user_id_from_username("newcomer")
+        assert client.table.call_count == 1
+
+        # The user signs up; the miss expires long before a found ID would
+        client.table.return_value.select.return_value.execute.return_value.data = [{"id": "uuid-2"}]
+        now[0] = supabase_client.LOOKUP_NEGATIVE_TTL_SECONDS + 1
+        assert get_user_id_from_username("newcomer") == "uuid-2"
+        assert client.table.call_count == 2
+
+
+def test_study_id_lookups_are_cached_per_user() -> None:
+    client = admin_client_returning([{"id": "study-uuid"}])
+    url = "https://lichess.org/study/white123"
+    with patch("supabase_client.get_admin_client", return_value=client):
+        assert get_study_id_from_url(url, "user-1") == "study-uuid"
+        assert get_study_id_from_url(url, "user-1") == "study-uuid"
+        assert client.table.call_count == 1
+
+        assert get_study_id_from_url(url, "user-2") == "study-uuid"
+        assert client.table.call_count == 2
+
+
+def test_rows_carry_the_game_date_from_the_pgn_headers() -> None:
+    headers = '[Site "https://lichess.org/game0001"]\n[UTCDate "2024.03.20"]\n[UTCTime "18:05:09"]\n\n1. e4 *'
+    row = supabase_client.build_deviation_row(deviation(), headers, "user-1")
+    assert row["game_date"] == "2024-03-20T18:05:09+00:00"
+
+
+def deviation_rows(count: int) -> List[Dict[str, Any]]:
+    return [
+        {"id": f"00000000-0000-0000-0000-{i:012d}", "game_date": f"2024-03-{20 - i:02d}T12:00:00+00:00"}
+        for i in range(count)
+    ]
+
+
+def test_pages_are_ordered_in_the_database_and_continue_from_the_cursor() -> None:
+    client = MagicMock()
+    query = client.table.return_value.select.return_value
+    for method in ("eq", "order", "or_", "range"):
+        getattr(query, method).return_value = query
+    query.execute.return_value.data = deviation_rows(4)
+
+    with patch("supabase_client.get_default_client", return_value=client):
+        first = supabase_client.get_deviations_for_user("user-1", limit=3, active_studies_only=False)
+        query.execute.return_value.data = deviation_rows(4)[3:]
+        last = supabase_client.get_deviations_for_user(
+            "user-1", limit=3, active_studies_only=False, cursor=first.next_cursor
+        )
+
+    assert [row["id"] for row in first.rows] == [row["id"] for row in deviation_rows(3)]
+    assert first.next_cursor is not None and last.next_cursor is None
+    assert [c.args for c in query.order.call_args_list[:2]] == [("game_date",), ("id",)]
+    assert [c.args for c in query.range.call_args_list] == [(0, 3), (0, 3)]
+    (keyset,) = query.or_.call_args.args
+    assert '"2024-03-18T12:00:00+00:00"' in keyset and "id.lt.00000000-0000-0000-0000-000000000002" in keyset
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "WyJ4IiwgInkiXQ=="])
+def test_malformed_cursors_are_rejected(cursor: str) -> None:
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        supabase_client.decode_deviation_cursor(cursor)
+
+
+def test_summary_pages_select_the_header_block_instead_of_the_pgn() -> None:
+    client = MagicMock()
+    query = client.table.return_value.select.return_value
+    for method in ("eq", "order", "range"):
+        getattr(query, method).return_value = query
+    query.execute.return_value.data = []
+
+    with patch("supabase_client.get_default_client", return_value=client):
+        supabase_client.get_deviations_for_user("user-1", active_studies_only=False, summary=True)
+
+    (columns,) = client.table.return_value.select.call_args.args
+    assert "pgn_headers" in columns and "pgn," not in columns
@@ -0,0 +1,69 @@
+# tests/test_token_cache.py
+import asyncio
+from typing import List
+
+import pytest
+
+from token_cache import TokenCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_concurrent_requests_with_one_token_validate_once() -> None:
+    cache = TokenCache(ttl_seconds=60)
+    checks: List[str] = []
+
+    async def validate(token: str) -> str:
+        checks.append(token)
+        await asyncio.sleep(0.05)
+        return "alice"
+
+    async def scenario() -> List[str]:
+        burst = await asyncio.gather(*(cache.username("tok", validate) for _ in range(10)))
+        return list(burst) + [await cache.username("tok", validate)]
+
+    assert asyncio.run(scenario()) == ["alice"] * 11
+    assert checks == ["tok"]
+
+
+def test_tokens_are_revalidated_after_the_ttl() -> None:
+    clock = FakeClock()
+    cache = TokenCache(ttl_seconds=60, clock=clock)
+    checks: List[str] = []
+
+    async def validate(token: str) -> str:
+        checks.append(token)
+        return "alice"
+
+    asyncio.run(cache.username("tok", validate))
+    clock.now += 59
+    asyncio.run(cache.username("tok", validate))
+    clock.now += 2
+    asyncio.run(cache.username("tok", validate))
+    assert len(checks) == 2
+
+
+def test_failed_validations_are_not_cached_and_eviction_forces_a_recheck() -> None:
+    cache = TokenCache(ttl_seconds=60)
+    checks: List[str] = []
+
+    async def rejected(token: str) -> str:
+        checks.append(token)
+        raise PermissionError("401")
+
+    async def accepted(token: str) -> str:
+        checks.append(token)
+        return "alice"
+
+    with pytest.raises(PermissionError):
+        asyncio.run(cache.username("tok", rejected))
+    assert asyncio.run(cache.username("tok", accepted)) == "alice"
+    assert cache.evict("tok")
+    asyncio.run(cache.username("tok", accepted))
+    assert len(checks) == 3
@@ -0,0 +1,95 @@
+# tests/test_trie_cache.py
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from deviation_result import DeviationResult
+from pgn_utils import pgn_string_to_game
+from repertoire_trie import CompactRepertoireTrie
+from trie_cache import build_trie, cache_path, load_or_build, load_trie, save_trie
+
+STUDY_PGN = """[Event "Chapter 1"]
+
+1. e4 e5 2. Nf3 Nc6 (2... d6 3. d4) 3. Bb5 *
+
+
+[Event "Chapter 2"]
+
+1. e4 c5 2. Nc3 *"""
+
+
+def test_compiled_trie_roundtrip() -> None:
+    """A trie loaded from its serialized bytes has the same nodes and answers."""
+    trie = build_trie(STUDY_PGN)
+    loaded = CompactRepertoireTrie.from_buffer(trie.to_bytes())
+
+    assert len(loaded) == len(trie)
+    assert loaded.root_moves() == trie.root_moves()
+
+    game = pgn_string_to_game('[White "user_test"]\n[Black "opponent"]\n\n1. e4 e5 2. Nf3 Nf6')
+    result = loaded.find_deviation(game, "user_test")
+    assert isinstance(result, DeviationResult)
+    assert result == trie.find_deviation(game, "user_test")
+    assert result.reference_san == "Nc6 or d6"
+
+
+def test_from_buffer_rejects_bad_data() -> None:
+    """Foreign or truncated files are rejected instead of being misread."""
+    with pytest.raises(ValueError):
+        CompactRepertoireTrie.from_buffer(b"not a trie at all")
+    with pytest.raises(ValueError):
+        CompactRepertoireTrie.from_buffer(build_trie(STUDY_PGN).to_bytes()[:-3])
+
+
+def test_mmap_loaded_trie_accepts_new_chapters(tmp_path: Path) -> None:
+    """A memory-mapped trie can still be extended; it is copied into arrays."""
+    path = tmp_path / "study.trie"
+    save_trie(build_trie(STUDY_PGN), path)
+    trie = load_trie(path)
+
+    trie.add_study_chapter(pgn_string_to_game("1. d4 d5 *"))
+    assert sorted(san for _, san in trie.root_moves() if san) == ["d4", "e4"]
+
+
+def test_load_or_build_reuses_cache_file(tmp_path: Path) -> None:
+    """The second load of the same study version skips parsing entirely."""
+    first = load_or_build("abc123", STUDY_PGN, cache_dir=tmp_path)
+    assert cache_path("abc123", STUDY_PGN, tmp_path).exists()
+
+    with patch("trie_cache.build_trie") as mock_build:
+        second = load_or_build("abc123", STUDY_PGN, cache_dir=tmp_path)
+        mock_build.assert_not_called()
+
+    assert len(second) == len(first)
+    assert second.root_moves() == first.root_moves()
+
+
+def test_load_or_build_keys_on_study_content(tmp_path: Path) -> None:
+    """Editing the study produces a new cache file instead of a stale hit, and replaces the old one."""
+    edited = STUDY_PGN.replace("2. Nc3", "2. Nf3")
+    assert cache_path("abc123", STUDY_PGN, tmp_path) != cache_path("abc123", edited, tmp_path)
+
+    load_or_build("abc123", STUDY_PGN, cache_dir=tmp_path)
+    old = load_or_build("abc123", STUDY_PGN, cache_dir=tmp_path)  # memory-mapped from the cache file
+    save_trie(build_trie(STUDY_PGN), cache_path("abc1234", STUDY_PGN, tmp_path))  # another study
+    trie = load_or_build("abc123", edited, cache_dir=tmp_path)
+    assert sorted(tmp_path.glob("*.trie")) == sorted(
+        [cache_path("abc123", edited, tmp_path), cache_path("abc1234", STUDY_PGN, tmp_path)]
+    )
+    assert len(old.root_moves()) == 1  # still readable after its file was removed
+
+    game = pgn_string_to_game('[White "user_test"]\n[Black "opponent"]\n\n1. e4 c5 2. Nc3')
+    result = trie.find_deviation(game, "user_test")
+    assert isinstance(result, DeviationResult)
+    assert result.reference_san == "Nf3"
+
+
+def test_load_or_build_rebuilds_corrupt_file(tmp_path: Path) -> None:
+    """A damaged cache file is replaced rather than failing the analysis."""
+    path = cache_path("abc123", STUDY_PGN, tmp_path)
+    path.write_bytes(b"garbage")
+
+    trie = load_or_build("abc123", STUDY_PGN, cache_dir=tmp_path)
+    assert len(trie) == len(build_trie(STUDY_PGN))
+    assert len(load_trie(path)) == len(trie)
@@ -0,0 +1,91 @@
+# tests/test_ttl_cache.py
+from typing import List
+
+from ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_get_returns_stored_value_and_counts_hits() -> None:
+    cache: TTLCache[str, int] = TTLCache(ttl_seconds=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert "a" in cache
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+    assert cache.stats.hit_rate == 0.5
+
+
+def test_entries_expire_after_ttl() -> None:
+    clock = FakeClock()
+    cache: TTLCache[str, int] = TTLCache(ttl_seconds=60, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl_seconds=600)
+
+    clock.now += 61
+    assert cache.get("a") is None
+    assert "a" not in cache
+    assert cache.get("b") == 2
+    assert cache.stats.expirations == 1
+
+
+def test_peek_returns_stale_entries_for_revalidation() -> None:
+    clock = FakeClock()
+    cache: TTLCache[str, int] = TTLCache(ttl_seconds=60, clock=clock)
+    cache.set("a", 1)
+    clock.now += 61
+
+    assert cache.get("a") is None
+    assert cache.peek("a") == 1
+    assert cache.peek("missing") is None
+
+    # Re-storing the stale value renews it.
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+
+def test_lru_eviction_by_estimated_size() -> None:
+    cache: TTLCache[str, List[int]] = TTLCache(ttl_seconds=60, max_bytes=10, sizeof=len)
+    cache.set("a", [0] * 4)
+    cache.set("b", [0] * 4)
+    cache.get("a")  # "b" is now the least recently used entry
+    cache.set("c", [0] * 4)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.current_bytes == 8
+    assert cache.stats.evictions == 1
+
+
+def test_lru_eviction_by_entry_count() -> None:
+    cache: TTLCache[int, int] = TTLCache(ttl_seconds=60, max_entries=2)
+    for key in range(3):
+        cache.set(key, key)
+    assert 0 not in cache
+    assert len(cache) == 2
+
+
+def test_oversized_values_are_not_cached() -> None:
+    cache: TTLCache[str, List[int]] = TTLCache(ttl_seconds=60, max_bytes=10, sizeof=len)
+    cache.set("small", [0])
+    cache.set("huge", [0] * 11)
+    assert "huge" not in cache
+    assert "small" in cache
+
+
+def test_invalidate_and_overwrite_keep_size_accounting() -> None:
+    cache: TTLCache[str, List[int]] = TTLCache(ttl_seconds=60, max_bytes=10, sizeof=len)
+    cache.set("a", [0] * 3)
+    cache.set("a", [0] * 5)
+    assert cache.current_bytes == 5
+    assert cache.invalidate("a") is True
+    assert cache.invalidate("a") is False
+    assert cache.current_bytes == 0
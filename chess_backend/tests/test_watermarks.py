@@ -0,0 +1,55 @@
+# tests/test_watermarks.py
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+import watermarks
+from watermarks import Watermark
+
+NOON = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_covers_only_games_up_to_the_mark_for_the_same_studies() -> None:
+    mark = Watermark(last_game_id="abcd1234", last_game_at=NOON, study_version="v1")
+    assert mark.covers("abcd1234", None, "v1")
+    assert mark.covers("older000", datetime(2024, 5, 1, 11, 0, tzinfo=timezone.utc), "v1")
+    assert not mark.covers("newer000", datetime(2024, 5, 1, 13, 0, tzinfo=timezone.utc), "v1")
+    assert not mark.covers("abcd1234", NOON, "v2")
+    assert not mark.covers("abcd1234", NOON, None)
+
+
+def test_game_played_at_reads_created_at_milliseconds() -> None:
+    assert watermarks.game_played_at({"createdAt": int(NOON.timestamp() * 1000)}) == NOON
+    assert watermarks.game_played_at({}) is None
+
+
+def test_row_round_trip() -> None:
+    mark = Watermark(last_game_id="abcd1234", last_game_at=NOON, study_version="v1")
+    assert Watermark.from_row(mark.to_row()) == mark
+    assert Watermark.from_row({"last_game_at": "2024-05-01T12:00:00Z"}).last_game_at == NOON
+
+
+def test_save_and_load_use_the_database_when_it_is_up(tmp_path: Path) -> None:
+    rows: List[Dict[str, Any]] = []
+    mark = Watermark(last_game_id="abcd1234", last_game_at=NOON, study_version="v1")
+    with (
+        patch("watermarks.WATERMARK_DIR", tmp_path),
+        patch("watermarks.supabase_client.upsert_analysis_watermark", lambda user_id, row: rows.append(row)),
+        patch("watermarks.supabase_client.get_analysis_watermark", lambda user_id: rows[-1]),
+    ):
+        watermarks.save("user-1", mark)
+        assert watermarks.load("user-1") == mark
+    assert rows == [mark.to_row()]
+
+
+def test_load_falls_back_to_the_local_copy_when_the_database_fails(tmp_path: Path) -> None:
+    mark = Watermark(last_game_id="abcd1234", last_game_at=NOON, study_version="v1")
+    with (
+        patch("watermarks.WATERMARK_DIR", tmp_path),
+        patch("watermarks.supabase_client.upsert_analysis_watermark", side_effect=ConnectionError("down")),
+        patch("watermarks.supabase_client.get_analysis_watermark", side_effect=ConnectionError("down")),
+    ):
+        watermarks.save("user-1", mark)
+        assert watermarks.load("user-1") == mark
+        assert watermarks.load("someone-else") is None
@@ -0,0 +1,77 @@
+# tests/test_workers.py
+import asyncio
+import threading
+import time
+from typing import Any, Generator, List
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+import workers
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool() -> Generator[None, None, None]:
+    workers.shutdown()
+    with patch("workers.ANALYSIS_MAX_WORKERS", 2):
+        yield
+    workers.shutdown()
+
+
+def test_run_analysis_runs_on_the_bounded_pool() -> None:
+    running: List[int] = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def job(n: int) -> str:
+        with lock:
+            running.append(n)
+            peak[0] = max(peak[0], len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(n)
+        return threading.current_thread().name
+
+    async def scenario() -> List[str]:
+        return await asyncio.gather(*(workers.run_analysis(job, n) for n in range(6)))
+
+    names = asyncio.run(scenario())
+    assert all(name.startswith("analysis") for name in names)
+    assert peak[0] == 2
+
+
+def test_health_responds_while_an_analysis_is_running() -> None:
+    from main import app
+
+    release = threading.Event()
+
+    def slow_analysis(**kwargs: Any) -> list:
+        release.wait(timeout=5)
+        return []
+
+    async def scenario() -> float:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            analysis = asyncio.create_task(
+                client.post(
+                    "/api/analyze_games",
+                    json={
+                        "username": "someone",
+                        "study_url_white": "https://lichess.org/study/white123",
+                        "study_url_black": "https://lichess.org/study/black123",
+                    },
+                )
+            )
+            await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            health = await client.get("/health")
+            elapsed = time.perf_counter() - start
+            assert health.status_code == 200
+            assert not analysis.done()
+            release.set()
+            assert (await analysis).status_code == 200
+            return elapsed
+
+    with patch("main.perform_game_analysis", slow_analysis), patch("main.get_user_id_from_username", return_value="u1"):
+        assert asyncio.run(scenario()) < 1.0
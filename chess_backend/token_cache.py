@@ -0,0 +1,75 @@
+"""
+Cache of validated Lichess OAuth tokens.
+
+get_current_user used to call Lichess's /api/account on every authenticated
+request, adding an upstream round trip to each dashboard call and spending
+the shared Lichess rate budget. A token that validated recently is trusted
+for TOKEN_CACHE_TTL_SECONDS instead, and concurrent validations of one token
+(a browser tab firing several requests at once) share a single upstream
+check.
+
+Entries are keyed by a SHA-256 of the token, so raw tokens are never kept in
+memory longer than a request. Only successful validations are cached, and a
+token is evicted as soon as Lichess answers 401 for it, so a revoked token
+stops working at the latest when its entry expires.
+"""
+
+import hashlib
+import os
+import time
+from typing import Awaitable, Callable, Dict
+
+from singleflight import AsyncSingleFlight
+from ttl_cache import TTLCache
+
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "60"))
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """Maps bearer tokens to the Lichess username they were validated for."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = TOKEN_CACHE_TTL_SECONDS,
+        max_entries: int = TOKEN_CACHE_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._usernames: TTLCache[str, str] = TTLCache(ttl_seconds=ttl_seconds, max_entries=max_entries, clock=clock)
+        self._validations: AsyncSingleFlight[str, str] = AsyncSingleFlight()
+
+    async def username(self, token: str, validate: Callable[[str], Awaitable[str]]) -> str:
+        """
+        Returns the username for ``token``, calling ``validate(token)`` only if
+        it is not cached and no validation of it is already in flight.
+        Exceptions from ``validate`` propagate and nothing is cached.
+        """
+        key = token_key(token)
+        username = self._usernames.get(key)
+        if username is not None:
+            return username
+
+        async def check() -> str:
+            result = await validate(token)
+            self._usernames.set(key, result)
+            return result
+
+        return await self._validations.do(key, check)
+
+    def evict(self, token: str) -> bool:
+        """Forgets ``token``, e.g. after Lichess rejected it with a 401."""
+        return self._usernames.invalidate(token_key(token))
+
+    def clear(self) -> None:
+        self._usernames.clear()
+
+    def stats(self) -> Dict[str, float]:
+        return self._usernames.stats.as_dict()
+
+
+# Shared by get_current_user and the Lichess proxy in main.py.
+tokens = TokenCache()
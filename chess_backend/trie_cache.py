@@ -0,0 +1,136 @@
+"""
+On-disk cache of compiled repertoire tries.
+
+Building a RepertoireTrie means parsing every chapter of a study and replaying
+each line with ``chess.Board.san``/``push``. This module compiles a study once
+into the binary CompactRepertoireTrie layout and memory-maps it back on later
+runs, so loading a known study version is a file open rather than a parse.
+
+Cache files are named ``<study_id>-<content hash>.trie``: editing a study
+changes the hash of its PGN and therefore the file. Compiling a new version
+deletes the study's older files, so the cache holds one file per study.
+
+Usage:
+    python trie_cache.py compile <study url or id> [--pgn-file FILE]
+    python trie_cache.py inspect <cache file>
+"""
+
+import mmap
+import os
+from pathlib import Path
+from typing import Optional
+
+import pgn_utils
+from logging_config import setup_logging
+from repertoire_trie import CompactRepertoireTrie
+
+logger = setup_logging(__name__)
+
+# Directory for compiled tries; override with TRIE_CACHE_DIR (e.g. a volume mount in production).
+DEFAULT_CACHE_DIR = Path(os.getenv("TRIE_CACHE_DIR", Path(__file__).resolve().parent / ".trie_cache"))
+
+CACHE_SUFFIX = ".trie"
+
+
+def cache_path(study_id: str, pgn: str, cache_dir: Optional[Path] = None) -> Path:
+    """Returns the cache file for this version of the study."""
+    return (cache_dir or DEFAULT_CACHE_DIR) / f"{study_id}-{pgn_utils.pgn_content_hash(pgn)}{CACHE_SUFFIX}"
+
+
+def build_trie(pgn: str) -> CompactRepertoireTrie:
+    """Parses a study PGN and builds its trie from scratch."""
+    trie = CompactRepertoireTrie()
+    for chapter in pgn_utils.read_games(pgn):
+        trie.add_study_chapter(chapter)
+    return trie
+
+
+def save_trie(trie: CompactRepertoireTrie, path: Path) -> None:
+    """Writes a compiled trie atomically, so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(trie.to_bytes())
+    os.replace(tmp_path, path)
+
+
+def remove_other_versions(study_id: str, path: Path) -> None:
+    """
+    Deletes the study's cache files other than ``path``. Tries already mapped
+    from them keep working: an unlinked file lives on until it is unmapped.
+    """
+    for stale in path.parent.glob(f"{study_id}-*{CACHE_SUFFIX}"):
+        if stale == path or stale.stem.rpartition("-")[0] != study_id:
+            continue
+        try:
+            stale.unlink()
+            logger.info(f"[TrieCache] Removed stale cache file {stale.name}")
+        except OSError as e:
+            logger.warning(f"[TrieCache] Could not remove stale cache file {stale}: {e}")
+
+
+def load_trie(path: Path) -> CompactRepertoireTrie:
+    """Memory-maps a compiled trie; node data is read straight from the page cache."""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return CompactRepertoireTrie.from_buffer(mapped)
+
+
+def load_or_build(study_id: str, pgn: str, cache_dir: Optional[Path] = None) -> CompactRepertoireTrie:
+    """
+    Returns the trie for this version of the study, compiling and caching it
+    on the first call. A corrupt or unreadable cache file is rebuilt; failing
+    to write the cache never fails the analysis.
+    """
+    path = cache_path(study_id, pgn, cache_dir)
+    if path.exists():
+        try:
+            trie = load_trie(path)
+            logger.info(f"[TrieCache] Loaded {len(trie)} nodes for study {study_id} from {path.name}")
+            return trie
+        except (OSError, ValueError) as e:
+            logger.warning(f"[TrieCache] Ignoring unreadable cache file {path}: {e}")
+
+    trie = build_trie(pgn)
+    try:
+        save_trie(trie, path)
+        logger.info(f"[TrieCache] Compiled {len(trie)} nodes for study {study_id} to {path.name}")
+        remove_other_versions(study_id, path)
+    except OSError as e:
+        logger.warning(f"[TrieCache] Could not write cache file {path}: {e}")
+    return trie
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import lichess_api
+
+    parser = argparse.ArgumentParser(description="Precompile and inspect repertoire trie cache files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compile_parser = subparsers.add_parser("compile", help="Compile a study into the cache")
+    compile_parser.add_argument("study", help="Lichess study URL or study ID")
+    compile_parser.add_argument("--pgn-file", type=Path, help="Read the study PGN from a file instead of Lichess")
+    compile_parser.add_argument("--cache-dir", type=Path, default=None, help="Override the cache directory")
+
+    inspect_parser = subparsers.add_parser("inspect", help="Print a summary of a compiled trie file")
+    inspect_parser.add_argument("path", type=Path)
+
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        study_id = args.study
+        if "lichess.org/study/" in study_id:
+            study_id = lichess_api.extract_study_id_from_url(study_id)
+        pgn = args.pgn_file.read_text(encoding="utf-8") if args.pgn_file else lichess_api.fetch_study_pgn(study_id)
+        path = cache_path(study_id, pgn, args.cache_dir)
+        compiled = build_trie(pgn)
+        save_trie(compiled, path)
+        remove_other_versions(study_id, path)
+        print(f"Compiled {len(compiled)} nodes ({compiled.nbytes} bytes) to {path}")
+    else:
+        loaded = load_trie(args.path)
+        print(f"File:       {args.path} ({args.path.stat().st_size} bytes)")
+        print(f"Nodes:      {len(loaded)}")
+        print(f"Data bytes: {loaded.nbytes}")
+        print(f"Root moves: {', '.join(san or uci for uci, san in loaded.root_moves())}")
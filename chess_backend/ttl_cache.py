@@ -0,0 +1,134 @@
+"""
+A small thread-safe TTL + LRU cache.
+
+Entries expire ``ttl_seconds`` after they were stored and the least recently
+used entries are evicted once the cache holds more than ``max_entries`` items
+or more than ``max_bytes`` of estimated size (as reported by ``sizeof``).
+Hit, miss, eviction and expiry counters are kept so callers can log or
+export them.
+
+Expired entries are not dropped on lookup: ``get`` treats them as misses, but
+``peek`` still returns them so a caller can revalidate a stale value (e.g.
+with a conditional request) instead of rebuilding it. They are reclaimed by
+the normal LRU bounds or by being overwritten.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {**asdict(self), "hit_rate": self.hit_rate}
+
+
+class TTLCache(Generic[K, V]):
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[V], int] = lambda _: 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._clock = clock
+        # key -> (value, expires_at, size); ordered from least to most recently used
+        self._entries: "OrderedDict[K, Tuple[V, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > self._clock()
+
+    @property
+    def current_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: K) -> Optional[V]:
+        """Returns the cached value, or None if it is missing or has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            value, expires_at, _ = entry
+            if expires_at <= self._clock():
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def peek(self, key: K) -> Optional[V]:
+        """Returns the value even if it has expired, without touching stats or recency."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def set(self, key: K, value: V, ttl_seconds: Optional[float] = None) -> None:
+        """Stores a value, evicting least recently used entries to stay within bounds."""
+        size = self._sizeof(value)
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Larger than the whole cache: storing it would only flush everything else.
+                return
+            self._entries[key] = (value, self._clock() + ttl, size)
+            self._bytes += size
+            self._evict()
+
+    def invalidate(self, key: K) -> bool:
+        """Drops one entry. Returns True if it was present."""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: K) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self) -> None:
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats.evictions += 1
@@ -0,0 +1,111 @@
+"""
+Per-user analysis watermarks for incremental syncs.
+
+A watermark records the newest game analyzed for a user and the version of
+the user's studies it was analyzed against. perform_game_analysis uses it to
+fetch only games played since that game, and to skip games at or before it
+that come back again (Lichess's ``since`` is inclusive). When the studies
+change, the watermark no longer applies and the recent games are analyzed
+afresh.
+
+Watermarks are stored in the ``analysis_watermarks`` table. Every save is
+also written to a local JSON file, which is read whenever the database is
+unreachable, so a Supabase outage does not turn every sync into a full one.
+"""
+
+import dataclasses
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import supabase_client
+from logging_config import setup_logging
+
+logger = setup_logging(__name__)
+
+# Override with WATERMARK_DIR (e.g. a volume mount in production).
+WATERMARK_DIR = Path(os.getenv("WATERMARK_DIR", Path(__file__).resolve().parent / ".watermarks"))
+
+
+@dataclasses.dataclass
+class Watermark:
+    last_game_id: Optional[str] = None
+    last_game_at: Optional[datetime] = None
+    study_version: Optional[str] = None
+
+    def covers(self, game_id: Optional[str], played_at: Optional[datetime], study_version: Optional[str]) -> bool:
+        """Whether a game was already analyzed against ``study_version`` by the sync that set this watermark."""
+        if study_version is None or study_version != self.study_version:
+            return False
+        if game_id is not None and game_id == self.last_game_id:
+            return True
+        return played_at is not None and self.last_game_at is not None and played_at <= self.last_game_at
+
+    def to_row(self) -> Dict[str, Any]:
+        return {
+            "last_game_id": self.last_game_id,
+            "last_game_at": self.last_game_at.isoformat() if self.last_game_at else None,
+            "study_version": self.study_version,
+        }
+
+    @staticmethod
+    def from_row(row: Dict[str, Any]) -> "Watermark":
+        last_game_at = row.get("last_game_at")
+        return Watermark(
+            last_game_id=row.get("last_game_id"),
+            last_game_at=datetime.fromisoformat(last_game_at.replace("Z", "+00:00")) if last_game_at else None,
+            study_version=row.get("study_version"),
+        )
+
+
+def game_played_at(game_data: Dict[str, Any]) -> Optional[datetime]:
+    """The start time of a game from the export's ``createdAt`` (milliseconds since the epoch)."""
+    created_at = game_data.get("createdAt")
+    if not isinstance(created_at, (int, float)):
+        return None
+    return datetime.fromtimestamp(created_at / 1000, tz=timezone.utc)
+
+
+def load(user_id: str) -> Optional[Watermark]:
+    """Returns the user's watermark from the database, or from the local copy if the database fails."""
+    try:
+        row = supabase_client.get_analysis_watermark(user_id)
+    except Exception as e:
+        logger.warning(f"[Watermark] Database read failed for {user_id}, using local copy: {e}")
+        row = _load_local(user_id)
+    return Watermark.from_row(row) if row else None
+
+
+def save(user_id: str, watermark: Watermark) -> None:
+    """Stores the watermark locally and in the database; a database failure is logged, not raised."""
+    row = watermark.to_row()
+    _save_local(user_id, row)
+    try:
+        supabase_client.upsert_analysis_watermark(user_id, row)
+    except Exception as e:
+        logger.warning(f"[Watermark] Database write failed for {user_id}, kept local copy: {e}")
+
+
+def _local_path(user_id: str) -> Path:
+    return WATERMARK_DIR / f"{user_id}.json"
+
+
+def _load_local(user_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        row: Dict[str, Any] = json.loads(_local_path(user_id).read_text())
+        return row
+    except (OSError, ValueError):
+        return None
+
+
+def _save_local(user_id: str, row: Dict[str, Any]) -> None:
+    path = _local_path(user_id)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(row))
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"[Watermark] Could not write local copy for {user_id}: {e}")
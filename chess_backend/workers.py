@@ -0,0 +1,55 @@
+"""
+Bounded thread pool for the blocking analysis pipeline.
+
+perform_game_analysis makes blocking Lichess and Supabase calls and parses
+PGNs; running it on the event loop froze every other request until it
+finished. Request handlers hand it to this pool instead and await the
+result, so the loop stays free and at most ANALYSIS_MAX_WORKERS analyses run
+at once (later ones wait in the pool's queue).
+
+The pool is created on first use and shut down by the FastAPI lifespan in
+main.py.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+LOG = logging.getLogger(__name__)
+
+ANALYSIS_MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", "4"))
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def analysis_executor() -> ThreadPoolExecutor:
+    """Returns the shared analysis pool, creating it on first use."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ANALYSIS_MAX_WORKERS, thread_name_prefix="analysis")
+            LOG.info(f"Started analysis pool with {ANALYSIS_MAX_WORKERS} workers")
+        return _executor
+
+
+async def run_analysis(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs a blocking call on the analysis pool and awaits its result without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(analysis_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown(wait: bool = True) -> None:
+    """Stops the analysis pool, letting running analyses finish when ``wait`` is true."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+        LOG.info("Stopped analysis pool")
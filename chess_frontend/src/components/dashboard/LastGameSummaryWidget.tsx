@@ -2,16 +2,14 @@ import React from 'react';
 import { Link } from 'react-router-dom';
 import styles from './LastGameSummaryWidget.module.css';
 import { parsePgnHeaders } from '../../utils/pgn';
-import type { Database } from '../../types/supabase';
+import type { DeviationListItem } from '../../hooks/useDeviations';
 import { useAuth } from '../../hooks/useAuth';
 import { formatTimeControl } from '../../utils/time';
 import { deriveOutcome } from '../../utils/outcome';
 import OutcomeBadge from '../ui/OutcomeBadge';
 
-type Deviation = Database['public']['Tables']['opening_deviations']['Row'];
-
 interface LastGameSummaryWidgetProps {
-  lastDeviation: Deviation | null;
+  lastDeviation: DeviationListItem | null;
   isLoading: boolean;
 }
 
@@ -35,7 +33,7 @@ const LastGameSummaryWidget: React.FC<LastGameSummaryWidgetProps> = ({ lastDevia
   }
 
   const opening = lastDeviation.opening_name || 'Unknown Opening';
-  const headers = parsePgnHeaders(lastDeviation.pgn || '');
+  const headers = parsePgnHeaders(lastDeviation.pgn_headers || lastDeviation.pgn || '');
   const result = headers.Result || '?:?';
   const timeControl = headers.TimeControl || 'N/A';
   const whitePlayer = headers.White || '';
@@ -4,6 +4,9 @@ import type { Database } from '../types/supabase';
 
 type Deviation = Database['public']['Tables']['opening_deviations']['Row'];
 
+// List items come from the summary view: no pgn, only its header block in pgn_headers
+export type DeviationListItem = Deviation & { pgn_headers?: string | null };
+
 interface UseDeviationsOptions {
   limit?: number;
   offset?: number;
@@ -13,7 +16,7 @@ interface UseDeviationsOptions {
 }
 
 interface UseDeviationsResult {
-  deviations: Deviation[];
+  deviations: DeviationListItem[];
   loading: boolean;
   error: Error | null;
   hasMore: boolean;
@@ -32,14 +35,15 @@ const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || '';
  */
 export function useDeviations(options: UseDeviationsOptions = {}, refreshKey?: unknown): UseDeviationsResult {
   const { session } = useAuth();
-  const [deviations, setDeviations] = useState<Deviation[]>([]);
+  const [deviations, setDeviations] = useState<DeviationListItem[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<Error | null>(null);
   const [hasMore, setHasMore] = useState(true);
-  const [offset, setOffset] = useState(options.offset || 0);
+  // X-Next-Cursor from the last page fetched; null once there are no more pages
+  const [cursor, setCursor] = useState<string | null>(null);
 
   const fetchDeviations = useCallback(
-    async (currentOffset: number = 0, append: boolean = false) => {
+    async (pageCursor: string | null = null, append: boolean = false) => {
       if (!session?.user?.id) {
         setDeviations([]);
         setLoading(false);
@@ -53,8 +57,13 @@ export function useDeviations(options: UseDeviationsOptions = {}, refreshKey?: u
         // Build query params
         const params = new URLSearchParams({
           limit: String(options.limit || 10),
-          offset: String(currentOffset),
+          view: 'summary',
         });
+        if (pageCursor) {
+          params.append('cursor', pageCursor);
+        } else if (options.offset) {
+          params.append('offset', String(options.offset));
+        }
         // (Optional) Add filters here if supported by backend
         if (options.reviewStatus) {
           params.append('review_status', options.reviewStatus);
@@ -66,15 +75,16 @@ export function useDeviations(options: UseDeviationsOptions = {}, refreshKey?: u
           },
         });
         if (!res.ok) throw new Error(`Failed to fetch deviations: ${res.status}`);
-        const data: Deviation[] = await res.json();
+        const data: DeviationListItem[] = await res.json();
 
         if (append) {
           setDeviations(prev => [...prev, ...data]);
         } else {
           setDeviations(data);
         }
-        setHasMore(data.length === (options.limit || 10));
-        setOffset(currentOffset + data.length);
+        const nextCursor = res.headers?.get('X-Next-Cursor') ?? null;
+        setHasMore(nextCursor !== null);
+        setCursor(nextCursor);
       } catch (err) {
         console.error('Error fetching deviations:', err);
         setError(err instanceof Error ? err : new Error('Failed to fetch deviations'));
@@ -82,21 +92,24 @@ export function useDeviations(options: UseDeviationsOptions = {}, refreshKey?: u
         setLoading(false);
       }
     },
-    [session?.user?.id, session?.accessToken, options.limit, options.reviewStatus]
+    [session?.user?.id, session?.accessToken, options.limit, options.offset, options.reviewStatus]
   );
 
   // Initial fetch
   useEffect(() => {
     console.log('[useDeviations] useEffect triggered, refreshKey:', refreshKey);
-    fetchDeviations(0, false);
+    fetchDeviations(null, false);
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [session?.user?.id, session?.accessToken, options.limit, refreshKey]);
 
   // Load more function
-  const loadMore = useCallback(() => fetchDeviations(offset, true), [fetchDeviations, offset]);
+  const loadMore = useCallback(
+    () => (cursor ? fetchDeviations(cursor, true) : Promise.resolve()),
+    [fetchDeviations, cursor]
+  );
 
   // Refetch function
-  const refetch = useCallback(() => fetchDeviations(0, false), [fetchDeviations]);
+  const refetch = useCallback(() => fetchDeviations(null, false), [fetchDeviations]);
 
   return {
     deviations,
@@ -109,6 +122,7 @@ export function useDeviations(options: UseDeviationsOptions = {}, refreshKey?: u
 }
 
 export function useDeviationById(id: string | undefined) {
+  const { session } = useAuth();
   const [deviation, setDeviation] = useState<Deviation | null>(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<Error | null>(null);
@@ -118,7 +132,11 @@ export function useDeviationById(id: string | undefined) {
     setLoading(true);
     setError(null);
     try {
-      const res = await fetch(`${API_BASE_URL}/api/deviations/${id}`);
+      const res = await fetch(`${API_BASE_URL}/api/deviations/${id}`, {
+        headers: {
+          ...(session?.accessToken ? { Authorization: `Bearer ${session.accessToken}` } : {}),
+        },
+      });
       if (!res.ok) {
         if (res.status === 404) {
           setDeviation(null);
@@ -133,7 +151,7 @@ export function useDeviationById(id: string | undefined) {
     } finally {
       setLoading(false);
     }
-  }, [id]);
+  }, [id, session?.accessToken]);
 
   useEffect(() => {
     fetchDeviation();
@@ -29,7 +29,7 @@ const Dashboard: React.FC = () => {
       console.log('lastDeviation object:', lastDeviation);
 
       // Now, let's parse it right here and see the result.
-      const headers = parsePgnHeaders(lastDeviation.pgn || '');
+      const headers = parsePgnHeaders(lastDeviation.pgn_headers || lastDeviation.pgn || '');
       console.log('Parsed headers from its PGN:', headers);
       console.log('Value of Opening header:', headers.Opening);
     }
@@ -38,7 +38,7 @@ const Dashboard: React.FC = () => {
 
   // Transform deviations for the "Recent Games" list (this logic is already fixed)
   const recentGames: GameListItem[] = deviations.map(deviation => {
-    const headers = parsePgnHeaders(deviation.pgn || '');
+    const headers = parsePgnHeaders(deviation.pgn_headers || deviation.pgn || '');
     const whitePlayer = headers.White || 'White';
     const blackPlayer = headers.Black || 'Black';
     let userActualColor: 'white' | 'black' | null = null;
@@ -84,7 +84,7 @@ const Dashboard: React.FC = () => {
         <div className={styles.topRow}>
           {/* Pass the full list to the Prep Score and the single last one to the summary */}
           <PrepScoreWidget deviations={deviations} isLoading={deviationsLoading} />
-          <LastGameSummaryWidget lastDeviation={recentGames[0]?.deviation ?? null} isLoading={deviationsLoading} />
+          <LastGameSummaryWidget lastDeviation={lastDeviation} isLoading={deviationsLoading} />
         </div>
         <InsightsBlock />
         <section className={styles.recentGamesSection}>
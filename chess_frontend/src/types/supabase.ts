@@ -57,6 +57,7 @@ export type Database = {
           deviation_uci: string | null;
           expected_move: string;
           first_deviator: string | null;
+          game_date: string;
           game_id: string | null;
           id: string;
           move_number: number;
@@ -78,6 +79,7 @@ export type Database = {
           deviation_uci?: string | null;
           expected_move: string;
           first_deviator?: string | null;
+          game_date?: string;
           game_id?: string | null;
           id?: string;
           move_number: number;
@@ -99,6 +101,7 @@ export type Database = {
           deviation_uci?: string | null;
           expected_move?: string;
           first_deviator?: string | null;
+          game_date?: string;
           game_id?: string | null;
           id?: string;
           move_number?: number;
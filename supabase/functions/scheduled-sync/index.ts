@@ -7,7 +7,9 @@ const SUPABASE_URL = Deno.env.get("SUPABASE_URL") ?? "";
 const SERVICE_ROLE_KEY = Deno.env.get("SUPABASE_SERVICE_ROLE_KEY") ?? "";
 const JWT_SECRET = Deno.env.get("JWT_SECRET") ?? "";
 const BACKEND_URL = Deno.env.get("BACKEND_URL") ?? "http://host.docker.internal:8000";
-const ANALYZE_URL = `${BACKEND_URL}/api/analyze_games`;
+const BATCH_URL = `${BACKEND_URL}/api/analyze_batch`;
+// Most users /api/analyze_batch accepts per request (BATCH_MAX_USERS in chess_backend/main.py)
+const BATCH_MAX_USERS = 500;
 
 const supabase = createClient(SUPABASE_URL, SERVICE_ROLE_KEY);
 
@@ -28,7 +30,7 @@ async function _generateUserJWT({ sub, email, lichess_username }: { sub: string,
 }
 
 Deno.serve(async (req) => {
-  console.log("ANALYZE_URL being used:", ANALYZE_URL);
+  console.log("BATCH_URL being used:", BATCH_URL);
   if (req.method === "OPTIONS") {
     return new Response(null, { headers: corsHeaders });
   }
@@ -51,12 +53,14 @@ Deno.serve(async (req) => {
       return new Response(JSON.stringify({ message: "No users with auto sync enabled." }), { headers: corsHeaders });
     }
 
+    // 2. Collect the analysis payload of every user that is due for a sync
+    const due: { user_id: string, payload: Record<string, unknown> }[] = [];
     for (const user of users) {
       try {
         const lastSync = user.updated_at ? new Date(user.updated_at) : null;
         const freqMs = user.sync_frequency_minutes * 60 * 1000;
         if (!lastSync || now.getTime() - lastSync.getTime() >= freqMs) {
-          // Get user profile for JWT
+          // Get user profile for the Lichess username
           const { data: profile, error: profileErr } = await supabase
             .from("profiles")
             .select("email, lichess_username")
@@ -79,32 +83,16 @@ Deno.serve(async (req) => {
             throw new Error("No active studies found for user");
           }
 
-          // Call Python backend analyze_games endpoint with full payload
-          const res = await fetch(ANALYZE_URL, {
-            method: "POST",
-            headers: {
-              "Content-Type": "application/json"
-            },
-            body: JSON.stringify({
+          due.push({
+            user_id: user.user_id,
+            payload: {
               username: profile.lichess_username,
               study_url_white: whiteStudy,
               study_url_black: blackStudy,
               max_games: 10,
               scope: "recent"
-            })
+            }
           });
-          if (!res.ok) {
-            const errText = await res.text();
-            throw new Error(`analyze-games failed: ${errText}`);
-          }
-
-          // Update updated_at in sync_preferences
-          await supabase
-            .from("sync_preferences")
-            .update({ updated_at: now.toISOString() })
-            .eq("user_id", user.user_id);
-
-          syncedUsers.push(user.user_id);
         }
       } catch (err: unknown) {
         let errorMsg = "Unknown error";
@@ -117,6 +105,43 @@ Deno.serve(async (req) => {
       }
     }
 
+    // 3. Analyze due users in batch calls of at most BATCH_MAX_USERS; the backend shares study work
+    // within a batch. A failed batch only fails its own users.
+    for (let start = 0; start < due.length; start += BATCH_MAX_USERS) {
+      const chunk = due.slice(start, start + BATCH_MAX_USERS);
+      const res = await fetch(BATCH_URL, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json"
+        },
+        body: JSON.stringify({ users: chunk.map(d => d.payload) })
+      });
+      if (!res.ok) {
+        const errText = await res.text();
+        for (const d of chunk) {
+          errors.push({ user_id: d.user_id, error: `analyze-batch failed: ${errText}` });
+        }
+        continue;
+      }
+      const batch: { results: { username: string, ok: boolean, error?: string }[] } = await res.json();
+
+      // Results come back in request order
+      for (const [i, result] of batch.results.entries()) {
+        const userId = chunk[i].user_id;
+        if (!result.ok) {
+          errors.push({ user_id: userId, error: result.error ?? "Analysis failed" });
+          continue;
+        }
+        // Update updated_at in sync_preferences
+        await supabase
+          .from("sync_preferences")
+          .update({ updated_at: now.toISOString() })
+          .eq("user_id", userId);
+
+        syncedUsers.push(userId);
+      }
+    }
+
     return new Response(
       JSON.stringify({
         message: `Sync complete. ${syncedUsers.length} user(s) synced.`,
@@ -0,0 +1,21 @@
+-- Per-user analysis high-water mark for incremental syncs
+-- Migration: 20250701000000_add_analysis_watermarks.sql
+
+-- One row per user: the newest game the backend has analyzed, and the study
+-- version (content hash of the user's white and black studies) it was analyzed against
+CREATE TABLE IF NOT EXISTS public.analysis_watermarks (
+    user_id UUID REFERENCES public.profiles(id) ON DELETE CASCADE PRIMARY KEY,
+    last_game_id TEXT,
+    last_game_at TIMESTAMP WITH TIME ZONE,
+    study_version TEXT,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+COMMENT ON TABLE public.analysis_watermarks IS
+    'Newest analyzed game per user; the backend fetches only games played since last_game_at while study_version is unchanged';
+
+-- Only the backend (service role) writes watermarks; users may read their own
+ALTER TABLE public.analysis_watermarks ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own analysis watermark" ON public.analysis_watermarks
+    FOR SELECT USING (auth.uid() = user_id);
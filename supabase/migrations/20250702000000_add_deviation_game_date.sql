@@ -0,0 +1,33 @@
+-- Add game_date so deviations can be ordered and paged in the database
+-- Migration: 20250702000000_add_deviation_game_date.sql
+
+-- When the game was played (UTCDate/UTCTime from the PGN headers); the backend sets it on insert
+ALTER TABLE public.opening_deviations
+ADD COLUMN IF NOT EXISTS game_date TIMESTAMP WITH TIME ZONE;
+
+-- Backfill existing rows from their PGN headers, falling back to when the deviation was detected
+UPDATE public.opening_deviations
+SET game_date = COALESCE(
+    to_timestamp(
+        substring(pgn from '\[UTCDate "(\d{4}\.\d{2}\.\d{2})"\]') || ' ' ||
+            COALESCE(substring(pgn from '\[UTCTime "(\d{2}:\d{2}:\d{2})"\]'), '00:00:00'),
+        'YYYY.MM.DD HH24:MI:SS'
+    )::timestamp AT TIME ZONE 'UTC',
+    detected_at,
+    NOW()
+)
+WHERE game_date IS NULL;
+
+ALTER TABLE public.opening_deviations
+ALTER COLUMN game_date SET DEFAULT NOW(),
+ALTER COLUMN game_date SET NOT NULL;
+
+COMMENT ON COLUMN public.opening_deviations.game_date IS
+    'When the game was played, from the PGN headers; /api/deviations orders and pages by (game_date, id)';
+
+-- Serves the dashboard listing: WHERE user_id = ? ORDER BY game_date DESC, id DESC with a keyset cursor
+CREATE INDEX IF NOT EXISTS idx_opening_deviations_user_game_date
+    ON public.opening_deviations(user_id, game_date DESC, id DESC);
+
+COMMENT ON INDEX public.idx_opening_deviations_user_game_date IS
+    'Index for keyset pagination of a user''s deviations by game date';
@@ -0,0 +1,16 @@
+-- Computed column for the lightweight deviation list
+-- Migration: 20250703000000_add_deviation_pgn_headers.sql
+
+-- The PGN header block (everything before the first blank line). PostgREST exposes
+-- functions over a table's row type as computed columns, so the backend can
+-- select pgn_headers instead of the whole pgn for list views.
+CREATE OR REPLACE FUNCTION public.pgn_headers(public.opening_deviations)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT split_part($1.pgn, E'\n\n', 1)
+$$;
+
+COMMENT ON FUNCTION public.pgn_headers(public.opening_deviations) IS
+    'PGN tag pairs of a deviation''s game, without the movetext; used by the /api/deviations summary view';